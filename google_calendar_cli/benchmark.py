@@ -0,0 +1,302 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import httplib2
+from typer.testing import CliRunner
+
+import cli
+from fake_server import FakeCalendarServer, generate_events
+from model.calendar import Calendar
+from model.event import Event, parse_datetime
+from model.event_batch import EventBatch
+from model.recurring_event import RecurrenceRule, RecurringEvent
+from scheduler import RequestScheduler
+from write_queue import new_event_id
+
+# Times the Calendar methods, the write queue and every cli.py command against a FakeCalendarServer holding
+# 10, 1k and 100k events, and compares the results with a saved baseline:
+#
+#   python3 benchmark.py --output baseline.json
+#   python3 benchmark.py --baseline baseline.json   # exits 1 when something got slower
+
+SCALES = (10, 1000, 100000)
+# Relative slowdown of the median tolerated before a result counts as a regression,
+# and the absolute slowdown in seconds below which differences are noise
+TOLERANCE = 0.25
+NOISE_FLOOR = 0.002
+
+
+class DiscoveryFetchingCalendar(Calendar):
+    """A Calendar that downloads its discovery document on every start, as without a bundled or cached copy."""
+
+    def __init__(self, discovery_url, **kwargs):
+        super().__init__(**kwargs)
+        self.discovery_url = discovery_url
+
+    def _discovery_document(self):
+        _, content = httplib2.Http().request(self.discovery_url)
+        return json.loads(content)
+
+
+def allocated(build):
+    """Bytes held by what `build` returns, measured with tracemalloc; the parse cache is not counted."""
+    parse_datetime.cache_clear()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    parse_datetime.cache_clear()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+def percentile(samples, share):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+class Benchmark:
+    """Runs operations against one fake server and collects their latencies."""
+
+    def __init__(self, scale, repeat, latency):
+        self.scale = scale
+        self.repeat = repeat
+        self.server = FakeCalendarServer(latency=latency).start()
+        self.server.add_events(generate_events(scale))
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        self.now = now
+        self.master_id = self.server.add_events([RecurringEvent(
+            "Standup", now, now + timedelta(minutes=15), RecurrenceRule.from_rrule("FREQ=DAILY;COUNT=200")
+        ).to_json()])[0]
+        self.calendar = Calendar(api_root=self.server.api_root, instrumentation=cli._instrumentation)
+        # The quotas of the real API would make the benchmark measure the rate limiter
+        self.calendar.scheduler = RequestScheduler(user_rate=1e6, project_rate=1e6,
+                                                   instrumentation=self.calendar.instrumentation)
+        cli._calendar = self.calendar
+        cli._event_store = None
+        cli._write_queue = None
+        self.runner = CliRunner()
+        self.results = {}
+
+    def close(self):
+        self.server.stop()
+
+    def time(self, name, operation, items=None):
+        """Run operation(iteration) `repeat` times; `items` is the number of events it handles per run."""
+        samples = []
+        for iteration in range(self.repeat):
+            start = time.perf_counter()
+            operation(iteration)
+            samples.append(time.perf_counter() - start)
+        total = sum(samples)
+        result = {'p50': percentile(samples, 0.5), 'p99': percentile(samples, 0.99),
+                  'ops_per_second': len(samples) / total if total else None}
+        if items:
+            result['events_per_second'] = items * len(samples) / total if total else None
+        self.results[name] = result
+        logging.warning(f"{self.scale:>7} {name:<40}{result['p50'] * 1000:>10.1f}{result['p99'] * 1000:>10.1f}")
+
+    def invoke(self, *args):
+        result = self.runner.invoke(cli.app, list(args))
+        if result.exit_code:
+            raise RuntimeError(f"cli.py {' '.join(args)} failed: {result.output or result.exception}")
+
+    def event_id(self, iteration):
+        return f"ev{(iteration * 7) % self.scale:07d}"
+
+    def new_events(self, count):
+        return [Event(f"New {index}", self.now, self.now + timedelta(hours=1)) for index in range(count)]
+
+    def measure_memory(self):
+        """
+        Bytes allocated per event, with every event of the scale held in memory at once,
+        both as a list of decoded Events and as an EventBatch.
+        """
+        resources = generate_events(self.scale)
+        for name, build in (('Event memory', lambda: [Event.from_json(resource) for resource in resources]),
+                            ('EventBatch memory', lambda: EventBatch.from_json(resources))):
+            bytes_per_event = allocated(build) / len(resources)
+            self.results[name] = {'bytes_per_event': bytes_per_event}
+            logging.warning(f"{self.scale:>7} {name + ' (bytes per event)':<40}{bytes_per_event:>10.0f}")
+
+    def run_startup(self):
+        # A command's first request on a fresh Calendar: authentication, building the service, the request
+        api_root, discovery_url = self.server.api_root, self.server.discovery_url
+        self.time('cold list-events (bundled document)',
+                  lambda i: list(Calendar(api_root=api_root).get_event_list('d')))
+        self.time('cold list-events (discovery fetch)',
+                  lambda i: list(DiscoveryFetchingCalendar(discovery_url, api_root=api_root).get_event_list('d')))
+
+    def run_calendar(self):
+        calendar = self.calendar
+        self.time('Calendar.get_event_list', lambda i: sum(1 for _ in calendar.get_event_list('m', 2500)),
+                  self.scale)
+        self.time('Calendar.get_merged_event_list', lambda i: list(calendar.get_merged_event_list('m', ['primary'])),
+                  self.scale)
+        self.time('Calendar.sync_events', lambda i: calendar.sync_events(), self.scale)
+        self.time('Calendar.search_events', lambda i: list(calendar.search_events(f"Event {self.event_id(i)[-3:]}")))
+        self.time('Calendar.fetch_event_by_id', lambda i: calendar.fetch_event_by_id(self.event_id(i)))
+        self.time('Calendar.get_recurring_instances', lambda i: calendar.get_recurring_instances(self.master_id))
+        self.time('Calendar.query_freebusy',
+                  lambda i: calendar.query_freebusy(['primary'], self.now, self.now + timedelta(days=7)))
+        self.time('Calendar.find_free_slots',
+                  lambda i: calendar.find_free_slots([], (self.now, self.now + timedelta(days=7)),
+                                                     timedelta(minutes=30), 5))
+        self.time('Calendar.quick_add', lambda i: calendar.quick_add("Lunch tomorrow"))
+        self.time('Calendar.add_attendees_to_event',
+                  lambda i: calendar.add_attendees_to_event(calendar.fetch_event_by_id(self.event_id(i)),
+                                                            ["new@example.com"]))
+        self.time('Calendar.remove_attendees_from_event',
+                  lambda i: calendar.remove_attendees_from_event(calendar.fetch_event_by_id(self.event_id(i)),
+                                                                 ["new@example.com"]))
+
+        # Commands write through the write-ahead queue, which sends its writes with Calendar.apply_writes
+        queue = cli.get_write_queue()
+
+        def write(*writes):
+            queue.enqueue_many(writes)
+            queue.flush(calendar)
+
+        def inserts(count):
+            return [('insert', new_event_id(), event.to_json(), None, 'primary') for event in self.new_events(count)]
+
+        def update(iteration):
+            event = calendar.fetch_event_by_id(self.event_id(iteration))
+            event.title = f"Updated {iteration}"
+            return 'update', event.event_id, event.to_json(), event.etag, 'primary'
+
+        def patch(iteration):
+            event = calendar.fetch_event_by_id(self.event_id(iteration))
+            event.track_changes()
+            event.location = f"Room {iteration}"
+            write(('patch', event.event_id, event.to_patch_json(), event.etag, 'primary'))
+
+        self.time('WriteQueue insert', lambda i: write(*inserts(1)))
+        self.time('WriteQueue update', lambda i: write(update(i)))
+        self.time('WriteQueue patch', patch)
+        self.time('WriteQueue 100 inserts', lambda i: write(*inserts(100)), 100)
+        self.time('WriteQueue 10 updates', lambda i: write(*(update(i * 10 + index) for index in range(10))), 10)
+        self.time('WriteQueue delete', lambda i: write(('delete', self.add_disposable(), None, None, 'primary')))
+        self.time('WriteQueue 10 deletes',
+                  lambda i: write(*(('delete', self.add_disposable(), None, None, 'primary') for _ in range(10))), 10)
+
+    def add_disposable(self):
+        return self.server.add_events([self.new_events(1)[0].to_json()])[0]
+
+    def run_cli(self, directory):
+        start, end = f"{self.now:%Y-%m-%d %H:%M:%S}", f"{self.now + timedelta(hours=1):%Y-%m-%d %H:%M:%S}"
+        jsonl_path = os.path.join(directory, 'events.jsonl')
+        with open(jsonl_path, 'w') as jsonl_file:
+            for resource in generate_events(100, seed=1):
+                del resource['id']
+                jsonl_file.write(json.dumps(resource) + '\n')
+        update_path = os.path.join(directory, 'updates.jsonl')
+        with open(update_path, 'w') as update_file:
+            for resource in generate_events(min(self.scale, 100)):
+                update_file.write(json.dumps(dict(resource, summary="Bulk updated")) + '\n')
+        ics_path = os.path.join(directory, 'events.ics')
+        self.invoke('export', 'm', '--format', 'ics', '-o', ics_path)
+
+        self.time('cli list-events --no-cache', lambda i: self.invoke('list-events', 'm', '--no-cache',
+                                                                      '--page-size', '2500'), self.scale)
+        self.time('cli list-events', lambda i: self.invoke('list-events', 'm'), self.scale)
+        self.time('cli search', lambda i: self.invoke('search', f"Event {self.event_id(i)[-3:]}"))
+        self.time('cli search --no-cache',
+                  lambda i: self.invoke('search', f"Event {self.event_id(i)[-3:]}", '--no-cache'))
+        self.time('cli view-event', lambda i: self.invoke('view-event', self.event_id(i), '--no-cache'))
+        self.time('cli add-event', lambda i: self.invoke('add-event', "Benchmark", start, end))
+        self.time('cli quick-add-event', lambda i: self.invoke('quick-add-event', "Lunch tomorrow"))
+        self.time('cli update-event', lambda i: self.invoke('update-event', self.event_id(i), '--title', f"T{i}"))
+        self.time('cli add-attendees', lambda i: self.invoke('add-attendees', self.event_id(i), 'a@example.com'))
+        self.time('cli remove-attendees',
+                  lambda i: self.invoke('remove-attendees', self.event_id(i), 'a@example.com'))
+        self.time('cli add-attendees --period',
+                  lambda i: self.invoke('add-attendees', f"p{i}@example.com", '--period', 'next 3 days'))
+        self.time('cli remove-attendees --period',
+                  lambda i: self.invoke('remove-attendees', f"p{i}@example.com", '--period', 'next 3 days'))
+        self.time('cli get-recurring-instances',
+                  lambda i: self.invoke('get-recurring-instances', self.master_id, '--no-cache'))
+        self.time('cli add-recurring-event',
+                  lambda i: self.invoke('add-recurring-event', "Weekly", start, end, 'WEEKLY', '--count', '10'))
+        self.time('cli delete-event', lambda i: self.invoke('delete-event', self.add_disposable()))
+        self.time('cli freebusy', lambda i: self.invoke('freebusy', start, f"{self.now + timedelta(days=7):%Y-%m-%d}"))
+        self.time('cli bulk-add', lambda i: self.invoke('bulk-add', jsonl_path), 100)
+        self.time('cli bulk-update', lambda i: self.invoke('bulk-update', update_path), min(self.scale, 100))
+        self.time('cli bulk-delete', lambda i: self.invoke('bulk-delete', *[self.add_disposable() for _ in range(10)]),
+                  10)
+        self.time('cli import', lambda i: self.invoke('import', ics_path), self.scale)
+        self.time('cli export', lambda i: self.invoke('export', 'm', '--format', 'jsonl', '-o',
+                                                      os.path.join(directory, 'export.jsonl')), self.scale)
+
+
+def run(scales, repeat, latency):
+    results = {}
+    cwd = os.getcwd()
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as directory:
+            # The event and response caches are created in the working directory
+            os.chdir(directory)
+            benchmark = Benchmark(scale, repeat, latency)
+            try:
+                benchmark.measure_memory()
+                benchmark.run_startup()
+                benchmark.run_calendar()
+                benchmark.run_cli(directory)
+            finally:
+                benchmark.close()
+                os.chdir(cwd)
+        results[str(scale)] = benchmark.results
+    return results
+
+
+def regressions(results, baseline, tolerance=TOLERANCE):
+    """Describe every operation whose median got slower, or memory use grew, more than the baseline allows."""
+    found = []
+    for scale, operations in results.items():
+        for name, result in operations.items():
+            previous = baseline.get(scale, {}).get(name)
+            if not previous:
+                continue
+            if 'bytes_per_event' in result:
+                if result['bytes_per_event'] > previous['bytes_per_event'] * (1 + tolerance):
+                    found.append(f"{name} at {scale} events: {previous['bytes_per_event']:.0f} -> "
+                                 f"{result['bytes_per_event']:.0f} bytes per event")
+                continue
+            slowdown = result['p50'] - previous['p50']
+            if slowdown > NOISE_FLOOR and result['p50'] > previous['p50'] * (1 + tolerance):
+                found.append(f"{name} at {scale} events: median {previous['p50'] * 1000:.1f} ms -> "
+                             f"{result['p50'] * 1000:.1f} ms")
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the CLI against a local stand-in Calendar API.")
+    parser.add_argument('--scales', default=",".join(map(str, SCALES)), help="Comma-separated event counts.")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs of every operation per scale.")
+    parser.add_argument('--latency', type=float, default=0, help="Seconds the server adds to every request.")
+    parser.add_argument('--output', help="Write the results as JSON here.")
+    parser.add_argument('--baseline', help="Fail when slower than the results in this JSON file.")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="Relative slowdown tolerated.")
+    arguments = parser.parse_args()
+
+    # Keep the commands' own output out of the timings and the report
+    logging.disable(logging.INFO)
+    logging.warning(f"{'events':>7} {'operation':<40}{'p50 ms':>10}{'p99 ms':>10}")
+    results = run([int(scale) for scale in arguments.scales.split(',')], arguments.repeat, arguments.latency)
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            found = regressions(results, json.load(baseline_file), arguments.tolerance)
+        for regression in found:
+            logging.error(f"Regression: {regression}")
+        sys.exit(1 if found else 0)
@@ -1,24 +1,218 @@
-from datetime import datetime
+import sys
+
+if __name__ == '__main__':
+    # Hand the command to a running daemon before paying for the imports below;
+    # it sends the long-running commands back to run in this process
+    from daemon import forward
+    exit_code = forward(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+import heapq
+import json
+import signal
+import time
+from datetime import datetime, timedelta
 from typing import Optional, List
+import pytz
 import typer
 import logging
-from config import SCOPES
-from model.calendar import Calendar
-from model.event import Event
+from config import SCOPES, EVENT_CACHE_MAX_AGE, DEFAULT_PAGE_SIZE, DAEMON_SOCKET, IMPORT_CHUNK_SIZE, \
+    WATCH_HOST, WATCH_PORT, WATCH_CHANNEL_TTL
+from daemon import serve, client_path
+from event_io import FORMATS, EventFileError, read_events, write_events, derived_uid
+from instrumentation import Instrumentation
+from model.event import Event, parse_datetime
 from model.recurring_event import RecurrenceRule, RecurringEvent
+from utility import period_window, event_sort_key, change_attendees
 
 app = typer.Typer()
 logging.basicConfig(level=logging.INFO, format='%(message)s')
-PERIODS = ['d', 'w', 'm']
 FREQUENCIES = ["DAILY", "WEEKLY", "MONTHLY", "YEARLY"]
 DAYS_OF_WEEK = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
 MONTHS = list(range(1, 13))
 HOURS = list(range(0, 24))
 DAYS_OF_YEAR = list(range(1, 367))
 
+_calendar = None
+_instrumentation = Instrumentation()
+
+
+def get_calendar():
+    """
+    Return the process-wide Calendar, so credentials and the API service are set up only once.
+
+    The Google API client libraries take most of the start-up time, so they are only
+    imported here, by commands that talk to the API; --help and argument errors skip them.
+    """
+    global _calendar
+    if _calendar is None:
+        from model.calendar import Calendar
+        _calendar = Calendar(SCOPES, _instrumentation)
+    return _calendar
+
+
+_event_store = None
+
+
+def get_event_store(max_age=EVENT_CACHE_MAX_AGE):
+    """Return the process-wide local event cache, backed by the shared Calendar."""
+    global _event_store
+    if _event_store is None:
+        from event_store import EventStore
+        _event_store = EventStore(get_calendar())
+    _event_store.max_age = max_age
+    return _event_store
+
+
+def invalidate_event_cache():
+    """Make the next cached read sync, so the effect of a write is visible immediately."""
+    get_event_store().invalidate()
+
+
+_write_queue = None
+
+
+def get_write_queue():
+    """Return the process-wide write-ahead queue of event changes."""
+    global _write_queue
+    if _write_queue is None:
+        from write_queue import WriteQueue
+        _write_queue = WriteQueue()
+    return _write_queue
+
+
+def submit_writes(writes, interactive=True):
+    """
+    Queue (operation, event_id, body, etag, calendar_id) writes, then send the queue right away.
+
+    Sending is skipped while the API was unreachable moments ago, so during an outage a
+    write costs no more than appending it to the queue. Interactive commands do not retry
+    failed requests; what could not be sent waits for the flush command.
+
+    Returns (event_id, response, error) of each of `writes` that was sent, in their order.
+    """
+    queue = get_write_queue()
+    seqs = queue.enqueue_many(writes)
+    if queue.offline():
+        results = {}
+    elif interactive:
+        results = queue.flush(get_calendar(), retries=0, max_retries=0)
+    else:
+        results = queue.flush(get_calendar())
+    if results:
+        invalidate_event_cache()
+    remaining = queue.pending()
+    if remaining:
+        logging.info(f"{remaining} writes are queued until the Calendar API can be reached; "
+                     f"'python3 cli.py flush' sends them.")
+    return [(write[1], *results[seq]) for write, seq in zip(writes, seqs) if seq in results]
+
+
+def report_write(results, action):
+    for _, response, error in results:
+        if error is None:
+            logging.info(f"Event {action}: {(response or {}).get('htmlLink')}")
+
+
+@app.callback()
+def main(ctx: typer.Context,
+         profile: bool = typer.Option(False, help="Print where the time went when the command ends."),
+         metrics_file: Optional[str] = typer.Option(None, help="Write Prometheus metrics of the API calls here."),
+         trace: bool = typer.Option(False, help="Report API calls as OpenTelemetry spans."),
+         debug: bool = typer.Option(False, help="Log API payloads and other debugging output.")):
+    """
+    Manage Google Calendar events from the command line.
+
+    The options apply to any command and go before its name, e.g.
+
+        python3 cli.py --profile list-events d
+    """
+    logging.getLogger().setLevel(logging.DEBUG if debug else logging.INFO)
+    if trace and not _instrumentation.enable_opentelemetry():
+        logging.error("Tracing needs the opentelemetry-api package.")
+    if profile:
+        _instrumentation.reset()
+        ctx.call_on_close(lambda: logging.info(f"\n{_instrumentation.breakdown(calendar_stats())}"))
+    if metrics_file:
+        metrics_path = client_path(metrics_file)
+        ctx.call_on_close(lambda: write_metrics(metrics_path))
+
+
+def calendar_stats():
+    """Counters of the process-wide Calendar (see Calendar.get_stats), or None if the command used none."""
+    return _calendar.get_stats() if _calendar else None
+
+
+def write_metrics(path):
+    with open(path, 'w') as metrics:
+        metrics.write(_instrumentation.to_prometheus(calendar_stats()))
+
+
+def resolve_window(period, start, end, time_zone=None):
+    """
+    Resolve the window of list-events, search and export to aware (start, end) datetimes.
+
+    The window is either a period expression (see utility.period_window) or the
+    --from/--to values. Both are taken in `time_zone`, by default the time zone of
+    the calendar's settings, unless a value carries its own offset. A --to date
+    without a time includes that whole day; --from defaults to today and --to to
+    one day after --from.
+    """
+    if period and (start or end):
+        raise typer.BadParameter("Give either a period or --from/--to, not both.")
+    if not (period or start or end):
+        raise typer.BadParameter("Give a period, e.g. 'w' or 'next 3 days', or --from/--to.")
+    if time_zone:
+        try:
+            pytz.timezone(time_zone)
+        except pytz.UnknownTimeZoneError:
+            raise typer.BadParameter(f"Unknown time zone '{time_zone}'.")
+    if period:
+        # Validated before the calendar's time zone is fetched, so a typo fails without an API call
+        try:
+            window = period_window(period, time_zone or 'UTC')
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+        return window if time_zone else period_window(period, get_calendar().time_zone)
+
+    def parse(value, days=0):
+        try:
+            return parse_datetime(value) + timedelta(days=days)
+        except ValueError:
+            raise typer.BadParameter(f"'{value}' is not a date or a date and time, e.g. 2024-06-10T09:00.")
+
+    window_start = parse(start) if start else None
+    # A date alone includes that whole day
+    window_end = parse(end, days=1 if len(end) == 10 else 0) if end else None
+    if not time_zone and (window_start is None or window_start.tzinfo is None or
+                          window_end is not None and window_end.tzinfo is None):
+        time_zone = get_calendar().time_zone
+    if window_start is None:
+        window_start = period_window('today', time_zone)[0]
+    elif window_start.tzinfo is None:
+        window_start = pytz.timezone(time_zone).localize(window_start)
+    if window_end is None:
+        window_end = window_start + timedelta(days=1)
+    elif window_end.tzinfo is None:
+        window_end = pytz.timezone(time_zone).localize(window_end)
+    if window_end <= window_start:
+        raise typer.BadParameter("--to must be after --from.")
+    return window_start, window_end
+
 
 @app.command()
-def list_events(period: str = typer.Argument(show_choices=True, metavar=",".join(PERIODS))):
+def list_events(period: Optional[str] = typer.Argument(None, metavar="PERIOD"),
+                start: Optional[str] = typer.Option(None, "--from", help="Start of the window, e.g. 2024-06-10."),
+                end: Optional[str] = typer.Option(None, "--to", help="End of the window; a date includes that day."),
+                time_zone: Optional[str] = typer.Option(None, help="IANA time zone; the calendar's by default."),
+                cache: bool = typer.Option(True, help="Serve events from the local cache."),
+                max_age: int = typer.Option(EVENT_CACHE_MAX_AGE, help="Seconds before the cache is synced again."),
+                page_size: int = typer.Option(DEFAULT_PAGE_SIZE, min=1, max=2500,
+                                              help="Events requested per page when not using the cache."),
+                calendars: Optional[List[str]] = typer.Option(None, "--calendar", "-c",
+                                                              help="Calendar id to include; may be repeated."),
+                all_calendars: bool = typer.Option(False, help="Include every calendar in your calendar list.")):
     """
     List events from Google Calendar.
 
@@ -29,9 +223,24 @@ def list_events(period: str = typer.Argument(show_choices=True, metavar=",".join
     - 'w' for this week
     - 'm' for this month
 
+    or a relative expression such as 'tomorrow', 'next week', 'last month', 'next 3 days',
+    'past 2 weeks', 'Q3' or 'Q3 2024', or an ISO year, month or date ('2024', '2024-06',
+    '2024-06-10'), or explicitly with --from and --to. Days, weeks and months run from
+    midnight to midnight in the time zone of your calendar settings.
+
     Args:
-        period (str): A string representing the time period for which to list events.
-                      Valid choices are 'd', 'w', 'm'.
+        period (Optional[str]): A period expression for which to list events.
+        start (Optional[str]): Start of the window, a date or date and time, instead of a period.
+        end (Optional[str]): End of the window; a date without a time includes that whole day.
+        time_zone (Optional[str]): IANA time zone of the window, instead of the calendar's.
+        cache (bool): Serve events from the local cache, kept current through incremental sync.
+        max_age (int): Seconds the cache may go without syncing before it is brought up to date.
+        page_size (int): Number of events fetched per API page; events are printed as each page arrives.
+        calendars (Optional[List[str]]): Calendar ids to list; defaults to the primary calendar.
+        all_calendars (bool): List every calendar from your calendar list.
+
+    Events of several calendars are fetched concurrently and merged into one
+    start-time ordered list.
 
     Example:
         To list events for today:
@@ -42,18 +251,102 @@ def list_events(period: str = typer.Argument(show_choices=True, metavar=",".join
 
         To list events for this month:
         $ python3 cli.py list-events m
+
+        To list this week's events of two calendars:
+        $ python3 cli.py list-events w -c primary -c team@example.com
+
+        To list the next three days, or a range of dates in a given time zone:
+        $ python3 cli.py list-events "next 3 days"
+        $ python3 cli.py list-events --from 2024-06-10 --to 2024-06-14 --time-zone Europe/Berlin
     """
+    window = resolve_window(period, start, end, time_zone)
     logging.info('Getting events within the specified time range...\n')
-    calendar = Calendar(SCOPES)
-    events = calendar.get_event_list(period)
-    if not events:
+    calendar_ids = get_calendar().get_calendar_ids() if all_calendars else (calendars or ['primary'])
+    if cache:
+        events = get_event_store(max_age).get_event_list(window, calendar_ids)
+    elif len(calendar_ids) == 1:
+        events = get_calendar().get_event_list(window, page_size, calendar_ids[0])
+    else:
+        events = get_calendar().get_merged_event_list(window, calendar_ids, page_size)
+    found = False
+    for event in events:
+        found = True
+        logging.info(event)
+    if not found:
         logging.info("No events found.")
+
+
+@app.command()
+def search(text: Optional[str] = typer.Argument(None, metavar="[TEXT]"),
+           attendees: Optional[List[str]] = typer.Option(None, "--attendee", "-a",
+                                                         help="Email of an attendee; may be repeated."),
+           properties: Optional[List[str]] = typer.Option(None, "--property", "-p",
+                                                          help="Private extended property as key=value; "
+                                                               "may be repeated."),
+           period: Optional[str] = typer.Option(None, help="Only search this period, as for list-events."),
+           start: Optional[str] = typer.Option(None, "--from", help="Only search from this date or time."),
+           end: Optional[str] = typer.Option(None, "--to", help="Only search until this date or time."),
+           time_zone: Optional[str] = typer.Option(None, help="IANA time zone; the calendar's by default."),
+           cache: bool = typer.Option(True, help="Search the local cache instead of the API."),
+           max_age: int = typer.Option(EVENT_CACHE_MAX_AGE, help="Seconds before the cache is synced again."),
+           calendars: Optional[List[str]] = typer.Option(None, "--calendar", "-c",
+                                                         help="Calendar id to search; may be repeated.")):
+    """
+    Search events by text, attendee or private extended property.
+
+    Every word of TEXT must occur in the title, description, location or attendees of
+    an event, ignoring case; a word ending in '*' must start a word there. By default
+    the local cache is searched through its trigram index, which answers without an
+    API call while the cache is fresh. With --no-cache the text and properties are
+    sent to the API as its q and privateExtendedProperty filters.
+
+    Args:
+        text (Optional[str]): Words to look for.
+        attendees (Optional[List[str]]): Emails that must all be invited.
+        properties (Optional[List[str]]): key=value private extended properties that must all be set.
+        period (Optional[str]): A period expression limiting the search, as for list-events.
+        start (Optional[str]): Start of the searched window instead of a period.
+        end (Optional[str]): End of the searched window; a date includes that whole day.
+        time_zone (Optional[str]): IANA time zone of the window, instead of the calendar's.
+        cache (bool): Search the local cache, kept current through incremental sync.
+        max_age (int): Seconds the cache may go without syncing before it is brought up to date.
+        calendars (Optional[List[str]]): Calendar ids to search; defaults to the primary calendar.
+
+    Example:
+        To find the events about the budget that jane.smith@example.com is invited to:
+        $ python3 cli.py search budget -a jane.smith@example.com
+
+        To find this month's events whose title or description has a word starting with 'plan':
+        $ python3 cli.py search "plan*" --period m
+
+        To find events tagged with a private extended property:
+        $ python3 cli.py search -p project=apollo
+    """
+    attendees, properties = attendees or [], properties or []
+    if not (text or attendees or properties):
+        raise typer.BadParameter("Give TEXT, --attendee or --property to search for.")
+    for condition in properties:
+        if '=' not in condition:
+            raise typer.BadParameter(f"'{condition}' is not of the form key=value.")
+    window = resolve_window(period, start, end, time_zone) if period or start or end else None
+    calendar_ids = calendars or ['primary']
+    if cache:
+        events = get_event_store(max_age).search(text, attendees, properties, window, calendar_ids)
+    else:
+        calendar = get_calendar()
+        events = heapq.merge(*(calendar.search_events(text, attendees, properties, window, calendar_id=calendar_id)
+                               for calendar_id in calendar_ids), key=event_sort_key)
+    found = False
     for event in events:
+        found = True
         logging.info(event)
+    if not found:
+        logging.info("No events found.")
 
 
 @app.command()
-def view_event(event_id: str):
+def view_event(event_id: str, cache: bool = typer.Option(True, help="Serve the event from the local cache."),
+               max_age: int = typer.Option(EVENT_CACHE_MAX_AGE, help="Seconds before the cache is synced again.")):
     """
     View event details by ID.
 
@@ -64,6 +357,8 @@ def view_event(event_id: str):
 
     Args:
         event_id (str): The unique identifier of the event to view.
+        cache (bool): Look the event up in the local cache first.
+        max_age (int): Seconds the cache may go without syncing before it is brought up to date.
 
     Example:
         To view an event with ID '12345', run the following command:
@@ -81,8 +376,9 @@ def view_event(event_id: str):
         - If the event is found, logs the event details.
         - If the event is not found, logs "Event not found."
     """
-    calendar = Calendar(SCOPES)
-    event = calendar.fetch_event_by_id(event_id)
+    event = get_event_store(max_age).fetch_event_by_id(event_id) if cache else None
+    if event is None:
+        event = get_calendar().fetch_event_by_id(event_id)
     if event:
         logging.info(event)
     else:
@@ -91,7 +387,8 @@ def view_event(event_id: str):
 
 @app.command()
 def add_event(title: str, start_time: datetime, end_time: datetime, description: Optional[str] = None,
-              location: Optional[str] = None, attendees: Optional[List[str]] = None):
+              location: Optional[str] = None, attendees: Optional[List[str]] = None,
+              check_conflicts: bool = typer.Option(False, help="Refuse to add the event if anyone is busy.")):
     """
         Adds a new event to the Google Calendar.
 
@@ -105,6 +402,8 @@ def add_event(title: str, start_time: datetime, end_time: datetime, description:
             description (Optional[str], optional): A description of the event. Default is None.
             location (Optional[str], optional): The location where the event will take place. Default is None.
             attendees (Optional[List[str]], optional): A list of email addresses of the attendees. Default is None.
+            check_conflicts (bool, optional): Check free/busy of you and the attendees first, and do not add
+                the event if it would double-book anyone. Default is False.
 
         Example:
             python3 cli.py add-event "Team Meeting" "2024-06-10 10:00" "2024-06-10 11:00" \
@@ -117,14 +416,34 @@ def add_event(title: str, start_time: datetime, end_time: datetime, description:
             - Provide both date and time for start and end times to create an event with specific times.
             - Use date only for both start and end times to create a daylong event.
         """
-    calendar = Calendar(SCOPES)
     event = Event(title=title, start_time=start_time, end_time=end_time, description=description,
-                  location=location, attendees=attendees)
+                  location=location, daylong=dates_only(start_time, end_time), attendees=attendees)
     if not event.is_valid():
         logging.error("Start and end times should either both have dates only, or both have dates and times.")
         return
-    added_event = calendar.add_event(event)
-    logging.info('Event created: %s' % (added_event.get('htmlLink')))
+    add_to_calendar(event, check_conflicts)
+
+
+def dates_only(*times):
+    """
+    Whether the given command-line times were dates without a time of day, which make an all-day event.
+
+    Typer parses a date like 2024-06-10 as a naive datetime at midnight.
+    """
+    return all(value.tzinfo is None and value.time() == datetime.min.time() for value in times if value)
+
+
+def add_to_calendar(event, check_conflicts=False):
+    """Queue the insert of a new event under a client-chosen id, so sending it twice cannot duplicate it."""
+    from write_queue import new_event_id
+
+    if check_conflicts:
+        busy = get_calendar().find_conflicts(event)
+        if busy:
+            logging.error(f"Not adding the event, these calendars are busy at that time: {', '.join(busy)}")
+            return
+    event_id = new_event_id()
+    report_write(submit_writes([('insert', event_id, event.to_json(), None, 'primary')]), 'created')
 
 
 @app.command()
@@ -147,18 +466,24 @@ def quick_add_event(text: str):
         it prints the link to the created event in the Google Calendar.
 
         """
-    calendar = Calendar(SCOPES)
+    calendar = get_calendar()
     added_event = calendar.quick_add(text)
+    invalidate_event_cache()
     logging.info('Event created: %s' % (added_event.get('htmlLink')))
 
 
 @app.command()
 def update_event(event_id: str, title: Optional[str] = None, start_time: Optional[datetime] = None,
                  end_time: Optional[datetime] = None, description: Optional[str] = None,
-                 location: Optional[str] = None, attendees: Optional[List[str]] = None):
+                 location: Optional[str] = None, attendees: Optional[List[str]] = None,
+                 fetch: bool = typer.Option(True, help="Fetch the event first and guard the update with its ETag.")):
     """
     Update an existing event by ID.
 
+    Only the fields that change are sent, as a patch. By default the event is
+    fetched first, and the patch only applies if nobody else changed the event
+    in the meantime.
+
     Args:
         event_id (str): The unique identifier of the event to update.
         title (Optional[str]): The updated title of the event.
@@ -167,6 +492,8 @@ def update_event(event_id: str, title: Optional[str] = None, start_time: Optiona
         description (Optional[str]): The updated description of the event.
         location (Optional[str]): The updated location of the event.
         attendees (Optional[List[str]]): The updated list of attendees for the event.
+        fetch (bool): Fetch the event before updating it. With --no-fetch the given
+            values are sent straight away, saving a round trip.
 
     Notes:
         - Provide the event ID along with at least one of the optional arguments to update the event.
@@ -185,16 +512,29 @@ def update_event(event_id: str, title: Optional[str] = None, start_time: Optiona
         To update the start time and end time of the same event:
 
             python3 cli.py update-event 12345 --start_time "2024-06-10T10:00:00" --end_time "2024-06-10T11:00:00"
+
+        To change the location without fetching the event first:
+
+            python3 cli.py update-event 12345 --location "Room B" --no-fetch
     """
 
-    calendar = Calendar(SCOPES)
-    event = calendar.fetch_event_by_id(event_id)
+    calendar = get_calendar()
+    if fetch:
+        event = calendar.fetch_event_by_id(event_id)
+        if event is None:
+            logging.info("Event not found.")
+            return
+        event.track_changes()
+    else:
+        event = Event(title=None, start_time=None, end_time=None, event_id=event_id)
     if title:
         event.title = title
     if start_time:
         event.start_time = start_time
     if end_time:
         event.end_time = end_time
+    if start_time or end_time:
+        event.daylong = dates_only(start_time, end_time)
     if description:
         event.description = description
     if location:
@@ -202,29 +542,129 @@ def update_event(event_id: str, title: Optional[str] = None, start_time: Optiona
     if attendees:
         event.attendees = attendees
 
-    if not event.is_valid():
+    if (start_time or end_time) and not event.is_valid():
         logging.error("Start and end times should either both have dates only, or both have dates and times.")
         return
 
-    calendar = Calendar(SCOPES)
-    updated_event = calendar.update_event(event)
-    logging.info('Event created: %s' % (updated_event.get('htmlLink')))
+    body = event.to_patch_json()
+    if not body:
+        logging.info("Nothing to update.")
+        return
+    report_write(submit_writes([('patch', event_id, body, event.etag, 'primary')]), 'updated')
+
+
+SELECTION_HELP = {
+    'events': "Id of an event to change; may be repeated.",
+    'query': "Change the events matching this search, as for the search command.",
+    'having': "Only change events this attendee is invited to; may be repeated.",
+    'period': "Change the events of this period, as for list-events.",
+    'start': "Change the events from this date or time.",
+    'end': "Change the events until this date or time.",
+}
+
+
+def change_attendees_of_events(arguments, adding, *, events=None, query=None, having=None, period=None, start=None,
+                               end=None, time_zone=None, max_age=EVENT_CACHE_MAX_AGE, dry_run=False):
+    """
+    Add or remove a set of attendees on one event or on every event of a selection.
+
+    The selection is passed as keyword arguments, named after the command options.
+    Without selection options the first argument is the id of the event and the rest are
+    attendees, as before. Otherwise all arguments are attendees, and the events are the
+    --event ids together with the cached events matching --query, --with and the window;
+    when removing without --query or --with, only events inviting one of the attendees
+    are selected. The current attendees and ETags of the selected events are fetched in
+    batched requests, every event that changes gets one patch guarded by its ETag, and
+    the patches are sent through the write queue in batches.
+    """
+    events, having = events or [], having or []
+    selecting = bool(query or having or period or start or end)
+    if not (events or selecting):
+        if len(arguments) < 2:
+            raise typer.BadParameter("Give the event id and the attendees, or select events with the options.")
+        events, arguments = [arguments[0]], arguments[1:]
+    attendees = list(dict.fromkeys(arguments))
+    event_ids = list(dict.fromkeys(events))
+    if selecting:
+        window = resolve_window(period, start, end, time_zone) if period or start or end else None
+        store = get_event_store(max_age)
+        # Removing from a whole period only concerns the events that invite one of the attendees
+        filters = [having + [attendee] for attendee in attendees] if not adding and not (query or having) \
+            else [having]
+        seen = set(event_ids)
+        for required in filters:
+            for event in store.search(query, required, (), window):
+                if event.event_id not in seen:
+                    seen.add(event.event_id)
+                    event_ids.append(event.event_id)
+    if not event_ids:
+        logging.info("No events found.")
+        return
+
+    add, remove = (attendees, ()) if adding else ((), attendees)
+    writes, unchanged = [], 0
+    for event_id, (resource, error) in get_calendar().batch_get_events(
+            event_ids, ('id', 'etag', 'summary', 'attendees')).items():
+        if error is not None:
+            logging.error(f"{event_id}: could not be fetched: {error}")
+            continue
+        current = resource.get('attendees', [])
+        new_attendees = change_attendees(current, add, remove)
+        if new_attendees is None:
+            unchanged += 1
+            continue
+        if dry_run:
+            before = {attendee.get('email', '').lower() for attendee in current}
+            after = {attendee.get('email', '').lower() for attendee in new_attendees}
+            changes = [f"+{email}" for email in sorted(after - before)] + \
+                      [f"-{email}" for email in sorted(before - after)]
+            logging.info(f"{event_id} {resource.get('summary', '')}: {' '.join(changes)}")
+        writes.append(('patch', event_id, {'attendees': new_attendees}, resource.get('etag'), 'primary'))
+    if dry_run:
+        logging.info(f"Would update {len(writes)} events; {unchanged} already as requested.")
+        return
+    if not writes:
+        logging.info("Nothing to update.")
+        return
+    if len(event_ids) == 1:
+        report_write(submit_writes(writes), 'updated')
+        return
+    report_batch_results(submit_writes(writes, interactive=False), 'updated')
+    if unchanged:
+        logging.info(f"{unchanged} events were already as requested.")
 
 
 @app.command()
-def add_attendees(event_id: str, attendees: List[str]):
+def add_attendees(arguments: List[str] = typer.Argument(..., metavar="[EVENT_ID] ATTENDEES..."),
+                  events: Optional[List[str]] = typer.Option(None, "--event", "-e", help=SELECTION_HELP['events']),
+                  query: Optional[str] = typer.Option(None, "--query", "-q", help=SELECTION_HELP['query']),
+                  having: Optional[List[str]] = typer.Option(None, "--with", help=SELECTION_HELP['having']),
+                  period: Optional[str] = typer.Option(None, help=SELECTION_HELP['period']),
+                  start: Optional[str] = typer.Option(None, "--from", help=SELECTION_HELP['start']),
+                  end: Optional[str] = typer.Option(None, "--to", help=SELECTION_HELP['end']),
+                  time_zone: Optional[str] = typer.Option(None, help="IANA time zone; the calendar's by default."),
+                  max_age: int = typer.Option(EVENT_CACHE_MAX_AGE, help="Seconds before the cache is synced again."),
+                  dry_run: bool = typer.Option(False, help="Report the changes without making them.")):
     """
-        Add attendees to an existing event by ID.
+        Add attendees to an existing event by ID, or to every event of a selection.
 
         Args:
-            event_id (str): The unique identifier of the event to which attendees will be added.
-            attendees (List[str]): The list of email addresses of attendees to add to the event.
-
-        Notes: - Provide the event ID along with the list of attendees to add them to the event. - If the event ID is
-        not valid or the event is not found, no attendees will be added. - The provided email addresses in the
-        attendees list will be added to the existing list of attendees. - If any of the provided email addresses are
-        already attendees of the event, they will not be duplicated. - If the event ID is valid and attendees are
-        successfully added, the HTML link to the updated event will be printed.
+            arguments (List[str]): The event ID followed by the email addresses to add; only the email
+                addresses when events are selected with the options.
+            events (Optional[List[str]]): Ids of events to change.
+            query (Optional[str]): Change the events matching this search, as for the search command.
+            having (Optional[List[str]]): Only change events these attendees are all invited to.
+            period (Optional[str]): Change the events of this period, as for list-events.
+            start (Optional[str]): Start of the window of events to change instead of a period.
+            end (Optional[str]): End of the window; a date includes that whole day.
+            time_zone (Optional[str]): IANA time zone of the window, instead of the calendar's.
+            max_age (int): Seconds the cache may go without syncing before it is brought up to date.
+            dry_run (bool): Only report which attendees each event would gain.
+
+        Notes: - Events are selected from the local cache, then their current attendees are fetched in batches and
+        each changed event gets one patch, refused if someone else changed the event in the meantime. - Email
+        addresses that are already attendees of an event are not duplicated, and the existing attendees keep
+        their responses. - Instances of recurring events are changed one by one.
 
         Returns:
             None
@@ -233,27 +673,46 @@ def add_attendees(event_id: str, attendees: List[str]):
             To add attendees to an event with ID '12345', run the following command:
 
                 python3 cli.py add-attendees 12345 john.doe@example.com jane.smith@example.com
+
+            To invite a new team member to next month's events of the team:
+
+                python3 cli.py add-attendees new.hire@example.com --with lead@example.com --period "next month"
         """
-    calendar = Calendar(SCOPES)
-    event = calendar.fetch_event_by_id(event_id)
-    updated_event = calendar.add_attendees_to_event(event, attendees)
-    print('Event created: %s' % (updated_event.get('htmlLink')))
+    change_attendees_of_events(arguments, True, events=events, query=query, having=having, period=period,
+                               start=start, end=end, time_zone=time_zone, max_age=max_age, dry_run=dry_run)
 
 
 @app.command()
-def remove_attendees(event_id: str, attendees: List[str]):
+def remove_attendees(arguments: List[str] = typer.Argument(..., metavar="[EVENT_ID] ATTENDEES..."),
+                     events: Optional[List[str]] = typer.Option(None, "--event", "-e", help=SELECTION_HELP['events']),
+                     query: Optional[str] = typer.Option(None, "--query", "-q", help=SELECTION_HELP['query']),
+                     having: Optional[List[str]] = typer.Option(None, "--with", help=SELECTION_HELP['having']),
+                     period: Optional[str] = typer.Option(None, help=SELECTION_HELP['period']),
+                     start: Optional[str] = typer.Option(None, "--from", help=SELECTION_HELP['start']),
+                     end: Optional[str] = typer.Option(None, "--to", help=SELECTION_HELP['end']),
+                     time_zone: Optional[str] = typer.Option(None, help="IANA time zone; the calendar's by default."),
+                     max_age: int = typer.Option(EVENT_CACHE_MAX_AGE, help="Seconds before the cache is synced again."),
+                     dry_run: bool = typer.Option(False, help="Report the changes without making them.")):
     """
-        Remove attendees from an existing event by ID.
+        Remove attendees from an existing event by ID, or from every event of a selection.
 
         Args:
-            event_id (str): The unique identifier of the event from which attendees will be removed.
-            attendees (List[str]): The list of email addresses of attendees to remove from the event.
-
-        Notes: - Provide the event ID along with the list of attendees to remove them from the event. - If the event
-        ID is not valid or the event is not found, no attendees will be removed. - Only the provided email addresses
-        in the attendees list will be removed from the existing list of attendees. - If any of the provided email
-        addresses are not already attendees of the event, no action will be taken for them. - If the event ID is
-        valid and attendees are successfully removed, the HTML link to the updated event will be printed.
+            arguments (List[str]): The event ID followed by the email addresses to remove; only the email
+                addresses when events are selected with the options.
+            events (Optional[List[str]]): Ids of events to change.
+            query (Optional[str]): Change the events matching this search, as for the search command.
+            having (Optional[List[str]]): Only change events these attendees are all invited to.
+            period (Optional[str]): Change the events of this period, as for list-events.
+            start (Optional[str]): Start of the window of events to change instead of a period.
+            end (Optional[str]): End of the window; a date includes that whole day.
+            time_zone (Optional[str]): IANA time zone of the window, instead of the calendar's.
+            max_age (int): Seconds the cache may go without syncing before it is brought up to date.
+            dry_run (bool): Only report which attendees each event would lose.
+
+        Notes: - With only a period or window, the events inviting any of the given email addresses are selected. -
+        Their current attendees are fetched in batches and each changed event gets one patch, refused if someone
+        else changed the event in the meantime. - Email addresses that are not attendees of an event are ignored
+        for it. - Instances of recurring events are changed one by one.
 
         Returns:
             None
@@ -262,20 +721,27 @@ def remove_attendees(event_id: str, attendees: List[str]):
             To remove attendees from an event with ID '12345', run the following command:
 
                 python3 cli.py remove-attendees 12345 john.doe@example.com jane.smith@example.com
+
+            To see which of this quarter's events someone leaving the team would be removed from:
+
+                python3 cli.py remove-attendees john.doe@example.com --period Q3 --dry-run
         """
-    calendar = Calendar(SCOPES)
-    event = calendar.fetch_event_by_id(event_id)
-    updated_event = calendar.remove_attendees_from_event(event, attendees)
-    print('Event created: %s' % (updated_event.get('htmlLink')))
+    change_attendees_of_events(arguments, False, events=events, query=query, having=having, period=period,
+                               start=start, end=end, time_zone=time_zone, max_age=max_age, dry_run=dry_run)
 
 
 @app.command()
-def get_recurring_instances(event_id: str):
+def get_recurring_instances(event_id: str,
+                            cache: bool = typer.Option(True, help="Serve instances from the local cache."),
+                            max_age: int = typer.Option(EVENT_CACHE_MAX_AGE,
+                                                        help="Seconds before the cache is synced again.")):
     """
         Retrieve instances of a recurring event by its ID.
 
         Args:
             event_id (str): The unique identifier of the recurring event to retrieve instances for.
+            cache (bool): Serve the instances from the local cache.
+            max_age (int): Seconds the cache may go without syncing before it is brought up to date.
 
         Notes:
             - Provide the event ID to fetch instances of a recurring event.
@@ -291,8 +757,9 @@ def get_recurring_instances(event_id: str):
 
                 python3 cli.py get-recurring-instances 12345
         """
-    calendar = Calendar(SCOPES)
-    recurring_instances = calendar.get_recurring_instances(event_id)
+    recurring_instances = get_event_store(max_age).get_recurring_instances(event_id) if cache else None
+    if not recurring_instances:
+        recurring_instances = get_calendar().get_recurring_instances(event_id)
     for instance in recurring_instances:
         print(instance.title)
 
@@ -302,12 +769,15 @@ def add_recurring_event(title: str, start_time: datetime, end_time: datetime,
                         freq: str = typer.Argument(show_choices=True, metavar=",".join(FREQUENCIES)),
                         interval: Optional[int] = typer.Option(None),
                         count: Optional[int] = typer.Option(None), until: Optional[datetime] = typer.Option(None),
-                        by_day: Optional[List[str]] = typer.Option(None, show_choices=True, metavar=",".join(DAYS_OF_WEEK)),
+                        by_day: Optional[List[str]] = typer.Option(None, show_choices=True,
+                                                                   metavar=",".join(DAYS_OF_WEEK)),
                         by_month: Optional[List[int]] = typer.Option(None, show_choices=True, metavar="MONTHS"),
-                        by_year_day: Optional[List[int]] = typer.Option(None, show_choices=True, metavar="DAYS_OF_YEAR"),
+                        by_year_day: Optional[List[int]] = typer.Option(None, show_choices=True,
+                                                                        metavar="DAYS_OF_YEAR"),
                         by_hour: Optional[List[int]] = typer.Option(None, show_choices=True, metavar="HOURS"),
                         description: Optional[str] = None, location: Optional[str] = None,
-                        attendees: Optional[List[str]] = None):
+                        attendees: Optional[List[str]] = None,
+                        check_conflicts: bool = typer.Option(False, help="Refuse to add the event if anyone is busy.")):
     """
         Add a recurring event.
 
@@ -326,6 +796,7 @@ def add_recurring_event(title: str, start_time: datetime, end_time: datetime,
             description (Optional[str]): Description of the event.
             location (Optional[str]): Location of the event.
             attendees (Optional[List[str]]): List of attendees.
+            check_conflicts (bool): Do not add the event if its first occurrence double-books anyone.
 
         Example:
         To add a weekly meeting titled "Team Meeting" every Monday at 9:00 AM, starting from today for 10 occurrences:
@@ -351,21 +822,397 @@ def add_recurring_event(title: str, start_time: datetime, end_time: datetime,
         recurrence=recurrence,
         description=description,
         location=location,
+        daylong=dates_only(start_time, end_time),
         attendees=attendees
     )
     if not recurring_event.is_valid():
         logging.error("Start and end times should either both have dates only, or both have dates and times.")
         return
-    calendar = Calendar(SCOPES)
-    added_event = calendar.add_event(recurring_event)
-    logging.info('Event created: %s' % (added_event.get('htmlLink')))
+    add_to_calendar(recurring_event, check_conflicts)
 
 
 @app.command()
 def delete_event(event_id: str):
     """Deletes an event given its ID"""
-    calendar = Calendar(SCOPES)
-    calendar.delete_event(event_id)
+    results = submit_writes([('delete', event_id, None, None, 'primary')])
+    if not results:
+        return
+    from googleapiclient.errors import HttpError
+    _, _, error = results[0]
+    if error is None:
+        # An event that was already deleted answers 410 Gone, which counts as deleted
+        logging.info("Event deleted.")
+    elif isinstance(error, HttpError) and error.resp.status == 404:
+        logging.error("Event not found.")
+
+
+@app.command()
+def freebusy(start_time: datetime, end_time: datetime, attendees: Optional[List[str]] = None,
+             duration: int = typer.Option(30, min=1, help="Slot length in minutes."),
+             count: int = typer.Option(5, min=1, help="Number of free slots to show.")):
+    """
+        Find free slots shared by you and the given attendees.
+
+        Busy times of every attendee are fetched in a single free/busy query and
+        merged, then the first free slots of the requested length are listed.
+
+        Args:
+            start_time (datetime): Start of the window to search, in UTC.
+            end_time (datetime): End of the window to search, in UTC.
+            attendees (Optional[List[str]]): Email addresses of the other attendees.
+            duration (int): Length of each slot in minutes.
+            count (int): Number of slots to show.
+
+        Example:
+            python3 cli.py freebusy "2024-06-10T09:00:00" "2024-06-10T17:00:00" \
+           --attendees "john.doe@example.com" --attendees "jane.smith@example.com" --duration 60
+        """
+    slots = get_calendar().find_free_slots(attendees or [], (start_time, end_time), timedelta(minutes=duration),
+                                           count)
+    if slots is None:
+        return
+    if not slots:
+        logging.info("No free slots found.")
+    for start, end in slots:
+        logging.info(f"{start} - {end}")
+
+
+def read_event_file(path):
+    """
+    Read all the events of a bulk command's file (see event_io.read_events), or return None if it cannot be read.
+
+    Unreadable events are skipped with a warning naming their line. A file that cannot
+    be read to the end is rejected as a whole, so a bulk command never sends part of it.
+    """
+    try:
+        return list(read_events(client_path(path)))
+    except ValueError as e:
+        logging.error(e)
+        return None
+
+
+def report_batch_results(results, action):
+    failures = 0
+    for event_id, response, error in results:
+        if error is not None:
+            failures += 1
+            logging.error(f"{event_id}: failed: {error}")
+        else:
+            logging.info(f"{event_id}: {action} {response.get('htmlLink', '') if response else ''}".rstrip())
+    logging.info(f"{len(results) - failures} succeeded, {failures} failed.")
+
+
+@app.command()
+def bulk_add(file: str):
+    """
+        Add many events at once from a JSON or JSON Lines file.
+
+        The file holds Calendar API event resources, either as a JSON array in a
+        '.json' file or one object per line in a '.jsonl' file; the .ics and .csv
+        files of the import command work as well. Lines that hold no readable event
+        are skipped with a warning. Events are sent in batches of 50 per HTTP round
+        trip; failed items are reported individually, and those failing with a
+        rate-limit or server error are retried.
+
+        Args:
+            file (str): Path to the JSON or JSON Lines file.
+
+        Example:
+            python3 cli.py bulk-add events.jsonl
+        """
+    events = read_event_file(file)
+    if events is None:
+        return
+    from write_queue import new_event_id
+
+    results = submit_writes([('insert', event.event_id or new_event_id(), event.to_json(), None, 'primary')
+                             for event in events], interactive=False)
+    report_batch_results(results, 'created')
+
+
+@app.command()
+def bulk_update(file: str):
+    """
+        Update many events at once from a JSON or JSON Lines file.
+
+        Every event resource in the file must carry the 'id' of the event it replaces.
+        Updates are sent in batches of 50 per HTTP round trip.
+
+        Args:
+            file (str): Path to the JSON or JSON Lines file.
+
+        Example:
+            python3 cli.py bulk-update events.jsonl
+        """
+    events = read_event_file(file)
+    if events is None:
+        return
+    missing = [event.title for event in events if not event.event_id]
+    if missing:
+        logging.error(f"Every event needs an id; these have none: {', '.join(map(str, missing))}")
+        return
+    results = submit_writes([('update', event.event_id, event.to_json(), None, 'primary') for event in events],
+                            interactive=False)
+    report_batch_results(results, 'updated')
+
+
+@app.command()
+def bulk_delete(event_ids: List[str]):
+    """
+        Delete many events at once by ID, in batches of 50 per HTTP round trip.
+
+        Example:
+            python3 cli.py bulk-delete 12345 67890
+        """
+    results = submit_writes([('delete', event_id, None, None, 'primary') for event_id in event_ids],
+                            interactive=False)
+    report_batch_results(results, 'deleted')
+
+
+@app.command("flush")
+def flush_writes(interval: Optional[int] = typer.Option(None, min=1,
+                                                        help="Keep flushing, every this many seconds.")):
+    """
+        Send the writes waiting in the write-ahead queue.
+
+        Every command that changes events first records the change in a local queue
+        (writes.db) and only removes it once the API confirmed it, so writes made while
+        the API is unreachable are kept rather than lost. They are sent in batches of 50,
+        successive changes of the same event are combined into one request, and new
+        events carry their id from the start, so sending one again never duplicates it.
+
+        Args:
+            interval (Optional[int]): Keep running and flush every `interval` seconds.
+
+        Example:
+            python3 cli.py flush
+            python3 cli.py flush --interval 60 &
+        """
+    queue = get_write_queue()
+    while True:
+        if queue.pending():
+            results = queue.flush(get_calendar())
+            if results:
+                invalidate_event_cache()
+            failed = sum(1 for _, error in results.values() if error is not None)
+            logging.info(f"{len(results) - failed} writes sent, {failed} rejected, {queue.pending()} still queued.")
+        elif interval is None:
+            logging.info("No writes are queued.")
+        if interval is None:
+            return
+        time.sleep(interval)
+
+
+@app.command("import")
+def import_events(file: str):
+    """
+        Import events from an iCalendar (.ics), CSV (.csv) or JSON Lines (.jsonl) file.
+
+        The file is read one event at a time and imported in batches, so files of any
+        size are handled in constant memory. Events whose iCalUID already exists in the
+        calendar, or appeared earlier in the file, are skipped; CSV rows without a uid
+        get one derived from their title and times, so importing a file twice adds
+        nothing the second time. Recurring events are imported with their RRULE;
+        events using RDATE, EXDATE or RECURRENCE-ID are skipped with a warning, as
+        are lines that hold no readable event. When the file cannot be read any further,
+        the events read up to there are still imported.
+
+        CSV files need a header row with the columns uid, title, start, end, all_day,
+        time_zone, description, location, attendees (separated by ';') and rrule.
+
+        Args:
+            file (str): Path to the .ics, .csv or .jsonl file.
+
+        Example:
+            python3 cli.py import calendar.ics
+        """
+    try:
+        events = read_events(client_path(file))
+    except ValueError as e:
+        logging.error(e)
+        return
+    calendar = get_calendar()
+    from googleapiclient.errors import HttpError
+    try:
+        known_uids = set(calendar.get_ical_uids())
+    except HttpError as e:
+        logging.info(f"An error occurred: {e}")
+        logging.error("Could not list the calendar's events to skip those already present; nothing was imported.")
+        return
+    pending = []
+    imported = skipped = failed = 0
+
+    def flush():
+        nonlocal imported, failed
+        for uid, (response, error) in calendar.batch_import_events(pending).items():
+            if error is not None:
+                failed += 1
+                logging.error(f"{uid}: failed: {error}")
+            else:
+                imported += 1
+        pending.clear()
+        logging.info(f"{imported} imported, {skipped} already present, {failed} failed...")
+
+    try:
+        for event in events:
+            if not event.ical_uid:
+                event.ical_uid = derived_uid(event)
+            if event.ical_uid in known_uids:
+                skipped += 1
+                continue
+            known_uids.add(event.ical_uid)
+            pending.append(event)
+            if len(pending) >= IMPORT_CHUNK_SIZE:
+                flush()
+    except EventFileError as e:
+        # The events read before the error are still imported
+        logging.error(f"Stopped reading {e}")
+    if pending:
+        flush()
+    invalidate_event_cache()
+    logging.info(f"Done: {imported} imported, {skipped} already present, {failed} failed.")
+
+
+@app.command("export")
+def export_events(period: Optional[str] = typer.Argument(None, metavar="PERIOD"),
+                  start: Optional[str] = typer.Option(None, "--from", help="Start of the window, e.g. 2024-06-10."),
+                  end: Optional[str] = typer.Option(None, "--to", help="End of the window; a date includes that day."),
+                  time_zone: Optional[str] = typer.Option(None, help="IANA time zone; the calendar's by default."),
+                  file_format: str = typer.Option("ics", "--format", help="One of ics, csv, jsonl."),
+                  output: Optional[str] = typer.Option(None, "--output", "-o",
+                                                       help="File to write; standard output by default.")):
+    """
+        Export the events of a period as iCalendar, CSV or JSON Lines.
+
+        Events are written as their pages arrive, so exports of any size use constant
+        memory. Recurring events are exported once, with their RRULE; individually
+        edited instances of them are not exported.
+
+        Args:
+            period (Optional[str]): A period expression, as for list-events.
+            start (Optional[str]): Start of the window instead of a period, as for list-events.
+            end (Optional[str]): End of the window, as for list-events.
+            time_zone (Optional[str]): IANA time zone of the window, instead of the calendar's.
+            file_format (str): 'ics', 'csv' or 'jsonl'.
+            output (Optional[str]): Path of the file to write; standard output if omitted.
+
+        Example:
+            python3 cli.py export m --format csv -o month.csv
+        """
+    if file_format not in FORMATS:
+        logging.error(f"Unknown format '{file_format}'; use one of {', '.join(FORMATS)}.")
+        return
+    window = resolve_window(period, start, end, time_zone)
+    events = (event for event in get_calendar().get_event_list(window, 2500, fields=RecurringEvent.JSON_FIELDS,
+                                                                single_events=False)
+              if not (isinstance(event, RecurringEvent) and event.recurrence is None))
+    if output:
+        with open(client_path(output), 'w', encoding='utf-8', newline='') as output_file:
+            count = write_events(events, output_file, file_format)
+    else:
+        count = write_events(events, sys.stdout, file_format)
+    logging.info(f"Exported {count} events.")
+
+
+@app.command()
+def daemon():
+    """
+        Keep a warm Calendar running in the background and serve the other commands.
+
+        The daemon listens on a Unix socket (~/.gcal-daemon.sock, or $GCAL_DAEMON_SOCKET).
+        While it runs, every other command forwards its arguments there and prints the
+        output, so imports, authentication, building the API service and opening the
+        event cache happen once instead of on every invocation. Commands are served
+        one at a time. Stop the daemon with Ctrl-C or SIGTERM.
+
+        Example:
+            python3 cli.py daemon &
+            python3 cli.py list-events d
+        """
+    calendar = get_calendar()
+    calendar.service
+    calendar.response_cache
+    get_event_store()
+    get_write_queue()
+    serve(typer.main.get_command(app), DAEMON_SOCKET, prepare=lambda: calendar.credentials, local=runs_locally)
+
+
+def runs_locally(argv):
+    """
+    Whether a command line must run in its own process rather than in the daemon.
+
+    The daemon serves one command at a time, so commands that do not end on their
+    own (daemon, watch and flush --interval) would block it. The command is found
+    with click's parser, so options given before its name are skipped.
+    """
+    import click
+
+    command = typer.main.get_command(app)
+    try:
+        context = command.make_context('cli.py', list(argv), resilient_parsing=True)
+        arguments = context.protected_args + context.args
+        if not arguments:
+            return False
+        name, subcommand, rest = command.resolve_command(context, arguments)
+        if name in ('daemon', 'watch'):
+            return True
+        if name == 'flush':
+            return subcommand.make_context(name, rest, parent=context,
+                                           resilient_parsing=True).params.get('interval') is not None
+    except click.ClickException:
+        pass
+    return False
+
+
+@app.command()
+def watch(calendars: Optional[List[str]] = typer.Option(None, "--calendar", "-c",
+                                                        help="Calendar id to watch; may be repeated."),
+          all_calendars: bool = typer.Option(False, help="Watch every calendar in your calendar list."),
+          host: str = typer.Option(WATCH_HOST, help="Interface the webhook receiver listens on."),
+          port: int = typer.Option(WATCH_PORT, help="Port the webhook receiver listens on."),
+          address: Optional[str] = typer.Option(None, help="Public HTTPS URL forwarding to the receiver."),
+          socket_path: Optional[str] = typer.Option(None, "--socket",
+                                                    help="Stream to clients of this Unix socket, not stdout."),
+          ttl: int = typer.Option(WATCH_CHANNEL_TTL, help="Seconds each notification channel is asked to last.")):
+    """
+        Stream event changes as JSON Lines, driven by push notifications instead of polling.
+
+        A notification channel is opened for every calendar and a local webhook receiver
+        waits for the API's notifications. Each one triggers an incremental fetch through
+        the event cache, and every changed event is written as a line such as
+        {"calendarId": "primary", "change": "updated", "event": {...}}, with "deleted"
+        for cancelled events. Channels are renewed before they expire and stopped on exit.
+
+        Google only delivers notifications to HTTPS addresses on a verified domain, so
+        pass the public URL of a proxy or tunnel forwarding to the receiver as --address.
+
+        Args:
+            calendars (Optional[List[str]]): Calendar ids to watch; defaults to the primary calendar.
+            all_calendars (bool): Watch every calendar from your calendar list.
+            host (str): Interface the webhook receiver listens on.
+            port (int): Port the webhook receiver listens on.
+            address (Optional[str]): URL the API posts notifications to; the receiver itself by default.
+            socket_path (Optional[str]): Unix socket to stream the changes to instead of standard output.
+            ttl (int): Lifetime in seconds asked for each channel.
+
+        Example:
+            python3 cli.py watch --address https://hooks.example.com/gcal > changes.jsonl
+            python3 cli.py watch -c primary -c team@example.com --socket /tmp/gcal-changes.sock
+        """
+    from watcher import Watcher, JsonlSocket, write_stdout
+
+    calendar = get_calendar()
+    calendar_ids = calendar.get_calendar_ids() if all_calendars else (calendars or ['primary'])
+    output = JsonlSocket(socket_path) if socket_path else write_stdout
+    watcher = Watcher(calendar, get_event_store(), calendar_ids, address, host, port, ttl, output=output)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if socket_path:
+            output.close()
 
 
 if __name__ == '__main__':
@@ -1,2 +1,82 @@
+import os
+from datetime import timedelta
+
 # If modifying these SCOPES, delete the file token.json
 SCOPES = ['https://www.googleapis.com/auth/calendar']
+
+# OAuth client secrets downloaded from the Google Cloud console, and where the authorized token is saved
+CREDENTIALS_FILE = 'credentials.json'
+TOKEN_FILE = 'token.json'
+
+# Refresh the access token this long before it expires, so no API call races the expiry
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# Discovery document for the Calendar v3 API. Startup uses the copy bundled with the client
+# library, or a newer one cached on disk; with DISCOVERY_REVALIDATE a cache older than the
+# TTL is refreshed from DISCOVERY_URL in the background, never delaying a command
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest'
+DISCOVERY_CACHE_FILE = 'discovery_cache.json'
+DISCOVERY_CACHE_TTL = 24 * 60 * 60
+DISCOVERY_REVALIDATE = False
+
+# Local SQLite event cache, kept current through incremental sync
+EVENT_CACHE_FILE = 'events.db'
+# Seconds a cached calendar may go without syncing before a read triggers a delta sync
+EVENT_CACHE_MAX_AGE = 300
+
+# Local cache of fetched events, revalidated with their ETag, and its size limit in bytes
+RESPONSE_CACHE_FILE = 'responses.db'
+RESPONSE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Seconds the time zone from the user's calendar settings is used before it is revalidated
+TIME_ZONE_MAX_AGE = 24 * 60 * 60
+
+# Events requested per page when listing; the API accepts at most 2500
+DEFAULT_PAGE_SIZE = 250
+
+# Requests per batch HTTP call (the Calendar API accepts at most 50) and retries for failed items
+BATCH_SIZE = 50
+BATCH_RETRIES = 3
+
+# Write-ahead queue of event changes, which keeps every write until the API confirmed it, and
+# for how many seconds after failing to reach the API commands only queue their writes
+WRITE_QUEUE_FILE = 'writes.db'
+WRITE_QUEUE_RETRY_AFTER = 60
+
+# Events read from an import file and sent in batches before the next ones are read
+IMPORT_CHUNK_SIZE = 500
+
+# Upper bound on calendars fetched concurrently
+MAX_WORKERS = 8
+
+# How far past now recurring events without COUNT or UNTIL are expanded
+RECURRENCE_HORIZON = timedelta(days=365)
+
+# REST endpoint of the Calendar API, and the size of AsyncCalendar's shared connection pool.
+# Set GCAL_API_ROOT to run against a stand-in server such as fake_server.py instead of Google.
+GOOGLE_CALENDAR_API_ROOT = 'https://www.googleapis.com/calendar/v3/'
+CALENDAR_API_ROOT = os.environ.get('GCAL_API_ROOT', GOOGLE_CALENDAR_API_ROOT)
+MAX_CONNECTIONS = 100
+
+# Request scheduling: quotas in requests per second, retry policy, and the share of
+# each quota bulk work must leave free for interactive requests
+USER_QUOTA_PER_SECOND = 10
+PROJECT_QUOTA_PER_SECOND = 100
+MAX_RETRIES = 5
+BACKOFF_BASE = 1
+BACKOFF_MAX = 32
+BULK_RESERVE = 0.2
+
+# Push notifications of the watch command: the lifetime asked for each channel, how long before
+# it expires a channel is replaced, and where the local webhook receiver listens
+WATCH_CHANNEL_TTL = 24 * 60 * 60
+WATCH_RENEW_MARGIN = 10 * 60
+WATCH_HOST = '127.0.0.1'
+WATCH_PORT = 8765
+
+# Unix socket of the background daemon; CLI commands are forwarded to it while it runs
+DAEMON_SOCKET = os.environ.get('GCAL_DAEMON_SOCKET', os.path.expanduser('~/.gcal-daemon.sock'))
+
+# Cumulative seconds `python -X importtime -c "import cli"` may report before tests/test_imports.py
+# fails; startup runs before every command, so import-time regressions are caught as they land
+CLI_IMPORT_TIME_LIMIT = 0.5
@@ -0,0 +1,172 @@
+import contextlib
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+
+from config import DAEMON_SOCKET
+
+# Only the standard library is imported at module level: forward() runs before the
+# CLI imports its heavy dependencies, and is all a thin client ever needs.
+
+# Working directory of the client whose command is running, None outside of the daemon
+_client_directory = None
+
+
+def client_path(path):
+    """
+    Resolve a path given on the command line against the working directory of the client.
+
+    The daemon never changes its own working directory, which is shared by the whole
+    process, so commands resolve the paths they were given through this.
+    """
+    return os.path.join(_client_directory, path) if _client_directory else path
+
+
+class _ClientStream:
+    """Text stream that relays everything written to it to the connected client."""
+
+    encoding = 'utf-8'
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode(self.encoding, 'replace')
+        if data:
+            self.connection.sendall(json.dumps({self.name: data}).encode() + b'\n')
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def _connect(path):
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        return None
+    return client
+
+
+def forward(argv, path=DAEMON_SOCKET):
+    """
+    Run a CLI command in the daemon listening on `path`, relaying its output as it is written.
+
+    Returns the exit code of the command, or None when no daemon is running, or it sent
+    the command back, and the command has to run in this process instead.
+    """
+    client = _connect(path)
+    if client is None:
+        return None
+    with client:
+        client.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd()}).encode() + b'\n')
+        for line in client.makefile('rb'):
+            message = json.loads(line)
+            if message.get('local'):
+                return None
+            if 'exit' in message:
+                return message['exit']
+            for name, data in message.items():
+                stream = sys.stdout if name == 'stdout' else sys.stderr
+                stream.write(data)
+                stream.flush()
+    sys.stderr.write("Lost the connection to the daemon.\n")
+    return 1
+
+
+def _run(command, argv, prog_name):
+    import click
+
+    try:
+        result = command.main(args=argv, prog_name=prog_name, standalone_mode=False)
+        return result if isinstance(result, int) else 0
+    except click.ClickException as e:
+        e.show(file=sys.stderr)
+        return e.exit_code
+    except click.Abort:
+        sys.stderr.write("Aborted!\n")
+        return 1
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception as e:
+        logging.exception(f"An unexpected error occurred: {e}")
+        return 1
+
+
+def _handle(command, connection, prog_name, prepare, local):
+    request = json.loads(connection.makefile('rb').readline())
+    if local and local(request['argv']):
+        connection.sendall(json.dumps({'local': True}).encode() + b'\n')
+        return
+    if prepare:
+        prepare()
+    stdout, stderr = _ClientStream(connection, 'stdout'), _ClientStream(connection, 'stderr')
+    handlers = [handler for handler in logging.getLogger().handlers if type(handler) is logging.StreamHandler]
+    streams = [handler.setStream(stderr) for handler in handlers]
+    global _client_directory
+    # Relative paths on the command line refer to the client's directory (see client_path)
+    _client_directory = request.get('cwd')
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            code = _run(command, request['argv'], prog_name)
+    finally:
+        _client_directory = None
+        for handler, stream in zip(handlers, streams):
+            handler.setStream(stream)
+    connection.sendall(json.dumps({'exit': code}).encode() + b'\n')
+
+
+def serve(command, path=DAEMON_SOCKET, prog_name='cli.py', prepare=None, local=None):
+    """
+    Serve the click `command` on a Unix socket until interrupted or sent SIGTERM.
+
+    Commands run one at a time inside this process, so whatever they set up (the
+    Calendar, its API service, the event cache) stays warm between invocations.
+    `prepare` is called before each command, e.g. to refresh the credentials. The
+    daemon's working directory never changes; commands resolve the paths they are
+    given with client_path().
+    Commands for which `local(argv)` is true are sent back to run in the client's
+    own process; a command that never ends would otherwise block every later one.
+    """
+    existing = _connect(path)
+    if existing is not None:
+        existing.close()
+        logging.error(f"A daemon is already listening on {path}")
+        return
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o077)  # only the owner may connect
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    server.listen()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.info(f"Daemon listening on {path}")
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                try:
+                    _handle(command, connection, prog_name, prepare, local)
+                except (OSError, ValueError) as e:
+                    logging.info(f"Client request failed: {e}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(path)
+        logging.info("Daemon stopped.")
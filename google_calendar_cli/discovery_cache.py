@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from config import DISCOVERY_URL, DISCOVERY_CACHE_FILE, DISCOVERY_CACHE_TTL, DISCOVERY_REVALIDATE
+
+
+def _read_cache(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as cache_file:
+            cached = json.load(cache_file)
+        if cached.get('document', {}).get('version') != 'v3':
+            return None
+        return cached
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable discovery cache {path}: {e}")
+        return None
+
+
+def _write_cache(path, document, etag):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as cache_file:
+        json.dump({'etag': etag, 'fetched_at': time.time(), 'document': document}, cache_file)
+    os.replace(tmp_path, path)
+
+
+def bundled_document():
+    """The Calendar v3 discovery document shipped with google-api-python-client, or None if it has none."""
+    from googleapiclient.discovery_cache import get_static_doc
+    content = get_static_doc('calendar', 'v3')
+    return json.loads(content) if content else None
+
+
+def load_discovery_document(path=DISCOVERY_CACHE_FILE, ttl=DISCOVERY_CACHE_TTL, url=DISCOVERY_URL,
+                            revalidate=DISCOVERY_REVALIDATE):
+    """
+    Return the Calendar v3 discovery document without waiting for the network.
+
+    The document comes from the on-disk cache when there is one, and otherwise from
+    the copy bundled with the client library. With `revalidate`, a cache older than
+    `ttl` seconds, or a missing one, is refreshed in a background thread, so a newer
+    document is picked up by the next start rather than delaying this one. Returns
+    None only when there is no document at all.
+    """
+    cached = _read_cache(path)
+    if revalidate and not (cached and time.time() - cached.get('fetched_at', 0) < ttl):
+        threading.Thread(target=refresh_discovery_document, args=(path, url, cached), daemon=True).start()
+    if cached:
+        return cached['document']
+    return bundled_document()
+
+
+def refresh_discovery_document(path=DISCOVERY_CACHE_FILE, url=DISCOVERY_URL, cached=None, http=None):
+    """
+    Download the discovery document into the on-disk cache if it changed.
+
+    The request is conditional on the ETag of the `cached` copy, so an unchanged
+    document costs a 304 and no download. Returns the current document, or None
+    when it could not be fetched.
+    """
+    import httplib2
+
+    headers = {}
+    if cached and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    try:
+        http = http or httplib2.Http(timeout=10)
+        resp, content = http.request(url, 'GET', headers=headers)
+        if resp.status == 304 and cached:
+            _write_cache(path, cached['document'], cached['etag'])
+            return cached['document']
+        if resp.status != 200:
+            raise httplib2.HttpLib2Error(f"HTTP {resp.status} fetching {url}")
+        document = json.loads(content)
+        if document.get('version') != 'v3':
+            raise ValueError(f"Unexpected discovery document version {document.get('version')}")
+        _write_cache(path, document, resp.get('etag') or document.get('etag'))
+        return document
+    except (httplib2.HttpLib2Error, OSError, ValueError) as e:
+        logging.warning(f"Could not refresh the discovery document: {e}")
+        return None
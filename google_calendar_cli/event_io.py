@@ -0,0 +1,373 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+import pytz
+
+from model.event import Event, parse_datetime
+from model.recurring_event import RecurrenceRule, RecurringEvent
+
+# Every reader and writer works on one event at a time, so files of any size are
+# converted in constant memory.
+
+CSV_COLUMNS = ['uid', 'title', 'start', 'end', 'all_day', 'time_zone', 'description', 'location', 'attendees',
+               'rrule']
+FORMATS = ['ics', 'csv', 'jsonl']
+ICS_UNSUPPORTED = {'RDATE', 'EXDATE', 'EXRULE', 'RECURRENCE-ID'}
+ICS_DURATION = re.compile(r'P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+ICS_ESCAPED = re.compile(r'\\([\\;,nN])')
+
+
+class EventFileError(ValueError):
+    """Raised when an event file cannot be read any further; `line` is the last line read."""
+
+    def __init__(self, path, line, error):
+        super().__init__(f"{path}, line {line}: {error}" if line else f"{path}: {error}")
+        self.line = line
+
+
+class _Lines:
+    """The lines of a UTF-8 file opened in binary mode, decoded one at a time and counted."""
+
+    def __init__(self, binary_file):
+        self.binary_file = binary_file
+        self.count = 0
+
+    def __iter__(self):
+        for line in self.binary_file:
+            self.count += 1
+            # Decoding line by line puts a decoding error on its own line, not on an 8 KB chunk
+            yield line.decode('utf-8')
+
+
+def _read_lines(path, read):
+    """Yield the events `read` finds in the lines of a file, raising EventFileError when reading fails."""
+    lines = None
+    try:
+        with open(path, 'rb') as binary_file:
+            lines = _Lines(binary_file)
+            yield from read(lines)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        raise EventFileError(path, lines.count if lines else 0, e) from e
+
+
+def derived_uid(event):
+    """Stable iCalUID for an event from a source without one, so importing it again is recognised."""
+    key = f"{event.title}|{event.start_time.isoformat()}|{event.end_time.isoformat()}"
+    return f"{hashlib.sha1(key.encode()).hexdigest()}@google-calendar-cli"
+
+
+def _new_event(title, start_time, end_time, daylong, time_zone, rrule, description, location, attendees, uid):
+    if rrule:
+        if not RecurrenceRule.is_supported(rrule):
+            logging.warning(f"Skipping event {uid or title}: its recurrence rule {rrule} is not supported")
+            return None
+        return RecurringEvent(title, start_time, end_time, RecurrenceRule.from_rrule(rrule), description, location,
+                              daylong, attendees, time_zone=time_zone, ical_uid=uid)
+    return Event(title, start_time, end_time, description, location, daylong, attendees, time_zone=time_zone,
+                 ical_uid=uid)
+
+
+def _ics_unfold(lines):
+    """Join folded iCalendar content lines; continuation lines start with a space or tab."""
+    current = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def _ics_split(line):
+    """Split 'NAME;PARAM=VALUE:value' into the upper-cased name, a dict of parameters and the value."""
+    quoted = False
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ':' and not quoted:
+            head, value = line[:index], line[index + 1:]
+            break
+    else:
+        head, value = line, ''
+    name, *params = head.split(';')
+    params = dict(param.partition('=')[::2] for param in params)
+    return name.upper(), {key.upper(): param_value for key, param_value in params.items()}, value
+
+
+def _ics_unescape(value):
+    return ICS_ESCAPED.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def _ics_time(params, value):
+    """Return the datetime, whether it is a date, and the time zone of a DTSTART/DTEND value."""
+    if params.get('VALUE') == 'DATE' or len(value) == 8:
+        return datetime.strptime(value, '%Y%m%d'), True, None
+    if value.endswith('Z'):
+        return datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc), False, None
+    return datetime.strptime(value, '%Y%m%dT%H%M%S'), False, params.get('TZID', '').strip('"') or None
+
+
+def _ics_duration(value):
+    match = ICS_DURATION.match(value.lstrip('+'))
+    if not match:
+        raise ValueError(f"Invalid DURATION {value}")
+    weeks, days, hours, minutes, seconds = (int(part) if part else 0 for part in match.groups())
+    return timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+def _event_from_ics(properties):
+    values = {}
+    attendees = []
+    unsupported = set()
+    for name, params, value in properties:
+        if name == 'ATTENDEE':
+            if value.lower().startswith('mailto:'):
+                attendees.append(value[len('mailto:'):])
+        elif name in ICS_UNSUPPORTED:
+            unsupported.add(name)
+        else:
+            values.setdefault(name, (params, value))
+    uid = values.get('UID', ({}, None))[1]
+    if unsupported:
+        logging.warning(f"Skipping event {uid}: {', '.join(sorted(unsupported))} cannot be imported")
+        return None
+    if 'DTSTART' not in values:
+        logging.warning(f"Skipping event {uid}: it has no DTSTART")
+        return None
+    start_time, daylong, time_zone = _ics_time(*values['DTSTART'])
+    if 'DTEND' in values:
+        end_time = _ics_time(*values['DTEND'])[0]
+    elif 'DURATION' in values:
+        end_time = start_time + _ics_duration(values['DURATION'][1])
+    else:
+        end_time = start_time + timedelta(days=1) if daylong else start_time
+
+    def text(name):
+        return _ics_unescape(values[name][1]) if name in values else None
+
+    return _new_event(text('SUMMARY'), start_time, end_time, daylong, time_zone, values.get('RRULE', ({}, None))[1],
+                      text('DESCRIPTION'), text('LOCATION'), attendees, uid)
+
+
+def read_ics(path):
+    """Yield the events of an iCalendar file, one VEVENT at a time."""
+    return _read_lines(path, _read_ics)
+
+
+def _read_ics(lines):
+    properties = None
+    nested = 0
+    for line in _ics_unfold(lines):
+        upper = line.upper()
+        if properties is None:
+            if upper == 'BEGIN:VEVENT':
+                properties = []
+        elif upper.startswith('BEGIN:'):
+            nested += 1
+        elif nested:
+            if upper.startswith('END:'):
+                nested -= 1
+        elif upper == 'END:VEVENT':
+            try:
+                event = _event_from_ics(properties)
+            except ValueError as e:
+                logging.warning(f"Skipping the event ending on line {lines.count}: {e}")
+                event = None
+            if event:
+                yield event
+            properties = None
+        else:
+            properties.append(_ics_split(line))
+
+
+def _ics_escape(value):
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _ics_fold(line):
+    """Fold a content line into chunks of at most 75 octets."""
+    if len(line.encode()) <= 75:
+        return line
+    chunks, current, size = [], '', 0
+    for char in line:
+        char_size = len(char.encode())
+        if size + char_size > 75:
+            chunks.append(current)
+            current, size = ' ', 1
+        current += char
+        size += char_size
+    chunks.append(current)
+    return '\r\n'.join(chunks)
+
+
+def _ics_time_property(name, value, event):
+    if event.daylong:
+        return f"{name};VALUE=DATE:{value:%Y%m%d}"
+    if event.time_zone and event.time_zone != 'UTC':
+        try:
+            zone = pytz.timezone(event.time_zone)
+        except pytz.UnknownTimeZoneError:
+            zone = None
+        if zone:
+            local = value.astimezone(zone) if value.tzinfo else value
+            return f"{name};TZID={event.time_zone}:{local:%Y%m%dT%H%M%S}"
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc)
+    return f"{name}:{value:%Y%m%dT%H%M%S}Z"
+
+
+def write_ics(events, ics_file):
+    """Write events as an iCalendar file; returns how many were written."""
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    ics_file.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//google-calendar-cli//EN\r\n")
+    count = 0
+    for event in events:
+        lines = ['BEGIN:VEVENT',
+                 f"UID:{event.ical_uid or event.event_id + '@google.com'}",
+                 f"DTSTAMP:{stamp}",
+                 _ics_time_property('DTSTART', event.start_time, event),
+                 _ics_time_property('DTEND', event.end_time, event)]
+        for name, value in (('SUMMARY', event.title), ('DESCRIPTION', event.description),
+                            ('LOCATION', event.location)):
+            if value:
+                lines.append(f"{name}:{_ics_escape(value)}")
+        lines.extend(f"ATTENDEE:mailto:{attendee}" for attendee in event.attendees)
+        if isinstance(event, RecurringEvent) and event.recurrence:
+            lines.append(f"RRULE:{event.recurrence.to_rrule()}")
+        lines.append('END:VEVENT')
+        ics_file.write(''.join(_ics_fold(line) + '\r\n' for line in lines))
+        count += 1
+    ics_file.write("END:VCALENDAR\r\n")
+    return count
+
+
+def _csv_time(row, column):
+    if not row.get(column):
+        raise ValueError(f"no {column}")
+    return parse_datetime(row[column])
+
+
+def read_csv(path):
+    """Yield the events of a CSV file with the CSV_COLUMNS header, one row at a time."""
+    return _read_lines(path, _read_csv)
+
+
+def _read_csv(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        try:
+            daylong = (row.get('all_day') or '').strip().lower() in ('1', 'true', 'yes')
+            attendees = [email.strip() for email in (row.get('attendees') or '').split(';') if email.strip()]
+            event = _new_event(row.get('title') or None, _csv_time(row, 'start'), _csv_time(row, 'end'),
+                               daylong, row.get('time_zone') or None, row.get('rrule') or None,
+                               row.get('description') or None, row.get('location') or None, attendees,
+                               row.get('uid') or None)
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning(f"Skipping line {reader.line_num}: {e}")
+            continue
+        if event:
+            yield event
+
+
+def write_csv(events, csv_file):
+    """Write events as CSV with the CSV_COLUMNS header; returns how many were written."""
+    writer = csv.writer(csv_file)
+    writer.writerow(CSV_COLUMNS)
+    count = 0
+    for event in events:
+        if event.daylong:
+            start, end = event.start_time.date().isoformat(), event.end_time.date().isoformat()
+        else:
+            start, end = event.start_time.isoformat(), event.end_time.isoformat()
+        rrule = event.recurrence.to_rrule() if isinstance(event, RecurringEvent) and event.recurrence else ''
+        writer.writerow([event.ical_uid or '', event.title or '', start, end, 'true' if event.daylong else 'false',
+                         event.time_zone or '', event.description or '', event.location or '',
+                         ';'.join(event.attendees), rrule])
+        count += 1
+    return count
+
+
+def read_jsonl(path):
+    """Yield the events of a JSON Lines file of Calendar API event resources."""
+    return _read_lines(path, _read_jsonl)
+
+
+def _event_from_resource(json_event):
+    if not isinstance(json_event, dict):
+        raise ValueError("not an event resource")
+    event = RecurringEvent.from_json(json_event) if "recurrence" in json_event else Event.from_json(json_event)
+    if event.start_time is None or event.end_time is None:
+        raise ValueError("it has no start or end")
+    return event
+
+
+def _read_jsonl(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            event = _event_from_resource(json.loads(line))
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning(f"Skipping line {lines.count}: {e}")
+            continue
+        yield event
+
+
+def read_json(path):
+    """
+    Yield the events of a JSON array of Calendar API event resources.
+
+    Unlike the other formats the array is decoded as a whole, so its size is limited
+    by memory; a file that is not valid JSON raises EventFileError with the line of the error.
+    """
+    try:
+        with open(path, encoding='utf-8') as json_file:
+            json_events = json.load(json_file)
+    except json.JSONDecodeError as e:
+        raise EventFileError(path, e.lineno, e.msg) from e
+    except (OSError, UnicodeDecodeError) as e:
+        raise EventFileError(path, 0, e) from e
+    if not isinstance(json_events, list):
+        raise EventFileError(path, 1, "not a JSON array of event resources")
+    for index, json_event in enumerate(json_events, start=1):
+        try:
+            event = _event_from_resource(json_event)
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning(f"Skipping event {index}: {e}")
+            continue
+        yield event
+
+
+def write_jsonl(events, jsonl_file):
+    """Write events as Calendar API event resources, one per line; returns how many were written."""
+    count = 0
+    for event in events:
+        jsonl_file.write(json.dumps(event.to_json()) + '\n')
+        count += 1
+    return count
+
+
+READERS = {'.ics': read_ics, '.csv': read_csv, '.json': read_json, '.jsonl': read_jsonl}
+WRITERS = {'ics': write_ics, 'csv': write_csv, 'jsonl': write_jsonl}
+
+
+def read_events(path):
+    """Yield the events of an .ics, .csv, .json or .jsonl file, chosen by its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Unsupported file type '{extension}'; use .ics, .csv, .json or .jsonl")
+    return READERS[extension](path)
+
+
+def write_events(events, output_file, file_format):
+    """Write events in `file_format` ('ics', 'csv' or 'jsonl') to an open text file; returns the count."""
+    return WRITERS[file_format](events, output_file)
@@ -0,0 +1,275 @@
+import json
+import logging
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytz
+
+from config import EVENT_CACHE_FILE, EVENT_CACHE_MAX_AGE, MAX_WORKERS
+from model.calendar import SyncTokenExpiredError
+from model.event import Event, parse_datetime
+from model.recurring_event import RecurringEvent
+
+
+def _to_timestamp(boundary, time_zone='UTC'):
+    """
+    Epoch seconds of an event's start/end object. All-day dates are taken at midnight
+    in `time_zone`, the calendar's, as the API does when it filters by timeMin/timeMax.
+    """
+    value = boundary.get('dateTime') or boundary.get('date')
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed.tzinfo is None:
+        parsed = pytz.timezone(time_zone).localize(parsed)
+    return parsed.timestamp()
+
+
+# Text of the cached events kept in the search index, under the rowid of their events row.
+# Private extended properties are indexed as 'key=value' words.
+SEARCH_FIELDS = ('title', 'description', 'location', 'attendees')
+INDEX_EVENTS = """
+    INSERT INTO event_search (rowid, title, description, location, attendees, properties)
+    SELECT rowid, json_extract(events.json, '$.summary'), json_extract(events.json, '$.description'),
+        json_extract(events.json, '$.location'),
+        (SELECT group_concat(json_extract(value, '$.email'), ' ') FROM json_each(events.json, '$.attendees')),
+        (SELECT group_concat(key || '=' || value, ' ') FROM json_each(events.json, '$.extendedProperties.private'))
+    FROM events
+"""
+# Shortest term the trigram index can look up; shorter ones are only matched with LIKE
+MIN_TRIGRAM_TERM = 3
+
+
+def _like_pattern(term):
+    return "%" + re.sub(r"([\\%_])", r"\\\1", term) + "%"
+
+
+def _from_json(json_event):
+    if "recurringEventId" in json_event:
+        return RecurringEvent.from_json(json_event)
+    return Event.from_json(json_event)
+
+
+class EventStore:
+    """
+    SQLite-backed cache of calendar events, keyed by event id.
+
+    The first read of a calendar performs a full sync; later reads only send an
+    incremental request with the stored syncToken, and only once the cached
+    copy is older than `max_age` seconds. A 410 Gone answer discards the cached
+    events of that calendar and performs a full sync again.
+
+    The title, description, location and attendees of every cached event are kept
+    in an FTS5 trigram index, updated with each sync, which search() uses to find
+    substrings without scanning the events. SQLite builds without FTS5 fall back to
+    a plain table searched with LIKE.
+    """
+
+    def __init__(self, calendar, path=EVENT_CACHE_FILE, max_age=EVENT_CACHE_MAX_AGE):
+        self.calendar = calendar
+        self.max_age = max_age
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                calendar_id TEXT NOT NULL,
+                event_id TEXT NOT NULL,
+                recurring_event_id TEXT,
+                start_ts REAL,
+                end_ts REAL,
+                json TEXT NOT NULL,
+                PRIMARY KEY (calendar_id, event_id)
+            );
+            CREATE INDEX IF NOT EXISTS events_start ON events (calendar_id, start_ts);
+            CREATE INDEX IF NOT EXISTS events_recurring ON events (calendar_id, recurring_event_id);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                calendar_id TEXT PRIMARY KEY,
+                sync_token TEXT,
+                synced_at REAL NOT NULL
+            );
+        """)
+        self._create_search_index()
+
+    def _create_search_index(self):
+        if self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'event_search'").fetchone():
+            self.trigram_index = 'trigram' in self.connection.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'event_search'").fetchone()[0]
+            return
+        try:
+            self.connection.execute("CREATE VIRTUAL TABLE event_search USING fts5("
+                                    "title, description, location, attendees, properties, tokenize='trigram')")
+            self.trigram_index = True
+        except sqlite3.OperationalError:
+            logging.debug("SQLite lacks the FTS5 trigram tokenizer, searching the cache with LIKE")
+            self.connection.execute("CREATE TABLE event_search (title, description, location, attendees, properties)")
+            self.trigram_index = False
+        # Index events cached before the search index existed
+        with self.connection:
+            self.connection.execute(INDEX_EVENTS)
+
+    def _sync_state(self, calendar_id):
+        return self.connection.execute("SELECT sync_token, synced_at FROM sync_state WHERE calendar_id = ?",
+                                       (calendar_id,)).fetchone()
+
+    def refresh(self, calendar_id='primary', force=False):
+        """Bring the cached copy of a calendar up to date if it is older than the staleness bound."""
+        self.refresh_many([calendar_id], force)
+
+    def refresh_many(self, calendar_ids, force=False):
+        """Sync every stale calendar of `calendar_ids`, downloading their changes concurrently."""
+        now = time.time()
+        tokens = {}
+        for calendar_id in calendar_ids:
+            state = self._sync_state(calendar_id)
+            if not state or force or now - state[1] >= self.max_age:
+                tokens[calendar_id] = state[0] if state else None
+        if len(tokens) == 1:
+            calendar_id, sync_token = tokens.popitem()
+            self._store_changes(calendar_id, *self._fetch_changes(calendar_id, sync_token))
+        elif tokens:
+            self.calendar.service  # authenticate and build once up front rather than racing in every worker
+            with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(tokens))) as pool:
+                futures = {calendar_id: pool.submit(self._fetch_changes, calendar_id, sync_token,
+                                                    threaded=True)
+                           for calendar_id, sync_token in tokens.items()}
+            for calendar_id, future in futures.items():
+                self._store_changes(calendar_id, *future.result())
+
+    def sync(self, calendar_id='primary'):
+        self.refresh(calendar_id, force=True)
+
+    def pull_changes(self, calendar_id='primary'):
+        """
+        Sync a calendar now and return the raw event resources that changed, cancelled ones included.
+
+        Returns a tuple of the resources and whether they are a full sync, i.e. the whole
+        calendar rather than the changes since the previous sync. The resources are None
+        when the sync failed.
+        """
+        state = self._sync_state(calendar_id)
+        sync_token, items, next_sync_token = self._fetch_changes(calendar_id, state[0] if state else None)
+        self._store_changes(calendar_id, sync_token, items, next_sync_token)
+        return items, not sync_token
+
+    def _fetch_changes(self, calendar_id, sync_token, threaded=False):
+        http = self.calendar.thread_http() if threaded else None
+        try:
+            items, next_sync_token = self.calendar.sync_events(sync_token, calendar_id, http)
+        except SyncTokenExpiredError:
+            logging.info("Sync token expired, performing a full sync...")
+            sync_token = None
+            items, next_sync_token = self.calendar.sync_events(None, calendar_id, http)
+        return sync_token, items, next_sync_token
+
+    def _store_changes(self, calendar_id, sync_token, items, next_sync_token):
+        if items is None:
+            return
+        with self.connection:
+            if not sync_token:
+                self.connection.execute("DELETE FROM event_search WHERE rowid IN "
+                                        "(SELECT rowid FROM events WHERE calendar_id = ?)", (calendar_id,))
+                self.connection.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+            self._apply(calendar_id, items)
+            self.connection.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+                                    (calendar_id, next_sync_token, time.time()))
+
+    def _apply(self, calendar_id, items):
+        # All-day events are bounded by midnight in the calendar's time zone; only look it up when needed
+        daylong = any('date' in item.get('start', {}) for item in items)
+        time_zone = self.calendar.time_zone if daylong else 'UTC'
+        for item in items:
+            # Replacing a row gives it a new rowid, so its index entry is removed with it
+            row = self.connection.execute("SELECT rowid FROM events WHERE calendar_id = ? AND event_id = ?",
+                                          (calendar_id, item['id'])).fetchone()
+            if row:
+                self.connection.execute("DELETE FROM event_search WHERE rowid = ?", row)
+                self.connection.execute("DELETE FROM events WHERE rowid = ?", row)
+            if item.get('status') == 'cancelled':
+                continue
+            rowid = self.connection.execute("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
+                                            (calendar_id, item['id'], item.get('recurringEventId'),
+                                             _to_timestamp(item.get('start', {}), time_zone),
+                                             _to_timestamp(item.get('end', {}), time_zone),
+                                             json.dumps(item))).lastrowid
+            self.connection.execute(INDEX_EVENTS + "WHERE rowid = ?", (rowid,))
+
+    def invalidate(self, calendar_id='primary'):
+        """Force the next read of a calendar to sync, e.g. after writing to it."""
+        with self.connection:
+            self.connection.execute("UPDATE sync_state SET synced_at = 0 WHERE calendar_id = ?", (calendar_id,))
+
+    def get_event_list(self, option, calendar_ids=('primary',)):
+        """Yield the cached events of the period across `calendar_ids`, merged by start time."""
+        self.refresh_many(calendar_ids)
+        time_min, time_max = (parse_datetime(boundary).timestamp() for boundary in self.calendar.time_ranges(option))
+        placeholders = ", ".join("?" * len(calendar_ids))
+        rows = self.connection.execute(f"SELECT json FROM events WHERE calendar_id IN ({placeholders}) "
+                                       f"AND start_ts < ? AND end_ts > ? ORDER BY start_ts",
+                                       (*calendar_ids, time_max, time_min))
+        for row in rows:
+            yield _from_json(json.loads(row[0]))
+
+    def fetch_event_by_id(self, event_id, calendar_id='primary'):
+        self.refresh(calendar_id)
+        row = self.connection.execute("SELECT json FROM events WHERE calendar_id = ? AND event_id = ?",
+                                      (calendar_id, event_id)).fetchone()
+        return _from_json(json.loads(row[0])) if row else None
+
+    def get_recurring_instances(self, event_id, calendar_id='primary'):
+        self.refresh(calendar_id)
+        rows = self.connection.execute("SELECT json FROM events WHERE calendar_id = ? AND recurring_event_id = ? "
+                                       "ORDER BY start_ts", (calendar_id, event_id))
+        return [RecurringEvent.from_json(json.loads(row[0])) for row in rows]
+
+    def search(self, text=None, attendees=(), properties=(), option=None, calendar_ids=('primary',)):
+        """
+        Yield the cached events matching a search, ordered by start time, without calling the API
+        unless the cache is stale.
+
+        Every whitespace-separated term of `text` must occur, case-insensitively, in the
+        title, description, location or attendees; a term ending in '*' must start a word
+        there. Each of `attendees` must be invited, and each 'key=value' of `properties`
+        must be a private extended property of the event. `option` limits the search to
+        a period or (start, end) window like get_event_list.
+        """
+        self.refresh_many(calendar_ids)
+        terms = text.split() if text else []
+        placeholders = ", ".join("?" * len(calendar_ids))
+        conditions, parameters = [f"events.calendar_id IN ({placeholders})"], list(calendar_ids)
+        # The trigram index narrows the candidates down; the conditions below check them exactly
+        phrases = [(f"{{{' '.join(SEARCH_FIELDS)}}}", term.rstrip('*')) for term in terms]
+        phrases += [('attendees', attendee) for attendee in attendees]
+        phrases += [('properties', condition) for condition in properties]
+        phrases = [f'{column} : "' + phrase.replace('"', '""') + '"'
+                   for column, phrase in phrases if len(phrase) >= MIN_TRIGRAM_TERM]
+        if self.trigram_index and phrases:
+            conditions.append("event_search MATCH ?")
+            parameters.append(" AND ".join(phrases))
+        for term in terms:
+            conditions.append("(" + " OR ".join(f"event_search.{column} LIKE ? ESCAPE '\\'"
+                                                for column in SEARCH_FIELDS) + ")")
+            parameters.extend([_like_pattern(term.rstrip('*'))] * len(SEARCH_FIELDS))
+        for attendee in attendees:
+            conditions.append("EXISTS (SELECT 1 FROM json_each(events.json, '$.attendees') "
+                              "WHERE lower(json_extract(value, '$.email')) = lower(?))")
+            parameters.append(attendee)
+        for condition in properties:
+            key, _, value = condition.partition('=')
+            conditions.append("json_extract(events.json, '$.extendedProperties.private.' || json_quote(?)) = ?")
+            parameters.extend([key, value])
+        if option is not None:
+            time_min, time_max = (parse_datetime(boundary).timestamp()
+                                  for boundary in self.calendar.time_ranges(option))
+            conditions.append("events.start_ts < ? AND events.end_ts > ?")
+            parameters.extend([time_max, time_min])
+        prefixes = [re.compile(r"(?<!\w)" + re.escape(term.rstrip('*')), re.IGNORECASE)
+                    for term in terms if term.endswith('*')]
+        columns = ", ".join(f"event_search.{column}" for column in SEARCH_FIELDS)
+        # CROSS JOIN keeps SQLite from probing the index once per cached event
+        rows = self.connection.execute(f"SELECT events.json, {columns} "
+                                       f"FROM event_search CROSS JOIN events ON events.rowid = event_search.rowid "
+                                       f"WHERE {' AND '.join(conditions)} ORDER BY events.start_ts", parameters)
+        for row in rows:
+            if all(any(value and prefix.search(value) for value in row[1:]) for prefix in prefixes):
+                yield _from_json(json.loads(row[0]))
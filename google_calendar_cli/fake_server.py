@@ -0,0 +1,612 @@
+import argparse
+import email.parser
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from urllib.request import Request, urlopen
+
+import pytz
+
+from discovery_cache import bundled_document
+from model.calendar import Calendar
+from model.event import parse_datetime
+from utility import as_utc
+
+# A stand-in for the parts of the Calendar v3 REST API this CLI uses, for offline runs
+# and benchmarks. Point the CLI at it with GCAL_API_ROOT, or pass api_root= to Calendar.
+
+SERVICE_PATH = '/calendar/v3/'
+BATCH_PATH = '/batch/calendar/v3'
+DISCOVERY_PATH = '/discovery/v1/apis/calendar/v3/rest'
+# Parameters that select a page or the shape of the response rather than which events match
+PAGE_PARAMETERS = {'pageToken', 'maxResults', 'fields'}
+FIELD_NAME = re.compile(r'[A-Za-z0-9_*]+')
+STATUS_TEXT = {200: 'OK', 204: 'No Content', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+               409: 'Conflict', 410: 'Gone', 412: 'Precondition Failed', 429: 'Too Many Requests',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+# Lifetime of a notification channel created without a ttl parameter, in seconds
+DEFAULT_CHANNEL_TTL = 7 * 24 * 60 * 60
+ERROR_REASONS = {400: 'badRequest', 404: 'notFound', 409: 'duplicate', 410: 'deleted', 412: 'conditionNotMet',
+                 429: 'rateLimitExceeded', 500: 'backendError', 503: 'backendError'}
+
+
+def parse_fields(mask):
+    """Parse a partial-response mask such as 'nextPageToken,items(id,attendees/email)' into nested dicts."""
+    fields, _ = _parse_field_list(mask, 0)
+    return fields
+
+
+def _parse_field_list(mask, index):
+    fields = {}
+    while index < len(mask):
+        path = []
+        while True:
+            match = FIELD_NAME.match(mask, index)
+            if not match:
+                raise ValueError(f"Invalid fields mask at {index}: {mask}")
+            path.append(match.group())
+            index = match.end()
+            if index < len(mask) and mask[index] == '/':
+                index += 1
+            else:
+                break
+        nested = None
+        if index < len(mask) and mask[index] == '(':
+            nested, index = _parse_field_list(mask, index + 1)
+            index += 1
+        *parents, name = path
+        target = fields
+        for parent in parents:
+            target = target.setdefault(parent, {})
+            if target is None:
+                break
+        else:
+            target[name] = nested
+        if index < len(mask) and mask[index] == ',':
+            index += 1
+        elif index < len(mask) and mask[index] == ')':
+            break
+    return fields, index
+
+
+def select_fields(value, fields):
+    """Keep only the parts of a response named by parsed `fields`; None keeps everything."""
+    if fields is None or '*' in fields:
+        return value
+    if isinstance(value, list):
+        return [select_fields(item, fields) for item in value]
+    if isinstance(value, dict):
+        return {name: select_fields(value[name], nested) for name, nested in fields.items() if name in value}
+    return value
+
+
+def _bounds(resource, time_zone='UTC'):
+    """Start and end of an event resource as aware datetimes; all-day dates start at midnight in `time_zone`."""
+    zone = pytz.timezone(time_zone)
+
+    def bound(boundary):
+        value = parse_datetime(boundary.get('dateTime') or boundary.get('date'))
+        return zone.localize(value) if value.tzinfo is None else value
+
+    return bound(resource.get('start', {})), bound(resource.get('end', {}))
+
+
+def _time_object(value, daylong):
+    return {'date': value.date().isoformat()} if daylong else {'dateTime': value.isoformat()}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, reason=None):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason if reason else ERROR_REASONS.get(status, 'error')
+
+    def to_json(self):
+        return {'error': {'code': self.status, 'message': str(self),
+                          'errors': [{'domain': 'global', 'reason': self.reason, 'message': str(self)}]}}
+
+
+def generate_events(count, start=None, span=timedelta(days=28), attendees=3, seed=0):
+    """
+    Return `count` one-hour event resources spread evenly over `span` from `start`.
+
+    Start defaults to the first day of the current month, so the events are what
+    `list-events m` returns. Each event invites `attendees` people.
+    """
+    if start is None:
+        now = datetime.now(timezone.utc)
+        start = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+    randomizer = random.Random(seed)
+    step = span / max(count, 1)
+    events = []
+    for index in range(count):
+        event_start = (start + step * index).replace(microsecond=0)
+        events.append({
+            'id': f"ev{index:07d}",
+            'summary': f"Event {index}",
+            'description': f"Generated event {index} for benchmarking",
+            'location': f"Room {randomizer.randint(1, 50)}",
+            'start': {'dateTime': event_start.isoformat(), 'timeZone': 'UTC'},
+            'end': {'dateTime': (event_start + timedelta(hours=1)).isoformat(), 'timeZone': 'UTC'},
+            'attendees': [{'email': f"user{randomizer.randint(1, 500)}@example.com"} for _ in range(attendees)],
+        })
+    return events
+
+
+class FakeCalendarServer:
+    """
+    In-memory stand-in for the Calendar v3 REST API, served over HTTP on localhost.
+
+    It implements events list/get/insert/import/patch/update/delete/instances/
+    quickAdd/watch, channels stop, freeBusy, the calendar list and batch requests,
+    with pagination, sync tokens, ETags (If-Match and If-None-Match) and partial
+    responses, and serves the client library's discovery document, pointed at
+    itself, on `discovery_url`. Watch channels get a push notification posted to their address
+    for every change of their calendar until they expire or are stopped.
+    `latency` seconds are added to every HTTP request, at most `max_page_size`
+    events are returned per page, and a share `error_rate` of the requests fails
+    with a 503; fail() queues specific errors for the next requests. The
+    user's time zone setting is `time_zone`. `bytes_sent` counts the bytes of
+    every response body, so payload sizes can be measured.
+
+    Use it as a context manager:
+
+        with FakeCalendarServer(latency=0.02) as server:
+            server.add_events(generate_events(1000))
+            calendar = Calendar(api_root=server.api_root)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, error_rate=0, max_page_size=2500, seed=None,
+                 time_zone='UTC'):
+        self.latency = latency
+        self.time_zone = time_zone
+        self.error_rate = error_rate
+        self.max_page_size = max_page_size
+        self.random = random.Random(seed)
+        self.calendars = {'primary': {}}
+        self.changed_at = {}
+        self.version = 0
+        self.failures = []
+        self.request_count = 0
+        self.bytes_sent = 0
+        self.lock = threading.RLock()
+        self._queries = {}
+        self.channels = {}
+        self.notifications = queue.Queue()
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self._thread = None
+        self._discovery = None
+
+    @property
+    def api_root(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{SERVICE_PATH}"
+
+    @property
+    def discovery_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{DISCOVERY_PATH}"
+
+    def discovery_content(self):
+        """The bundled discovery document, pointed at this server."""
+        if self._discovery is None:
+            document = bundled_document()
+            document['rootUrl'] = self.api_root[:-len(document['servicePath'])]
+            self._discovery = json.dumps(document).encode()
+        return self._discovery
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._deliver_notifications, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.notifications.put(None)
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def fail(self, status, count=1, reason=None):
+        """Answer the next `count` requests with an error `status`, e.g. 429 or 503."""
+        with self.lock:
+            self.failures.extend([(status, reason)] * count)
+
+    def add_events(self, resources, calendar_id='primary'):
+        """Store event resources as they are, assigning ids and ETags where missing; returns the ids."""
+        with self.lock:
+            return [self._store(calendar_id, dict(resource))['id'] for resource in resources]
+
+    # Storage
+
+    def _events(self, calendar_id):
+        if calendar_id not in self.calendars:
+            raise ApiError(404, f"Calendar {calendar_id} not found")
+        return self.calendars[calendar_id]
+
+    def _store(self, calendar_id, resource):
+        self.version += 1
+        now = datetime.now(timezone.utc).isoformat()
+        resource.setdefault('id', uuid.uuid4().hex)
+        resource.setdefault('iCalUID', f"{resource['id']}@google.com")
+        resource.setdefault('status', 'confirmed')
+        resource.setdefault('created', now)
+        resource['updated'] = now
+        resource['etag'] = f'"{self.version}"'
+        self.calendars.setdefault(calendar_id, {})[resource['id']] = resource
+        self.changed_at[(calendar_id, resource['id'])] = self.version
+        for channel in self.channels.values():
+            if channel['calendarId'] == calendar_id:
+                self._notify(channel, 'exists')
+        return resource
+
+    def _get(self, calendar_id, event_id):
+        events = self._events(calendar_id)
+        resource = events.get(event_id)
+        if resource is None and '_' in event_id:
+            # An occurrence that was never edited is only stored as part of its master
+            master = events.get(event_id.rsplit('_', 1)[0])
+            if master is not None and 'recurrence' in master:
+                resource = next((instance for instance in self._instances(events, master, None, None)
+                                 if instance['id'] == event_id), None)
+        if resource is None:
+            raise ApiError(404, "Not Found")
+        return resource
+
+    # Push notifications
+
+    def _watch(self, calendar_id, body):
+        self._events(calendar_id)
+        if body.get('type') not in ('web_hook', 'webhook') or not body.get('address'):
+            raise ApiError(400, "A web_hook channel with an address is required.")
+        if body.get('id') in self.channels:
+            raise ApiError(400, f"Channel id {body['id']} not unique")
+        ttl = int(body.get('params', {}).get('ttl', DEFAULT_CHANNEL_TTL))
+        channel = {'kind': 'api#channel', 'id': body['id'], 'resourceId': f"events-{calendar_id}",
+                   'resourceUri': f"{SERVICE_PATH}calendars/{calendar_id}/events",
+                   'expiration': str(int((time.time() + ttl) * 1000))}
+        if 'token' in body:
+            channel['token'] = body['token']
+        self.channels[body['id']] = dict(channel, calendarId=calendar_id, address=body['address'], messages=0)
+        self._notify(self.channels[body['id']], 'sync')
+        return channel
+
+    def _notify(self, channel, state):
+        channel['messages'] += 1
+        self.notifications.put((dict(channel), state))
+
+    def _deliver_notifications(self):
+        """Post the queued notifications to their channels' addresses, in order, one at a time."""
+        while True:
+            item = self.notifications.get()
+            if item is None:
+                return
+            channel, state = item
+            if int(channel['expiration']) / 1000 < time.time():
+                with self.lock:
+                    self.channels.pop(channel['id'], None)
+                continue
+            headers = {'X-Goog-Channel-ID': channel['id'], 'X-Goog-Channel-Expiration': channel['expiration'],
+                       'X-Goog-Message-Number': str(channel['messages']), 'X-Goog-Resource-ID': channel['resourceId'],
+                       'X-Goog-Resource-URI': channel['resourceUri'], 'X-Goog-Resource-State': state}
+            if 'token' in channel:
+                headers['X-Goog-Channel-Token'] = channel['token']
+            try:
+                urlopen(Request(channel['address'], data=b'', headers=headers, method='POST'), timeout=10).close()
+            except OSError as e:
+                logging.info(f"Could not deliver a notification to {channel['address']}: {e}")
+
+    @staticmethod
+    def _check_etag(resource, headers):
+        expected = headers.get('if-match')
+        if expected and expected != resource['etag']:
+            raise ApiError(412, "Precondition Failed")
+
+    # Queries
+
+    def _instances(self, events, master, time_min, time_max):
+        """Occurrences of a recurring master in the window, with edited instances in place of their originals."""
+        exceptions = Calendar.index_recurrence_exceptions(
+            master, [item for item in events.values() if item.get('recurringEventId') == master['id']])
+        for instance in Calendar.expand_recurring_instances(master, exceptions, time_min, time_max):
+            stored = events.get(instance.event_id)
+            if stored is not None:
+                yield stored
+                continue
+            resource = {key: value for key, value in master.items() if key not in ('id', 'recurrence')}
+            resource.update(id=instance.event_id, recurringEventId=master['id'],
+                            start=_time_object(instance.start_time, instance.daylong),
+                            end=_time_object(instance.end_time, instance.daylong),
+                            originalStartTime=_time_object(instance.start_time, instance.daylong))
+            yield resource
+
+    def _matches(self, resource, params, time_min, time_max):
+        if 'iCalUID' in params and resource.get('iCalUID') != params['iCalUID']:
+            return False
+        if resource.get('status') == 'cancelled' and params.get('showDeleted') != 'true' \
+                and 'syncToken' not in params:
+            return False
+        if time_min or time_max:
+            start, end = _bounds(resource, self.time_zone)
+            if (time_min and end <= time_min) or (time_max and start >= time_max):
+                return False
+        if 'q' in params:
+            text = params['q'].lower()
+            haystack = [resource.get(name) or '' for name in ('summary', 'description', 'location')]
+            haystack += [attendee.get('email', '') for attendee in resource.get('attendees', [])]
+            if not any(text in value.lower() for value in haystack):
+                return False
+        for condition in params.get('privateExtendedProperty', []):
+            key, _, value = condition.partition('=')
+            if resource.get('extendedProperties', {}).get('private', {}).get(key) != value:
+                return False
+        return True
+
+    def _query(self, calendar_id, params):
+        """Every event matching a list request, computed once per query and version of the data."""
+        key = (calendar_id, tuple(sorted((name, str(value)) for name, value in params.items()
+                                         if name not in PAGE_PARAMETERS)), self.version)
+        cached = self._queries.get(key)
+        if cached is not None:
+            return cached
+        events = self._events(calendar_id)
+        time_min = as_utc(parse_datetime(params['timeMin'])) if 'timeMin' in params else None
+        time_max = as_utc(parse_datetime(params['timeMax'])) if 'timeMax' in params else None
+        if 'syncToken' in params:
+            try:
+                since = int(params['syncToken'])
+            except ValueError:
+                raise ApiError(410, "Sync token is no longer valid, a full sync is required.", 'fullSyncRequired')
+            candidates = [resource for event_id, resource in events.items()
+                          if self.changed_at[(calendar_id, event_id)] > since]
+        elif params.get('singleEvents') == 'true':
+            candidates = []
+            for resource in events.values():
+                if 'recurrence' in resource:
+                    candidates.extend(self._instances(events, resource, time_min, time_max))
+                elif 'recurringEventId' not in resource:
+                    candidates.append(resource)
+        else:
+            candidates = events.values()
+        items = [resource for resource in candidates if self._matches(resource, params, time_min, time_max)]
+        if params.get('orderBy') == 'startTime':
+            items.sort(key=lambda resource: _bounds(resource, self.time_zone)[0])
+        self._queries = {key: items}
+        return items
+
+    def _page(self, items, params, extra=None):
+        size = min(int(params.get('maxResults', 250)), self.max_page_size)
+        offset = int(params.get('pageToken', 0))
+        result = dict(extra or {}, kind='calendar#events', items=items[offset:offset + size])
+        if offset + size < len(items):
+            result['nextPageToken'] = str(offset + size)
+        else:
+            result['nextSyncToken'] = str(self.version)
+        return result
+
+    # Dispatch
+
+    def handle(self, method, path, params, headers, body):
+        """Serve one API request; returns (status, response headers, JSON body or None)."""
+        with self.lock:
+            self.request_count += 1
+            if self.failures:
+                status, reason = self.failures.pop(0)
+                raise ApiError(status, STATUS_TEXT.get(status, 'Error'), reason)
+            if self.error_rate and self.random.random() < self.error_rate:
+                raise ApiError(503, "Backend Error")
+            if not path.startswith(SERVICE_PATH):
+                raise ApiError(404, f"Unknown path {path}")
+            parts = [unquote(part) for part in path[len(SERVICE_PATH):].strip('/').split('/')]
+            status, response = self._route(method, parts, params, headers, body)
+        if 'fields' in params and response is not None:
+            response = select_fields(response, parse_fields(params['fields']))
+        response_headers = {'ETag': response['etag']} if isinstance(response, dict) and 'etag' in response else {}
+        return status, response_headers, response
+
+    def _route(self, method, parts, params, headers, body):
+        if parts == ['users', 'me', 'calendarList'] and method == 'GET':
+            return 200, {'kind': 'calendar#calendarList',
+                         'items': [{'id': calendar_id, 'summary': calendar_id, 'accessRole': 'owner',
+                                    'primary': calendar_id == 'primary'} for calendar_id in self.calendars]}
+        if parts == ['users', 'me', 'settings', 'timezone'] and method == 'GET':
+            etag = f'"{self.time_zone}"'
+            if headers.get('if-none-match') == etag:
+                return 304, None
+            return 200, {'kind': 'calendar#setting', 'etag': etag, 'id': 'timezone', 'value': self.time_zone}
+        if parts == ['freeBusy'] and method == 'POST':
+            return 200, self._freebusy(body)
+        if parts == ['channels', 'stop'] and method == 'POST':
+            channel = self.channels.get(body.get('id'))
+            if channel is None or channel['resourceId'] != body.get('resourceId'):
+                raise ApiError(404, f"Channel {body.get('id')} not found")
+            del self.channels[body['id']]
+            return 204, None
+        if len(parts) < 3 or parts[0] != 'calendars' or parts[2] != 'events':
+            raise ApiError(404, "Not Found")
+        calendar_id, rest = parts[1], parts[3:]
+        if not rest:
+            if method == 'GET':
+                return 200, self._page(self._query(calendar_id, params), params)
+            if method == 'POST':
+                if body.get('id') in self._events(calendar_id):
+                    raise ApiError(409, "The requested identifier already exists.")
+                return 200, self._store(calendar_id, dict(body))
+        elif rest == ['import'] and method == 'POST':
+            existing = next((resource for resource in self._events(calendar_id).values()
+                             if resource.get('iCalUID') == body.get('iCalUID')), None)
+            if existing is not None:
+                body = dict(body, id=existing['id'])
+            return 200, self._store(calendar_id, dict(body))
+        elif rest == ['watch'] and method == 'POST':
+            return 200, self._watch(calendar_id, body)
+        elif rest == ['quickAdd'] and method == 'POST':
+            start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            return 200, self._store(calendar_id, {'summary': params.get('text', ''),
+                                                  'start': {'dateTime': start.isoformat()},
+                                                  'end': {'dateTime': (start + timedelta(hours=1)).isoformat()}})
+        elif len(rest) == 2 and rest[1] == 'instances' and method == 'GET':
+            master = self._get(calendar_id, rest[0])
+            if 'recurrence' not in master:
+                raise ApiError(400, "The event is not recurring.")
+            time_min = as_utc(parse_datetime(params['timeMin'])) if 'timeMin' in params else None
+            time_max = as_utc(parse_datetime(params['timeMax'])) if 'timeMax' in params else None
+            items = list(self._instances(self._events(calendar_id), master, time_min, time_max))
+            return 200, self._page(items, params)
+        elif len(rest) == 1:
+            resource = self._get(calendar_id, rest[0])
+            if method == 'GET':
+                if headers.get('if-none-match') == resource['etag']:
+                    return 304, None
+                return 200, resource
+            self._check_etag(resource, headers)
+            if method == 'PUT':
+                kept = {key: resource[key] for key in ('id', 'iCalUID', 'created', 'recurringEventId')
+                        if key in resource}
+                return 200, self._store(calendar_id, dict(body, **kept))
+            if method == 'PATCH':
+                return 200, self._store(calendar_id, _merge(resource, body))
+            if method == 'DELETE':
+                if resource['status'] == 'cancelled':
+                    raise ApiError(410, "Resource has been deleted")
+                self._store(calendar_id, dict(resource, status='cancelled'))
+                return 204, None
+        raise ApiError(400, f"Unsupported request {method} {'/'.join(parts)}")
+
+    def _freebusy(self, body):
+        time_min, time_max = as_utc(parse_datetime(body['timeMin'])), as_utc(parse_datetime(body['timeMax']))
+        calendars = {}
+        for item in body.get('items', []):
+            calendar_id = item['id']
+            if calendar_id not in self.calendars:
+                calendars[calendar_id] = {'errors': [{'domain': 'global', 'reason': 'notFound'}], 'busy': []}
+                continue
+            items = self._query(calendar_id, {'timeMin': body['timeMin'], 'timeMax': body['timeMax'],
+                                              'singleEvents': 'true', 'orderBy': 'startTime'})
+            busy = [_bounds(resource, self.time_zone) for resource in items
+                    if resource.get('transparency') != 'transparent']
+            calendars[calendar_id] = {'busy': [{'start': max(start, time_min).isoformat(),
+                                                'end': min(end, time_max).isoformat()} for start, end in busy]}
+        return {'kind': 'calendar#freeBusy', 'timeMin': body['timeMin'], 'timeMax': body['timeMax'],
+                'calendars': calendars}
+
+    def handle_batch(self, content_type, body):
+        """Serve a multipart/mixed batch request; returns the response body and its content type."""
+        message = email.parser.BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload().replace('\r\n', '\n').partition('\n')
+            head, _, part_body = rest.partition('\n\n')
+            method, target, _ = request_line.split(' ', 2)
+            url = urlsplit(target)
+            part_headers = email.parser.Parser().parsestr(head + '\n\n', headersonly=True)
+            status, headers, response = self._serve_json(method, url.path, url.query,
+                                                         {key.lower(): value for key, value in part_headers.items()},
+                                                         part_body.encode())
+            lines = [f"--{boundary}", "Content-Type: application/http",
+                     f"Content-ID: <response-{part['Content-ID'][1:]}", "",
+                     f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", "Content-Type: application/json"]
+            lines += [f"{name}: {value}" for name, value in headers.items()]
+            lines += ["", json.dumps(response) if response is not None else ""]
+            parts.append("\r\n".join(lines))
+        parts.append(f"--{boundary}--\r\n")
+        return "\r\n".join(parts).encode(), f"multipart/mixed; boundary={boundary}"
+
+    def _serve_json(self, method, path, query, headers, body):
+        params = {}
+        for name, values in parse_qs(query).items():
+            params[name] = values if name == 'privateExtendedProperty' else values[-1]
+        try:
+            request = json.loads(body) if body else {}
+            return self.handle(method, path, params, headers, request)
+        except ApiError as e:
+            return e.status, {}, e.to_json()
+        except (KeyError, TypeError, ValueError) as e:
+            error = ApiError(400, f"Bad Request: {e}")
+            return error.status, {}, error.to_json()
+
+
+def _merge(resource, patch):
+    merged = dict(resource)
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; with Nagle's algorithm every keep-alive response would stall
+    disable_nagle_algorithm = True
+
+    def _serve(self):
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        url = urlsplit(self.path)
+        if url.path == BATCH_PATH and self.command == 'POST':
+            with fake.lock:
+                fake.request_count += 1
+            content, content_type = fake.handle_batch(self.headers.get('Content-Type', ''), body)
+            status, headers = 200, {'Content-Type': content_type}
+        elif url.path == DISCOVERY_PATH and self.command == 'GET':
+            content = fake.discovery_content()
+            status, headers = 200, {'Content-Type': 'application/json; charset=UTF-8'}
+        else:
+            status, headers, response = fake._serve_json(self.command, url.path, url.query,
+                                                         {key.lower(): value for key, value in self.headers.items()},
+                                                         body)
+            content = json.dumps(response).encode() if response is not None else b''
+            headers['Content-Type'] = 'application/json; charset=UTF-8'
+        with fake.lock:
+            fake.bytes_sent += len(content)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _serve
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Calendar v3 API.")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--events', type=int, default=1000, help="Events generated in the primary calendar.")
+    parser.add_argument('--latency', type=float, default=0, help="Seconds added to every request.")
+    parser.add_argument('--error-rate', type=float, default=0, help="Share of requests failing with a 503.")
+    parser.add_argument('--page-size', type=int, default=2500, help="Most events returned per page.")
+    parser.add_argument('--time-zone', default='UTC', help="Time zone of the user's calendar settings.")
+    arguments = parser.parse_args()
+    server = FakeCalendarServer(port=arguments.port, latency=arguments.latency, error_rate=arguments.error_rate,
+                                max_page_size=arguments.page_size, time_zone=arguments.time_zone)
+    server.add_events(generate_events(arguments.events))
+    print(f"Serving the Calendar API on {server.api_root}; run the CLI with GCAL_API_ROOT={server.api_root}")
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,157 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+RETRY_BUCKETS = (0, 1, 2, 3, 5, 8)
+
+
+class Histogram:
+    """Prometheus-style histogram: a count per upper bound, plus the total count, sum and maximum."""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+
+class Instrumentation:
+    """
+    Histograms of where the time and bytes of Calendar API calls go.
+
+    Calendar times its phases with timed(): 'auth' (loading or refreshing
+    credentials), 'build' (the API service), 'call' (an API method including
+    throttling and retries), 'http' (one HTTP round trip) and 'decode' (turning
+    responses into models). Payload sizes and retries per call are recorded with
+    observe(). The data can be exported as Prometheus text or a per-phase
+    breakdown, and every timed phase also becomes an OpenTelemetry span once
+    enable_opentelemetry() has been called.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.tracer = None
+        self.lock = threading.Lock()
+
+    def enable_opentelemetry(self):
+        """Report phases as OpenTelemetry spans; returns False when the opentelemetry package is missing."""
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            return False
+        self.tracer = trace.get_tracer('google_calendar_cli')
+        return True
+
+    def observe(self, metric, value, buckets, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timed(self, phase, **labels):
+        """Time the enclosed block as `phase`, in the 'phase_duration_seconds' histogram."""
+        span = self.tracer.start_as_current_span(f"calendar.{phase}", attributes=labels) if self.tracer \
+            else nullcontext()
+        start = time.perf_counter()
+        with span:
+            try:
+                yield
+            finally:
+                self.observe('phase_duration_seconds', time.perf_counter() - start, DURATION_BUCKETS,
+                             phase=phase, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def to_prometheus(self, counters=None, prefix='gcal_'):
+        """
+        Render the histograms, and optionally a dict of counter name -> value,
+        in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            items = sorted(self.histograms.items())
+        declared = set()
+        for (metric, labels), histogram in items:
+            name = prefix + metric
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            separator = "," if label_text else ""
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label_text}{separator}le="{bound}"}} {cumulative}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{name}_sum{suffix} {histogram.sum}")
+            lines.append(f"{name}_count{suffix} {histogram.count}")
+        for counter, value in (counters or {}).items():
+            lines.append(f"# TYPE {prefix}{counter}_total counter")
+            lines.append(f"{prefix}{counter}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def breakdown(self, counters=None):
+        """Human-readable table of the time spent per phase and the payload bytes, then the `counters`."""
+        with self.lock:
+            items = list(self.histograms.items())
+        phases = {}
+        payload = {}
+        for (metric, labels), histogram in items:
+            labels = dict(labels)
+            if metric == 'phase_duration_seconds':
+                totals = phases.setdefault(labels['phase'], [0, 0.0, 0.0])
+                totals[0] += histogram.count
+                totals[1] += histogram.sum
+                totals[2] = max(totals[2], histogram.max)
+            elif metric == 'payload_bytes':
+                totals = payload.setdefault(labels['direction'], [0, 0])
+                totals[0] += histogram.count
+                totals[1] += histogram.sum
+        lines = [f"{'phase':<8}{'calls':>8}{'total ms':>12}{'mean ms':>12}{'max ms':>12}"]
+        for phase, (count, total, longest) in sorted(phases.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{phase:<8}{count:>8}{total * 1000:>12.1f}{total * 1000 / count:>12.1f}"
+                         f"{longest * 1000:>12.1f}")
+        for direction, (count, total) in sorted(payload.items()):
+            lines.append(f"{direction} {total} bytes in {count} HTTP messages")
+        if counters:
+            lines.append(", ".join(f"{counter} {value}" for counter, value in counters.items()))
+        return "\n".join(lines)
+
+
+class InstrumentedHttp:
+    """
+    Wrapper of an httplib2-compatible HTTP object that times every round trip and
+    records the bytes sent and received (after decompression).
+    """
+
+    def __init__(self, http, instrumentation):
+        self.http = http
+        self.instrumentation = instrumentation
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        with self.instrumentation.timed('http', method=method):
+            response, content = self.http.request(uri, method, body, headers, *args, **kwargs)
+        if body:
+            self.instrumentation.observe('payload_bytes', len(body), BYTES_BUCKETS, direction='sent')
+        self.instrumentation.observe('payload_bytes', len(content or b''), BYTES_BUCKETS, direction='received')
+        return response, content
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
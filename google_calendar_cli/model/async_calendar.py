@@ -0,0 +1,189 @@
+import asyncio
+import logging
+from urllib.parse import quote
+
+import httpx
+
+from config import SCOPES, CALENDAR_API_ROOT, DEFAULT_PAGE_SIZE, MAX_CONNECTIONS
+from instrumentation import BYTES_BUCKETS
+from model.calendar import Calendar
+from model.event import Event, fields_mask
+from model.recurring_event import RecurringEvent
+
+try:
+    import h2  # noqa: F401 -- only needed to enable HTTP/2
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# httpx logs every request at INFO, which would flood the CLI's INFO-level output
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+class AsyncCalendar:
+    """
+    Asynchronous counterpart of Calendar, built on a shared httpx connection pool.
+
+    All requests go through one AsyncClient with keep-alive (and HTTP/2 when the
+    h2 package is installed), so thousands of calendar operations can run
+    concurrently from a single event loop. Credentials and the request scheduler
+    are borrowed from a synchronous Calendar, so both clients share one quota.
+
+    Use it as an async context manager, or call aclose() when done:
+
+        async with AsyncCalendar() as calendar:
+            event = await calendar.fetch_event_by_id(event_id)
+    """
+
+    def __init__(self, scopes=None, calendar=None, api_root=CALENDAR_API_ROOT, max_connections=MAX_CONNECTIONS):
+        self.calendar = calendar if calendar else Calendar(scopes if scopes else SCOPES)
+        self.client = httpx.AsyncClient(
+            base_url=api_root,
+            http2=HTTP2,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            # Google only compresses responses for user agents that mention gzip
+            headers={'Accept-Encoding': 'gzip', 'User-Agent': 'google-calendar-cli (gzip)'},
+            timeout=30)
+        self._creds = None
+        self._auth_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _token(self):
+        creds = self._creds
+        if creds is None or not creds.valid:
+            async with self._auth_lock:
+                # Requests that waited for the lock find the credentials another one loaded
+                creds = self._creds
+                if creds is None or not creds.valid:
+                    # Loading or refreshing blocks on disk and network, so keep it off the event loop
+                    creds = self._creds = await asyncio.to_thread(lambda: self.calendar.credentials)
+        return creds.token
+
+    async def _request(self, method, path, **kwargs):
+        instrumentation = self.calendar.instrumentation
+
+        async def send():
+            headers = {'Authorization': f'Bearer {await self._token()}'}
+            with instrumentation.timed('http', method=method):
+                response = await self.client.request(method, path, headers=headers, **kwargs)
+            instrumentation.observe('payload_bytes', len(response.content), BYTES_BUCKETS, direction='received')
+            response.raise_for_status()
+            return response
+
+        response = await self.calendar.scheduler.execute_async(send, method=method)
+        return response.json() if response.content else None
+
+    @staticmethod
+    def _events_path(calendar_id, event_id=None, suffix=None):
+        path = f"calendars/{quote(calendar_id, safe='')}/events"
+        if event_id:
+            path += f"/{quote(event_id, safe='')}"
+        if suffix:
+            path += f"/{suffix}"
+        return path
+
+    @staticmethod
+    def _from_json(json_event):
+        if "recurringEventId" in json_event:
+            return RecurringEvent.from_json(json_event)
+        return Event.from_json(json_event)
+
+    async def get_event_list(self, option, page_size=DEFAULT_PAGE_SIZE, calendar_id='primary',
+                             fields=Event.JSON_FIELDS):
+        """Asynchronously yield the events of the given period, one page at a time."""
+        # The time zone may need a (blocking) settings request the first time
+        time_min, time_max = await asyncio.to_thread(self.calendar.time_ranges, option)
+        try:
+            params = {'timeMin': time_min, 'timeMax': time_max, 'singleEvents': 'true',
+                      'orderBy': 'startTime', 'maxResults': page_size}
+            mask = fields_mask(fields, 'nextPageToken')
+            if mask:
+                params['fields'] = mask
+            while True:
+                events_result = await self._request('GET', self._events_path(calendar_id), params=params)
+                for json_event in events_result.get('items', []):
+                    yield self._from_json(json_event)
+                page_token = events_result.get('nextPageToken')
+                if not page_token:
+                    break
+                params['pageToken'] = page_token
+        except httpx.HTTPError as e:
+            logging.info(f"An error occurred: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+
+    async def fetch_event_by_id(self, event_id, calendar_id='primary', fields=Event.JSON_FIELDS):
+        try:
+            mask = fields_mask(fields)
+            json_event = await self._request('GET', self._events_path(calendar_id, event_id),
+                                             params={'fields': mask} if mask else None)
+            return self._from_json(json_event)
+        except httpx.HTTPError as e:
+            logging.info(f"An error occurred: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+
+    async def add_event(self, event: Event, calendar_id='primary'):
+        try:
+            return await self._request('POST', self._events_path(calendar_id), json=event.to_json())
+        except httpx.HTTPError as e:
+            logging.info(f"An error occurred: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+
+    async def update_event(self, event, calendar_id='primary'):
+        try:
+            return await self._request('PUT', self._events_path(calendar_id, event.event_id), json=event.to_json())
+        except httpx.HTTPError as e:
+            logging.info(f"An error occurred: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+
+    async def delete_event(self, event_id, calendar_id='primary'):
+        try:
+            await self._request('DELETE', self._events_path(calendar_id, event_id))
+        except httpx.HTTPError as e:
+            logging.info(f"An error occurred: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+
+    async def _list_all(self, path, params):
+        items = []
+        while True:
+            result = await self._request('GET', path, params=params)
+            items.extend(result.get('items', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return items
+            params = dict(params, pageToken=page_token)
+
+    async def get_recurring_instances(self, event_id, time_min=None, time_max=None, calendar_id='primary'):
+        """Return the instances of a recurring event, expanded locally like Calendar.get_recurring_instances."""
+        try:
+            master_params = {'fields': fields_mask(Calendar.MASTER_FIELDS)}
+            master = await self._request('GET', self._events_path(calendar_id, event_id), params=master_params)
+            if "recurringEventId" in master:
+                master = await self._request('GET', self._events_path(calendar_id, master['recurringEventId']),
+                                             params=master_params)
+            if not Calendar.can_expand_locally(master):
+                items = await self._list_all(self._events_path(calendar_id, master['id'], 'instances'),
+                                             {'maxResults': 2500,
+                                              'fields': fields_mask(Event.JSON_FIELDS, 'nextPageToken')})
+                return [RecurringEvent.from_json(item) for item in items]
+            items = await self._list_all(self._events_path(calendar_id),
+                                         {'iCalUID': master['iCalUID'], 'showDeleted': 'true',
+                                          'fields': fields_mask(Calendar.EXCEPTION_FIELDS, 'nextPageToken')})
+            exceptions = Calendar.index_recurrence_exceptions(master, items)
+            return Calendar.expand_recurring_instances(master, exceptions, time_min, time_max)
+        except httpx.HTTPError as e:
+            logging.info(f"An error occurred: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
@@ -1,38 +1,228 @@
+import copy
 import os
-import typer
+import threading
+import time
 import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytz
+from google_auth_httplib2 import AuthorizedHttp
 
 from google.auth.exceptions import GoogleAuthError
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
 from googleapiclient.errors import HttpError
-from config import SCOPES
-from model.event import Event
-from model.recurring_event import RecurringEvent
-from utility import get_time_ranges
+from googleapiclient.http import build_http
+from config import SCOPES, TOKEN_REFRESH_MARGIN, DEFAULT_PAGE_SIZE, BATCH_SIZE, BATCH_RETRIES, MAX_WORKERS, \
+    RECURRENCE_HORIZON, RESPONSE_CACHE_FILE, CALENDAR_API_ROOT, GOOGLE_CALENDAR_API_ROOT, TIME_ZONE_MAX_AGE, \
+    CREDENTIALS_FILE, TOKEN_FILE
+from model.event import Event, parse_datetime, fields_mask
+from model.recurring_event import RecurrenceRule, RecurringEvent
+from model.event_batch import EventBatch
+from utility import get_time_ranges, period_window, as_utc, IntervalSet, change_attendees
+from discovery_cache import load_discovery_document, bundled_document
+from scheduler import RequestScheduler, BULK, is_retryable
+from response_cache import ResponseCache
+from instrumentation import Instrumentation, InstrumentedHttp
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
 
+def _instant(boundary):
+    value = (boundary or {}).get('dateTime') or (boundary or {}).get('date')
+    return as_utc(parse_datetime(value)) if value else None
+
+
+def _is_same_event(existing, body):
+    """
+    Whether the event found under the id of an insert is the event that insert sends.
+
+    An insert is only sent again when the response to an earlier attempt was lost, so an
+    event created by that attempt has the iCalUID (when the insert sets one), title, start
+    and end sent; an unrelated event that happens to use the id does not.
+    """
+    if 'iCalUID' in body and existing.get('iCalUID') != body['iCalUID']:
+        return False
+    return existing.get('summary') == body.get('summary') and \
+        all(_instant(existing.get(name)) == _instant(body.get(name)) for name in ('start', 'end'))
+
+
+class SyncTokenExpiredError(Exception):
+    """Raised when the server answers 410 Gone to an incremental sync; a full sync is required."""
+
+
 class Calendar:
-    def __init__(self, scopes=None):
+    # Partial responses of the read paths: what the models and the recurrence expansion consume
+    MASTER_FIELDS = RecurringEvent.JSON_FIELDS + ('iCalUID',)
+    EXCEPTION_FIELDS = Event.JSON_FIELDS + ('status', 'originalStartTime')
+    # The event cache also keeps private extended properties, so searches can filter on them offline
+    SYNC_FIELDS = Event.JSON_FIELDS + ('status', 'extendedProperties/private')
+
+    def __init__(self, scopes=None, instrumentation=None, api_root=CALENDAR_API_ROOT):
         self.scopes = scopes if scopes else SCOPES
+        self.api_root = api_root
+        self._creds = None
+        self._service = None
+        self._response_cache = None
+        self._time_zone = None
+        self._local = threading.local()
+        self.instrumentation = instrumentation if instrumentation else Instrumentation()
+        self.scheduler = RequestScheduler(instrumentation=self.instrumentation)
+        self.build_count = 0
+        self.refresh_count = 0
+        # Absolute, so the token and caches stay where they were found whatever directory a command runs in
+        self.token_file = os.path.abspath(TOKEN_FILE)
+        self.credentials_file = os.path.abspath(CREDENTIALS_FILE)
+        self.response_cache_file = os.path.abspath(RESPONSE_CACHE_FILE)
+
+    @property
+    def credentials(self):
+        """Authenticated credentials, loaded once and refreshed shortly before they expire."""
+        if self._creds is None:
+            with self.instrumentation.timed('auth'):
+                self._creds = self.authenticate_google_calendar()
+        elif self._needs_refresh(self._creds):
+            with self.instrumentation.timed('auth'):
+                self._refresh_credentials(self._creds)
+        return self._creds
+
+    @property
+    def service(self):
+        """Calendar v3 service, built on first use and shared by every call on this Calendar."""
+        creds = self.credentials
+        if self._service is None:
+            with self.instrumentation.timed('build'):
+                http = self._instrumented_http(creds)
+                document = self._discovery_document()
+                if document:
+                    self._service = build_from_document(document, http=http)
+                else:
+                    self._service = build('calendar', 'v3', http=http)
+            self.build_count += 1
+        return self._service
+
+    def _discovery_document(self):
+        if self.api_root == GOOGLE_CALENDAR_API_ROOT:
+            return load_discovery_document()
+        # A stand-in server (see fake_server.py) gets the document bundled with the client library, pointed at it
+        document = bundled_document()
+        document['rootUrl'] = self.api_root[:-len(document['servicePath'])]
+        return document
+
+    def _instrumented_http(self, creds):
+        return InstrumentedHttp(AuthorizedHttp(creds, http=build_http()), self.instrumentation)
+
+    @property
+    def response_cache(self):
+        """On-disk cache of fetched events, opened on first use."""
+        if self._response_cache is None:
+            self._response_cache = ResponseCache(self.response_cache_file)
+        return self._response_cache
+
+    @property
+    def time_zone(self):
+        """
+        IANA time zone of the user's calendar settings, in which period expressions are resolved.
+
+        It is kept in the response cache and only revalidated once TIME_ZONE_MAX_AGE
+        has passed, so resolving a period normally costs no request. Falls back to UTC.
+        """
+        if self._time_zone is None:
+            self._time_zone = self._load_time_zone()
+        return self._time_zone
+
+    @time_zone.setter
+    def time_zone(self, value):
+        self._time_zone = value
+
+    def _load_time_zone(self):
+        resource, mask = 'settings/timezone', 'etag,value'
+        cached = self.response_cache.body(resource, mask)
+        if cached and time.time() - cached.get('fetched_at', 0) < TIME_ZONE_MAX_AGE:
+            return cached['value']
+        try:
+            request = self.service.settings().get(setting='timezone', fields=mask)
+            etag = self.response_cache.etag(resource, mask)
+            if etag and cached:
+                request.headers['If-None-Match'] = etag
+            try:
+                setting = self.scheduler.execute(request)
+            except HttpError as e:
+                if e.resp.status != 304 or not cached:
+                    raise
+                setting = cached
+            self.response_cache.put(resource, mask, setting.get('etag'), dict(setting, fetched_at=time.time()))
+            return setting['value']
+        except HttpError as e:
+            logging.info(f"An error occurred: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+        return cached['value'] if cached else 'UTC'
+
+    def time_ranges(self, option):
+        """timeMin and timeMax of a period expression in the calendar's time zone, or of a (start, end) pair."""
+        return get_time_ranges(option, self.time_zone if isinstance(option, str) else None)
+
+    def _invalidate_cached(self, *event_ids):
+        if self._response_cache is not None or os.path.exists(self.response_cache_file):
+            for event_id in event_ids:
+                self.response_cache.invalidate(f"primary/{event_id}")
+
+    def thread_http(self):
+        """
+        Authorized HTTP object private to the calling thread.
+
+        httplib2 is not thread-safe, so requests executed from worker threads must
+        pass this to execute() instead of using the service's shared connection.
+        """
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = self._instrumented_http(self.credentials)
+        return http
+
+    @staticmethod
+    def _needs_refresh(creds):
+        if not creds or not creds.refresh_token:
+            return False
+        if creds.expiry is None:
+            return not creds.valid
+        return creds.expiry - datetime.utcnow() <= TOKEN_REFRESH_MARGIN
+
+    def _refresh_credentials(self, creds):
+        try:
+            creds.refresh(Request())
+            self.refresh_count += 1
+            with open(self.token_file, 'w') as token:
+                token.write(creds.to_json())
+        except GoogleAuthError as e:
+            logging.error(f"An error occurred while refreshing the token: {e}")
+
+    def get_stats(self):
+        """Request counters of the scheduler, with how often the service was built and the credentials refreshed."""
+        return dict(self.scheduler.metrics, builds=self.build_count, refreshes=self.refresh_count)
 
     def authenticate_google_calendar(self):
         creds = None
+        if self.api_root != GOOGLE_CALENDAR_API_ROOT:
+            # Stand-in servers accept any token
+            return Credentials(token='stand-in')
         try:
-            if os.path.exists('token.json'):
-                creds = Credentials.from_authorized_user_file('token.json', self.scopes)
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
+            if os.path.exists(self.token_file):
+                creds = Credentials.from_authorized_user_file(self.token_file, self.scopes)
+            if not creds or not creds.valid or self._needs_refresh(creds):
+                if creds and creds.refresh_token:
                     creds.refresh(Request())
+                    self.refresh_count += 1
                 else:
+                    # Only needed for the first login, and slow to import
+                    from google_auth_oauthlib.flow import InstalledAppFlow
                     flow = InstalledAppFlow.from_client_secrets_file(
-                        'credentials.json', self.scopes)
+                        self.credentials_file, self.scopes)
                     creds = flow.run_local_server(port=0)
-                with open('token.json', 'w') as token:
+                with open(self.token_file, 'w') as token:
                     token.write(creds.to_json())
         except GoogleAuthError as e:
             logging.error(f"An error occurred during the authentication process: {e}")
@@ -40,149 +230,606 @@ class Calendar:
             logging.error(f"An unexpected error occurred: {e}")
         return creds
 
-    def get_event_list(self, option):
-        time_min, time_max = get_time_ranges(option)
-        creds = self.authenticate_google_calendar()
-        service = build('calendar', 'v3', credentials=creds)
+    def get_event_list(self, option, page_size=DEFAULT_PAGE_SIZE, calendar_id='primary', http=None,
+                       fields=Event.JSON_FIELDS, single_events=True, query=None, properties=None):
+        """
+        Yield the events of the given period, in start-time order, one page at a time.
+
+        Pages of `page_size` events are requested lazily by following nextPageToken,
+        so callers see the first events before later pages are downloaded and at most
+        one page is held in memory. Pass `http` when calling from a worker thread.
+        Only the event `fields` the models read are downloaded; pass '*' for full resources.
+        With `single_events` False, recurring events are returned once, with their
+        recurrence rule, instead of as instances, and the order is unspecified.
+        `option` is a period expression (see utility.period_window), resolved in the
+        calendar's time zone, or a (start, end) pair of aware datetimes; None lists
+        events of any time. `query` and `properties` are passed on as the `q` and
+        `privateExtendedProperty` filters of events().list.
+        """
         try:
-            events_result = service.events().list(
-                calendarId='primary',
-                timeMin=time_min,
-                timeMax=time_max,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            json_events = events_result.get('items', [])
-            events = []
-            for json_event in json_events:
-                if "recurringEventId" in json_event:
-                    events.append(RecurringEvent.from_json(json_event))
-                else:
-                    events.append(Event.from_json(json_event))
-            return events
+            for items in self._event_pages(option, page_size, calendar_id, http, fields, single_events, query,
+                                           properties):
+                with self.instrumentation.timed('decode'):
+                    events = [RecurringEvent.from_json(json_event)
+                              if "recurringEventId" in json_event or "recurrence" in json_event
+                              else Event.from_json(json_event)
+                              for json_event in items]
+                yield from events
         except HttpError as e:
             logging.info(f"An error occurred: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
 
-    def fetch_event_by_id(self, event_id):
-        creds = self.authenticate_google_calendar()
-        service = build('calendar', 'v3', credentials=creds)
+    def get_event_batch(self, option, page_size=DEFAULT_PAGE_SIZE, calendar_id='primary', http=None,
+                        fields=Event.JSON_FIELDS):
+        """
+        Download the events of the given period into an EventBatch, in start-time order.
+
+        The resources of every page are stored in the batch's columns rather than
+        decoded into Event objects, so a long period costs a fraction of the memory
+        of get_event_list's events when they are all kept.
+        """
+        batch = EventBatch()
         try:
-            json_event = service.events().get(calendarId='primary', eventId=event_id).execute()
-            print(json_event)
-            if "recurringEventId" in json_event:
-                event = (RecurringEvent.from_json(json_event))
-            else:
-                event = (Event.from_json(json_event))
-            return event
+            for items in self._event_pages(option, page_size, calendar_id, http, fields):
+                with self.instrumentation.timed('decode'):
+                    for json_event in items:
+                        batch.append_json(json_event)
         except HttpError as e:
             logging.info(f"An error occurred: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
+        return batch
+
+    def _event_pages(self, option, page_size, calendar_id, http, fields, single_events=True, query=None,
+                     properties=None):
+        """Yield the raw event resources of each page of events().list, following nextPageToken."""
+        time_min, time_max = self.time_ranges(option) if option is not None else (None, None)
+        service = self.service
+        page_token = None
+        while True:
+            events_result = self.scheduler.execute(service.events().list(
+                calendarId=calendar_id,
+                timeMin=time_min,
+                timeMax=time_max,
+                singleEvents=single_events,
+                orderBy='startTime' if single_events else None,
+                maxResults=page_size,
+                pageToken=page_token,
+                q=query,
+                privateExtendedProperty=properties,
+                fields=fields_mask(fields, 'nextPageToken')
+            ), http=http)
+            yield events_result.get('items', [])
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                return
+
+    def search_events(self, text=None, attendees=(), properties=(), option=None, page_size=DEFAULT_PAGE_SIZE,
+                      calendar_id='primary'):
+        """
+        Yield the events matching a search, letting the API filter them as far as it can.
 
-    def add_event(self, event: Event):
-        print(event.to_json())
-        creds = self.authenticate_google_calendar()
-        service = build('calendar', 'v3', credentials=creds)
+        `text` is sent as the free-text `q` filter and each 'key=value' of `properties`
+        as a `privateExtendedProperty` filter. The API cannot filter by attendee: without
+        `text` the first attendee is sent as `q`, and every attendee is checked on the
+        events returned.
+        """
+        attendees = {attendee.lower() for attendee in attendees}
+        query = text if text else next(iter(attendees), None)
+        for event in self.get_event_list(option, page_size, calendar_id, query=query,
+                                         properties=list(properties) or None):
+            if attendees <= {attendee.lower() for attendee in event.attendees}:
+                yield event
+
+    def get_calendar_ids(self):
+        """Return the ids of every calendar in the user's calendar list."""
+        service = self.service
         try:
-            json_event = service.events().insert(calendarId='primary', body=event.to_json()).execute()
-            return json_event
+            page_token = None
+            calendar_ids = []
+            while True:
+                request = service.calendarList().list(pageToken=page_token, fields='nextPageToken,items(id)')
+                result = self.scheduler.execute(request)
+                calendar_ids.extend(entry['id'] for entry in result.get('items', []))
+                page_token = result.get('nextPageToken')
+                if not page_token:
+                    return calendar_ids
         except HttpError as e:
             logging.info(f"An error occurred: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
+        return []
+
+    def get_merged_event_list(self, option, calendar_ids, page_size=DEFAULT_PAGE_SIZE, max_workers=MAX_WORKERS,
+                              fields=Event.JSON_FIELDS):
+        """
+        Fetch the events of several calendars concurrently and merge them by start time.
+
+        Each calendar is downloaded by a worker of a bounded thread pool on its own
+        HTTP connection, so the wall time follows the slowest calendar rather than
+        the sum. Each calendar is kept as an EventBatch; the batches are joined and
+        sorted by their start-time column, and Event objects are only built as the
+        merged events are iterated.
+        """
+        # Authenticate, build the service and resolve the period once, here: the workers
+        # must not issue requests of their own on the shared, non-thread-safe connection
+        self.service
+        window = period_window(option, self.time_zone) if isinstance(option, str) else option
 
-    def update_event(self, event):
-        creds = self.authenticate_google_calendar()
-        service = build('calendar', 'v3', credentials=creds)
+        def fetch(calendar_id):
+            return self.get_event_batch(window, page_size, calendar_id, self.thread_http(), fields)
+
+        merged = EventBatch()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calendar_ids)))) as pool:
+            for batch in pool.map(fetch, calendar_ids):
+                merged.extend(batch)
+        return iter(merged.sorted_by_start())
+
+    def get_ical_uids(self, calendar_id='primary'):
+        """Yield the iCalUID of every event of a calendar, downloading nothing else."""
+        service = self.service
+        page_token = None
+        while True:
+            request = service.events().list(calendarId=calendar_id, pageToken=page_token, maxResults=2500,
+                                            fields='nextPageToken,items(iCalUID)')
+            result = self.scheduler.execute(request, priority=BULK)
+            for item in result.get('items', []):
+                yield item['iCalUID']
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return
+
+    def sync_events(self, sync_token=None, calendar_id='primary', http=None, fields=SYNC_FIELDS):
+        """
+        Download raw event resources for a full or incremental sync.
+
+        Without a sync token every event of the calendar is returned; with one,
+        only the events changed since that token was issued, cancelled ones
+        included, each limited to `fields`. Returns a tuple of the items and the next sync token.
+        Raises SyncTokenExpiredError when the token is no longer valid.
+        """
+        service = self.service
         try:
-            json_event = service.events().update(calendarId='primary', eventId=event.event_id,
-                                                 body=event.to_json()).execute()
-            return json_event
+            page_token = None
+            items = []
+            while True:
+                request = service.events().list(calendarId=calendar_id, syncToken=sync_token, singleEvents=True,
+                                                pageToken=page_token, maxResults=2500,
+                                                fields=fields_mask(fields, 'nextPageToken', 'nextSyncToken'))
+                result = self.scheduler.execute(request, priority=BULK, http=http)
+                items.extend(result.get('items', []))
+                page_token = result.get('nextPageToken')
+                if not page_token:
+                    return items, result.get('nextSyncToken')
+        except HttpError as e:
+            if e.resp.status == 410:
+                raise SyncTokenExpiredError(str(e))
+            logging.info(f"An error occurred: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+        return None, None
+
+    def fetch_event_by_id(self, event_id, fields=Event.JSON_FIELDS):
+        """
+        Fetch an event, revalidating a cached copy with its ETag.
+
+        A cached event is requested with If-None-Match, so an unchanged one costs a
+        304 with no body and is served from the response cache.
+        """
+        service = self.service
+        resource, mask = f"primary/{event_id}", fields_mask(fields) or '*'
+        try:
+            request = service.events().get(calendarId='primary', eventId=event_id, fields=fields_mask(fields))
+            etag = self.response_cache.etag(resource, mask)
+            if etag:
+                request.headers['If-None-Match'] = etag
+            try:
+                json_event = self.scheduler.execute(request)
+                self.response_cache.put(resource, mask, json_event.get('etag'), json_event)
+            except HttpError as e:
+                if e.resp.status != 304 or not etag:
+                    raise
+                json_event = self.response_cache.body(resource, mask)
+            logging.debug("Fetched event: %s", json_event)
+            with self.instrumentation.timed('decode'):
+                if "recurringEventId" in json_event:
+                    event = (RecurringEvent.from_json(json_event))
+                else:
+                    event = (Event.from_json(json_event))
+            return event
         except HttpError as e:
             logging.info(f"An error occurred: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
 
     def add_attendees_to_event(self, event, attendees):
-        creds = self.authenticate_google_calendar()
-        service = build('calendar', 'v3', credentials=creds)
+        return self._change_attendees(event, add=attendees)
+
+    def remove_attendees_from_event(self, event, attendees):
+        return self._change_attendees(event, remove=attendees)
+
+    def _change_attendees(self, event, add=(), remove=()):
+        """
+        Patch the attendees of a fetched event, guarded by its ETag; nothing is sent when they stay the same.
+
+        The models only keep attendee emails, and a patch replaces the whole list, so the
+        full attendee resources are fetched first: everyone who stays keeps their response
+        status, optional flag and display name.
+        """
+        service = self.service
         try:
-            new_attendees = []
-            for attendee in event.attendees:
-                new_attendees.append({'email': attendee})
-            for attendee in attendees:
-                new_attendees.append({'email': attendee})
-            json_attendees = {
-                "attendees": new_attendees
-            }
-            json_event = service.events().patch(calendarId='primary', eventId=event.event_id,
-                                                body=json_attendees).execute()
+            current = self.scheduler.execute(service.events().get(calendarId='primary', eventId=event.event_id,
+                                                                  fields='etag,attendees'))
+            if event.etag and current.get('etag') != event.etag:
+                logging.error("The event was changed by someone else after it was fetched; nothing was updated.")
+                return None
+            new_attendees = change_attendees(current.get('attendees', []), add, remove)
+            if new_attendees is None:
+                logging.info("Nothing to update.")
+                return None
+            request = service.events().patch(calendarId='primary', eventId=event.event_id,
+                                             body={"attendees": new_attendees})
+            request.headers['If-Match'] = current['etag']
+            json_event = self.scheduler.execute(request)
+            self._invalidate_cached(event.event_id)
             return json_event
         except HttpError as e:
+            if e.resp.status == 412:
+                logging.error("The event was changed by someone else after it was fetched; nothing was updated.")
+                return None
             logging.info(f"An error occurred: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
 
-    def remove_attendees_from_event(self, event, attendees):
-        creds = self.authenticate_google_calendar()
-        service = build('calendar', 'v3', credentials=creds)
+    def query_freebusy(self, calendar_ids, time_min, time_max):
+        """
+        Return the busy intervals of several calendars or attendees.
+
+        All ids are sent in a single freebusy().query request. Returns a dict of
+        id -> list of (start, end) datetimes; ids the server could not look up
+        are logged and left out.
+        """
+        service = self.service
         try:
-            new_attendees = []
-            for attendee in event.attendees:
-                if attendee not in attendees:
-                    new_attendees.append({'email': attendee})
-            json_attendees = {
-                "attendees": new_attendees
+            body = {
+                "timeMin": as_utc(time_min).isoformat(),
+                "timeMax": as_utc(time_max).isoformat(),
+                "items": [{"id": calendar_id} for calendar_id in calendar_ids]
             }
-            json_event = service.events().patch(calendarId='primary', eventId=event.event_id,
-                                                body=json_attendees).execute()
-            return json_event
+            result = self.scheduler.execute(service.freebusy().query(body=body))
+            busy = {}
+            for calendar_id, calendar in result.get('calendars', {}).items():
+                for error in calendar.get('errors', []):
+                    logging.info(f"Could not get free/busy for {calendar_id}: {error.get('reason')}")
+                busy[calendar_id] = [(parse_datetime(interval['start']), parse_datetime(interval['end']))
+                                     for interval in calendar.get('busy', [])]
+            return busy
         except HttpError as e:
             logging.info(f"An error occurred: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
 
+    def find_free_slots(self, attendees, window, duration, limit=None):
+        """
+        Find the first free slots shared by every attendee.
+
+        Args:
+            attendees (List[str]): Email addresses or calendar ids; the primary calendar is always included.
+            window (tuple): (start, end) datetimes to search in.
+            duration (timedelta): Length of each slot.
+            limit (Optional[int]): Maximum number of slots to return.
+
+        Returns:
+            list: (start, end) tuples, in order, or None if the query failed.
+        """
+        window_start, window_end = as_utc(window[0]), as_utc(window[1])
+        busy = self.query_freebusy(['primary'] + list(attendees), window_start, window_end)
+        if busy is None:
+            return None
+        intervals = IntervalSet(interval for intervals in busy.values() for interval in intervals)
+        return list(intervals.free_slots(window_start, window_end, duration, limit))
+
+    def find_conflicts(self, event):
+        """
+        Return the calendars among the primary one and the event's attendees that are busy during the event.
+
+        For a recurring event only the first occurrence is checked.
+        """
+        start, end = as_utc(event.start_time), as_utc(event.end_time)
+        busy = self.query_freebusy(['primary'] + list(event.attendees), start, end) or {}
+        return [calendar_id for calendar_id, intervals in busy.items() if IntervalSet(intervals).overlaps(start, end)]
+
     def quick_add(self, text):
-        creds = self.authenticate_google_calendar()
-        service = build('calendar', 'v3', credentials=creds)
+        service = self.service
         try:
-            json_event = service.events().quickAdd(calendarId='primary',
-                                                   text=text).execute()
+            json_event = self.scheduler.execute(service.events().quickAdd(calendarId='primary', text=text))
             return json_event
         except HttpError as e:
             logging.info(f"An error occurred: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
 
-    def get_recurring_instances(self, event_id):
-        creds = self.authenticate_google_calendar()
-        service = build('calendar', 'v3', credentials=creds)
+    def get_recurring_instances(self, event_id, time_min=None, time_max=None):
+        """
+        Return the instances of a recurring event, in order.
+
+        Occurrences are expanded locally from the event's RRULE, and the network is
+        only used to fetch the event and its exceptions (edited, moved or cancelled
+        instances), which are overlaid on the expansion. Rules that cannot be
+        expanded locally fall back to paging through events().instances().
+        Rules without COUNT or UNTIL are expanded until RECURRENCE_HORIZON from now
+        unless time_max is given.
+        """
+        service = self.service
         try:
-            page_token = None
-            recurring_instances = []
-            while True:
-                typer.echo("page")
-                events = service.events().instances(calendarId='primary', eventId=event_id,
-                                                    pageToken=page_token).execute()
-                for event in events['items']:
-                    recurring_instances.append(RecurringEvent.from_json(event))
-                page_token = events.get('nextPageToken')
-                if not page_token:
-                    break
-            return recurring_instances
+            master_fields = fields_mask(self.MASTER_FIELDS)
+            request = service.events().get(calendarId='primary', eventId=event_id, fields=master_fields)
+            master = self.scheduler.execute(request)
+            if "recurringEventId" in master:
+                request = service.events().get(calendarId='primary', eventId=master['recurringEventId'],
+                                               fields=master_fields)
+                master = self.scheduler.execute(request)
+            if not self.can_expand_locally(master):
+                return self._fetch_recurring_instances(master['id'], time_min, time_max)
+            return self.expand_recurring_instances(master, self._fetch_recurrence_exceptions(master),
+                                                   time_min, time_max)
+        except HttpError as e:
+            logging.info(f"An error occurred: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred: {e}")
+
+    @staticmethod
+    def can_expand_locally(master):
+        """Whether the recurrence of an event resource is a single RRULE that RecurrenceRule can expand."""
+        recurrence = master.get('recurrence', [])
+        return len(recurrence) == 1 and recurrence[0].startswith("RRULE:") and \
+            RecurrenceRule.is_supported(recurrence[0][len("RRULE:"):])
+
+    @classmethod
+    def expand_recurring_instances(cls, master, exceptions, time_min=None, time_max=None):
+        """
+        Expand a recurring event resource into its instances and overlay the exceptions.
+
+        Args:
+            master (dict): The recurring event resource.
+            exceptions (dict): Original start (as UTC) -> edited or cancelled instance resource.
+            time_min, time_max (Optional[datetime]): Window to expand.
+        """
+        event = RecurringEvent.from_json(master)
+        rule = event.recurrence
+        if time_max is None and not (rule.count or rule.until):
+            time_max = datetime.now(timezone.utc) + RECURRENCE_HORIZON
+        occurrences = cls._expand_in_zone(rule, event, master['start'].get('timeZone'), time_min, time_max)
+
+        duration = event.end_time - event.start_time
+        recurring_instances = []
+        for occurrence in occurrences:
+            exception = exceptions.get(as_utc(occurrence))
+            if exception is None:
+                recurring_instances.append(RecurringEvent(
+                    event.title, occurrence, occurrence + duration, None, event.description, event.location,
+                    event.daylong, list(event.attendees), cls._instance_id(master['id'], occurrence, event.daylong),
+                    time_zone=event.time_zone, ical_uid=event.ical_uid))
+            elif exception.get('status') != 'cancelled':
+                recurring_instances.append(RecurringEvent.from_json(exception))
+        return recurring_instances
+
+    @staticmethod
+    def index_recurrence_exceptions(master, items):
+        """Map the original start (as UTC) of every edited or cancelled instance among `items` to its resource."""
+        exceptions = {}
+        for item in items:
+            original_start = item.get('originalStartTime')
+            if item.get('recurringEventId') == master['id'] and original_start:
+                start = parse_datetime(original_start.get('dateTime') or original_start.get('date'))
+                exceptions[as_utc(start)] = item
+        return exceptions
+
+    @staticmethod
+    def _expand_in_zone(rule, event, zone_name, time_min, time_max):
+        """
+        Expand the rule on the wall clock of the event's time zone, so occurrences keep
+        their local time across daylight saving changes.
+        """
+        dtstart = event.start_time
+        if event.daylong or not zone_name:
+            if time_max is None:
+                return (occurrence for occurrence in rule.iter_occurrences(dtstart)
+                        if time_min is None or as_utc(occurrence) >= as_utc(time_min))
+            return rule.between(dtstart, time_min or dtstart, time_max)
+
+        zone = pytz.timezone(zone_name)
+
+        def to_wall_clock(value):
+            return as_utc(value).astimezone(zone).replace(tzinfo=None)
+
+        local_rule = copy.copy(rule)
+        if rule.until and rule.until.tzinfo:
+            local_rule.until = to_wall_clock(rule.until)
+        local_start = to_wall_clock(dtstart)
+        if time_max is None:
+            local_occurrences = (occurrence for occurrence in local_rule.iter_occurrences(local_start)
+                                 if time_min is None or occurrence >= to_wall_clock(time_min))
+        else:
+            local_occurrences = local_rule.between(local_start, to_wall_clock(time_min or dtstart),
+                                                   to_wall_clock(time_max))
+        return (zone.localize(occurrence) for occurrence in local_occurrences)
+
+    @staticmethod
+    def _instance_id(event_id, occurrence, daylong):
+        if daylong:
+            return f"{event_id}_{occurrence:%Y%m%d}"
+        return f"{event_id}_{as_utc(occurrence).astimezone(timezone.utc):%Y%m%dT%H%M%SZ}"
+
+    def _fetch_recurrence_exceptions(self, master):
+        service = self.service
+        items = []
+        page_token = None
+        while True:
+            request = service.events().list(calendarId='primary', iCalUID=master['iCalUID'], showDeleted=True,
+                                            pageToken=page_token,
+                                            fields=fields_mask(self.EXCEPTION_FIELDS, 'nextPageToken'))
+            result = self.scheduler.execute(request)
+            items.extend(result.get('items', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return self.index_recurrence_exceptions(master, items)
+
+    def _fetch_recurring_instances(self, event_id, time_min=None, time_max=None):
+        service = self.service
+        page_token = None
+        recurring_instances = []
+        while True:
+            request = service.events().instances(calendarId='primary', eventId=event_id, pageToken=page_token,
+                                                 timeMin=as_utc(time_min).isoformat() if time_min else None,
+                                                 timeMax=as_utc(time_max).isoformat() if time_max else None,
+                                                 maxResults=2500,
+                                                 fields=fields_mask(Event.JSON_FIELDS, 'nextPageToken'))
+            events = self.scheduler.execute(request)
+            with self.instrumentation.timed('decode'):
+                recurring_instances.extend(RecurringEvent.from_json(event) for event in events['items'])
+            page_token = events.get('nextPageToken')
+            if not page_token:
+                return recurring_instances
+
+    def watch_events(self, address, calendar_id='primary', ttl=None, token=None):
+        """
+        Open a push notification channel for changes to the events of a calendar.
+
+        The API posts a notification to `address`, which must be an HTTPS URL on a
+        verified domain, whenever an event of the calendar changes; the notification
+        says that something changed, not what. `token` is sent back with every
+        notification and `ttl` asks for a channel lifetime in seconds. Returns the
+        channel resource, whose `expiration` is in milliseconds since the epoch.
+        """
+        body = {'id': uuid.uuid4().hex, 'type': 'web_hook', 'address': address}
+        if token:
+            body['token'] = token
+        if ttl:
+            body['params'] = {'ttl': str(int(ttl))}
+        try:
+            return self.scheduler.execute(self.service.events().watch(calendarId=calendar_id, body=body))
         except HttpError as e:
             logging.info(f"An error occurred: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
 
-    def delete_event(self, event_id):
-        creds = self.authenticate_google_calendar()
-        service = build('calendar', 'v3', credentials=creds)
+    def stop_channel(self, channel):
+        """Stop the notifications of a channel returned by watch_events."""
         try:
-            service.events().delete(calendarId='primary', eventId=event_id).execute()
+            self.scheduler.execute(self.service.channels().stop(
+                body={'id': channel['id'], 'resourceId': channel['resourceId']}))
         except HttpError as e:
             logging.info(f"An error occurred: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred: {e}")
+
+    def execute_batch(self, requests, retries=BATCH_RETRIES, max_retries=None):
+        """
+        Execute API requests in batches of at most BATCH_SIZE per HTTP round trip.
+
+        Args:
+            requests (list): (key, HttpRequest) pairs; keys identify the items in the result.
+            retries (int): How many times sub-requests failing with a rate-limit or server error are retried.
+            max_retries (int): Retry limit of each batch HTTP call, the scheduler's by default.
+
+        Returns:
+            dict: key -> (response, error) for every request, with error None on success.
+        """
+        service = self.service
+        results = {}
+        pending = list(requests)
+        for attempt in range(retries + 1):
+            failed = []
+            for start in range(0, len(pending), BATCH_SIZE):
+                chunk = dict((str(index), item) for index, item in enumerate(pending[start:start + BATCH_SIZE]))
+
+                def callback(request_id, response, exception, chunk=chunk):
+                    key, request = chunk[request_id]
+                    results[key] = (response, exception)
+                    if exception is not None and is_retryable(exception):
+                        failed.append((key, request))
+
+                batch = service.new_batch_http_request(callback=callback)
+                for request_id, (key, request) in chunk.items():
+                    batch.add(request, request_id=request_id)
+                try:
+                    self.scheduler.execute(batch, priority=BULK, cost=len(chunk), max_retries=max_retries)
+                except HttpError as e:
+                    logging.info(f"An error occurred: {e}")
+                    for key, request in chunk.values():
+                        results[key] = (None, e)
+                        failed.append((key, request))
+            if not failed or attempt == retries:
+                break
+            logging.info(f"Retrying {len(failed)} failed requests...")
+            self.scheduler.record('retried', len(failed))
+            time.sleep(self.scheduler.backoff_delay(attempt))
+            pending = failed
+        return results
+
+    def batch_get_events(self, event_ids, fields=Event.JSON_FIELDS, calendar_id='primary'):
+        """Fetch many event resources in batched requests; returns event id -> (resource, error)."""
+        resource = self.service.events()
+        mask = fields_mask(fields)
+        return self.execute_batch([(event_id, resource.get(calendarId=calendar_id, eventId=event_id, fields=mask))
+                                   for event_id in event_ids])
+
+    def batch_import_events(self, events):
+        """Import events by their iCalUID, which every event must carry, in batched requests."""
+        resource = self.service.events()
+        return self.execute_batch([(event.ical_uid, resource.import_(calendarId='primary', body=event.to_json()))
+                                   for event in events])
+
+    def apply_writes(self, writes, retries=BATCH_RETRIES, max_retries=None):
+        """
+        Send queued writes in batched requests.
+
+        Args:
+            writes (list): (key, operation, calendar_id, event_id, body, etag) tuples, at most one per event,
+                where operation is 'insert', 'update', 'patch' or 'delete' and keys identify the writes in
+                the result. Inserts carry their event id, so sending one again cannot create a duplicate;
+                updates and patches with an ETag are sent with If-Match.
+            retries (int): How many times sub-requests failing with a rate-limit or server error are retried.
+            max_retries (int): Retry limit of each batch HTTP call, the scheduler's by default.
+
+        Returns:
+            dict: key -> (response, error). A delete of an event that was already deleted (410 Gone) counts
+            as done, with neither a response nor an error; a delete of an event that does not exist fails
+            with a 404. An insert whose id already exists (409 Conflict) only counts as done when the
+            existing event is the one sent, i.e. an earlier attempt was applied; otherwise the 409 stays.
+        """
+        resource = self.service.events()
+        requests = []
+        for key, operation, calendar_id, event_id, body, etag in writes:
+            if operation == 'insert':
+                request = resource.insert(calendarId=calendar_id, body=dict(body, id=event_id))
+            elif operation == 'update':
+                request = resource.update(calendarId=calendar_id, eventId=event_id, body=body)
+            elif operation == 'patch':
+                request = resource.patch(calendarId=calendar_id, eventId=event_id, body=body)
+            else:
+                request = resource.delete(calendarId=calendar_id, eventId=event_id)
+            if etag:
+                request.headers['If-Match'] = etag
+            requests.append((key, request))
+        self._invalidate_cached(*(event_id for _, _, _, event_id, _, _ in writes))
+        results = self.execute_batch(requests, retries, max_retries)
+        conflicts = {}
+        for key, operation, calendar_id, event_id, body, _ in writes:
+            _, error = results.get(key, (None, None))
+            status = error.resp.status if isinstance(error, HttpError) else None
+            if operation == 'delete' and status == 410:
+                results[key] = (None, None)
+            elif operation == 'insert' and status == 409:
+                conflicts[key] = (calendar_id, event_id, body)
+        if conflicts:
+            existing = self.execute_batch([(key, resource.get(calendarId=calendar_id, eventId=event_id))
+                                           for key, (calendar_id, event_id, _) in conflicts.items()],
+                                          retries, max_retries)
+            for key, (_, _, body) in conflicts.items():
+                found, error = existing.get(key, (None, None))
+                if error is None and found and _is_same_event(found, body):
+                    results[key] = (None, None)
+        return results
@@ -1,12 +1,59 @@
-from datetime import date, datetime
+from datetime import datetime, time
+from functools import lru_cache
 
-from dateutil.parser import isoparse
 from typing import List, Optional
 
 
+@lru_cache(maxsize=8192)
+def parse_datetime(value):
+    """
+    Parse an RFC 3339 dateTime or an all-day date from the Calendar API.
+
+    Results are cached, so repeated timestamps, all-day dates and their tz offsets
+    are parsed once and shared. Dates are returned as midnight datetimes.
+    """
+    try:
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        return datetime.fromisoformat(value)
+    except ValueError:
+        from dateutil.parser import isoparse
+        return isoparse(value)
+
+
+def fields_mask(item_fields, *page_fields):
+    """
+    Build the `fields` partial-response mask of a request.
+
+    Args:
+        item_fields (Sequence[str] or str): Fields of the event resources to return, or '*' for all of them.
+        page_fields (str): Top-level fields of a list response, e.g. 'nextPageToken'. When given,
+            `item_fields` apply to its items; otherwise the response is a single resource.
+
+    Returns None, i.e. the full response, for '*'.
+    """
+    if item_fields == '*':
+        return None
+    if not isinstance(item_fields, str):
+        item_fields = ",".join(item_fields)
+    if not page_fields:
+        return item_fields
+    return ",".join(page_fields + (f"items({item_fields})",))
+
+
 class Event:
+    __slots__ = ('title', 'start_time', 'end_time', 'description', 'location', 'daylong', 'attendees', 'event_id',
+                 'etag', 'time_zone', 'ical_uid', '_snapshot')
+
+    # Fields of the event resource read by from_json, requested as a partial response
+    JSON_FIELDS = ('id', 'etag', 'iCalUID', 'summary', 'description', 'location', 'start', 'end', 'attendees/email',
+                   'recurringEventId')
+    # Attributes whose changes are sent by to_patch_json
+    TRACKED_FIELDS = ('title', 'start_time', 'end_time', 'description', 'location', 'daylong', 'attendees')
+
     def __init__(self, title, start_time, end_time, description=None, location=None,
-                 daylong=False, attendees: Optional[List[str]] = None, event_id=None):
+                 daylong=False, attendees: Optional[List[str]] = None, event_id=None, etag=None, time_zone=None,
+                 ical_uid=None):
         self.title = title
         self.start_time = start_time
         self.end_time = end_time
@@ -15,38 +62,83 @@ class Event:
         self.daylong = daylong
         self.attendees = attendees if attendees else []
         self.event_id = event_id
+        self.etag = etag
+        self.time_zone = time_zone
+        self.ical_uid = ical_uid
+        self._snapshot = None
 
-    @classmethod
-    def from_json(cls, json_data):
-        event_id = json_data.get('id')
-        title = json_data.get("summary")
-        start = json_data.get("start", {})
-        end = json_data.get("end", {})
-        description = json_data.get("description", None)
-        location = json_data.get("location", None)
+    @staticmethod
+    def _fields_from_json(json_data):
+        """Decode the constructor arguments shared by Event and RecurringEvent in a single pass."""
         daylong = False
-
         start_time = end_time = None
+        start = json_data.get("start")
         if start:
-            start_datetime = start.get("dateTime")
-            start_date = start.get("date")
-            if start_datetime:
-                start_time = isoparse(start_datetime)
-            elif start_date:
-                start_time = isoparse(start_date)
-                daylong = True
-
+            value = start.get("dateTime")
+            if value is None:
+                value = start.get("date")
+                daylong = value is not None
+            if value is not None:
+                start_time = parse_datetime(value)
+        end = json_data.get("end")
         if end:
-            end_datetime = end.get("dateTime")
-            end_date = end.get("date")
-            if end_datetime:
-                end_time = isoparse(end_datetime)
-            elif end_date:
-                end_time = isoparse(end_date)
-                daylong = True
+            value = end.get("dateTime")
+            if value is None:
+                value = end.get("date")
+                daylong = daylong or value is not None
+            if value is not None:
+                end_time = parse_datetime(value)
+        attendees = [attendee["email"] for attendee in json_data.get("attendees", ())]
+        return (json_data.get("summary"), start_time, end_time, json_data.get("description"),
+                json_data.get("location"), daylong, attendees, json_data.get("id"), json_data.get("etag"),
+                start.get("timeZone") if start else None, json_data.get("iCalUID"))
 
-        attendees = [attendee["email"] for attendee in json_data.get("attendees", [])]
-        return cls(title, start_time, end_time, description, location, daylong, attendees, event_id)
+    @classmethod
+    def from_json(cls, json_data):
+        return cls(*cls._fields_from_json(json_data))
+
+    def track_changes(self):
+        """Remember the current values, so changed_fields() reports what is assigned from now on."""
+        self._snapshot = tuple(list(value) if isinstance(value, list) else value
+                               for value in (getattr(self, name) for name in self.TRACKED_FIELDS))
+
+    def changed_fields(self):
+        """
+        Names of the attributes changed since track_changes().
+
+        An event that is not tracked, e.g. one built from just the values to update
+        without fetching it first, reports every attribute that was given a value.
+        """
+        if self._snapshot is None:
+            return {name for name in self.TRACKED_FIELDS
+                    if name != 'daylong' and getattr(self, name) not in (None, [])}
+        return {name for name, old in zip(self.TRACKED_FIELDS, self._snapshot) if getattr(self, name) != old}
+
+    def _time_json(self, value):
+        if self.daylong:
+            return {"date": value.date().isoformat(), "dateTime": None}
+        if value.tzinfo is None:
+            return {"dateTime": value.isoformat(), "timeZone": self.time_zone or "UTC", "date": None}
+        # The offset pins the instant, so the event keeps its own time zone
+        return {"dateTime": value.isoformat(), "date": None}
+
+    def to_patch_json(self):
+        """Body of an events().patch request carrying only the changed fields."""
+        changed = self.changed_fields()
+        event = {}
+        if "title" in changed:
+            event["summary"] = self.title
+        if "description" in changed:
+            event["description"] = self.description
+        if "location" in changed:
+            event["location"] = self.location
+        if "attendees" in changed:
+            event["attendees"] = [{"email": attendee} for attendee in self.attendees]
+        if changed & {"start_time", "daylong"} and self.start_time is not None:
+            event["start"] = self._time_json(self.start_time)
+        if changed & {"end_time", "daylong"} and self.end_time is not None:
+            event["end"] = self._time_json(self.end_time)
+        return event
 
     def to_json(self):
         event = {
@@ -56,15 +148,17 @@ class Event:
             "start": {
                 "dateTime": self.start_time.isoformat() if not self.daylong else None,
                 "date": self.start_time.date().isoformat() if self.daylong else None,
-                "timeZone": "UTC"
+                "timeZone": self.time_zone or "UTC"
             },
             "end": {
                 "dateTime": self.end_time.isoformat() if not self.daylong else None,
                 "date": self.end_time.date().isoformat() if self.daylong else None,
-                "timeZone": "UTC"
+                "timeZone": self.time_zone or "UTC"
             },
             "attendees": [{"email": attendee} for attendee in self.attendees]
         }
+        if self.ical_uid:
+            event["iCalUID"] = self.ical_uid
 
         if self.daylong:
             del event["start"]["dateTime"]
@@ -76,14 +170,21 @@ class Event:
         return event
 
     def is_valid(self):
-        if isinstance(self.start_time, date) and isinstance(self.end_time, date):
-            self.daylong = True
-            return True
-        elif isinstance(self.start_time, datetime) and isinstance(self.end_time, datetime):
-            self.daylong = False
-            return True
-        else:
+        """
+        Whether the start and end are both set, and both dates or both datetimes.
+
+        Dates make the event all-day. Decoded and command-line times are datetimes
+        even for all-day events, so for datetimes `daylong` is kept as it was set.
+        """
+        if self.start_time is None or self.end_time is None:
+            return False
+        if isinstance(self.start_time, datetime) != isinstance(self.end_time, datetime):
             return False
+        if not isinstance(self.start_time, datetime):
+            self.start_time = datetime.combine(self.start_time, time())
+            self.end_time = datetime.combine(self.end_time, time())
+            self.daylong = True
+        return True
 
     def __str__(self):
         event_details = (f"Event ID: {self.event_id}\n"
@@ -0,0 +1,161 @@
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from model.event import Event, parse_datetime
+from model.recurring_event import RecurrenceRule, RecurringEvent
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAIVE = -32768  # offset marker for all-day and naive times, which are stored as UTC
+
+
+@lru_cache(maxsize=None)
+def _zone(offset_minutes):
+    return timezone(timedelta(minutes=offset_minutes))
+
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+
+def _rrule(json_event):
+    for line in json_event.get("recurrence", ()):
+        if line.startswith("RRULE:"):
+            return line[len("RRULE:"):]
+    return None
+
+
+class EventBatch:
+    """
+    Columnar container for many events.
+
+    Start and end times are kept as int64 epoch seconds in arrays, with the UTC
+    offset of each alongside, and repeated strings such as locations, time zones
+    and attendee emails are interned. Event objects are only built when an item
+    is accessed. Range filters and sorts run over the arrays, vectorized with
+    NumPy when it is installed.
+    """
+
+    COLUMNS = ('event_ids', 'titles', 'descriptions', 'locations', 'attendees', 'etags', 'time_zones', 'ical_uids',
+               'rrules', 'recurring', 'daylong', 'starts', 'ends', 'start_offsets', 'end_offsets')
+
+    def __init__(self):
+        self.event_ids = []
+        self.titles = []
+        self.descriptions = []
+        self.locations = []
+        self.attendees = []
+        self.etags = []
+        self.time_zones = []
+        self.ical_uids = []
+        self.rrules = []
+        self.recurring = bytearray()
+        self.daylong = bytearray()
+        self.starts = array('q')
+        self.ends = array('q')
+        self.start_offsets = array('h')
+        self.end_offsets = array('h')
+
+    @classmethod
+    def from_json(cls, json_events):
+        batch = cls()
+        for json_event in json_events:
+            batch.append_json(json_event)
+        return batch
+
+    @staticmethod
+    def _encode_time(boundary):
+        value = boundary.get("dateTime") or boundary.get("date") if boundary else None
+        if not value:
+            return 0, NAIVE
+        parsed = parse_datetime(value)
+        if parsed.tzinfo is None:
+            return int(parsed.replace(tzinfo=timezone.utc).timestamp()), NAIVE
+        return int(parsed.timestamp()), int(parsed.utcoffset().total_seconds() // 60)
+
+    def append_json(self, json_event):
+        start = json_event.get("start") or {}
+        end = json_event.get("end") or {}
+        start_time, start_offset = self._encode_time(start)
+        end_time, end_offset = self._encode_time(end)
+        self.event_ids.append(json_event.get("id"))
+        self.titles.append(json_event.get("summary"))
+        self.descriptions.append(json_event.get("description"))
+        self.locations.append(_intern(json_event.get("location")))
+        self.attendees.append(tuple(sys.intern(attendee["email"]) for attendee in json_event.get("attendees", ())))
+        self.etags.append(json_event.get("etag"))
+        self.time_zones.append(_intern(start.get("timeZone")))
+        self.ical_uids.append(json_event.get("iCalUID"))
+        self.rrules.append(_intern(_rrule(json_event)))
+        self.recurring.append("recurringEventId" in json_event or "recurrence" in json_event)
+        self.daylong.append("dateTime" not in start and "date" in start or "dateTime" not in end and "date" in end)
+        self.starts.append(start_time)
+        self.ends.append(end_time)
+        self.start_offsets.append(start_offset)
+        self.end_offsets.append(end_offset)
+
+    def extend(self, other):
+        """Append every event of another batch, in its order."""
+        for column in self.COLUMNS:
+            getattr(self, column).extend(getattr(other, column))
+
+    def __len__(self):
+        return len(self.event_ids)
+
+    @staticmethod
+    def _decode_time(timestamp, offset):
+        if offset == NAIVE:
+            return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+        return datetime.fromtimestamp(timestamp, _zone(offset))
+
+    def __getitem__(self, index):
+        fields = dict(
+            title=self.titles[index],
+            start_time=self._decode_time(self.starts[index], self.start_offsets[index]),
+            end_time=self._decode_time(self.ends[index], self.end_offsets[index]),
+            description=self.descriptions[index],
+            location=self.locations[index],
+            daylong=bool(self.daylong[index]),
+            attendees=list(self.attendees[index]),
+            event_id=self.event_ids[index],
+            etag=self.etags[index],
+            time_zone=self.time_zones[index],
+            ical_uid=self.ical_uids[index])
+        if not self.recurring[index]:
+            return Event(**fields)
+        rrule = self.rrules[index]
+        return RecurringEvent(recurrence=RecurrenceRule.from_rrule(rrule) if rrule else None, **fields)
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    def take(self, indices):
+        """Return a new batch holding the given rows, in the given order."""
+        indices = [int(index) for index in indices]
+        batch = EventBatch()
+        for column in self.COLUMNS:
+            values = getattr(self, column)
+            getattr(batch, column).extend(values[index] for index in indices)
+        return batch
+
+    def filter_range(self, time_min, time_max):
+        """Return the events overlapping [time_min, time_max), given as datetimes; naive ones are taken as UTC."""
+        low, high = (int((value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp())
+                     for value in (time_min, time_max))
+        if numpy is not None:
+            starts = numpy.frombuffer(self.starts, dtype=numpy.int64)
+            ends = numpy.frombuffer(self.ends, dtype=numpy.int64)
+            return self.take(numpy.flatnonzero((starts < high) & (ends > low)))
+        return self.take(index for index, (start, end) in enumerate(zip(self.starts, self.ends))
+                         if start < high and end > low)
+
+    def sorted_by_start(self):
+        """Return the events ordered by start time; the sort is stable."""
+        if numpy is not None:
+            return self.take(numpy.argsort(numpy.frombuffer(self.starts, dtype=numpy.int64), kind='stable'))
+        return self.take(sorted(range(len(self)), key=self.starts.__getitem__))
@@ -1,11 +1,19 @@
-from datetime import datetime
+import calendar
+from datetime import datetime, timedelta, timezone
 from model.event import Event
 from typing import List, Optional
 
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+SUPPORTED_RRULE_PARTS = {"FREQ", "INTERVAL", "COUNT", "UNTIL", "BYDAY", "BYMONTH", "BYYEARDAY", "BYHOUR", "WKST"}
+SUPPORTED_FREQUENCIES = {"DAILY", "WEEKLY", "MONTHLY", "YEARLY"}
+MAX_YEAR = 9999
+
 
 class RecurrenceRule:
+    __slots__ = ('freq', 'interval', 'count', 'until', 'by_day', 'by_month', 'by_year_day', 'by_hour', 'week_start')
+
     def __init__(self, freq, interval=1, count=None, until=None, by_day=None, by_month=None, by_year_day=None,
-                 by_hour=None):
+                 by_hour=None, week_start=None):
         self.freq = freq
         self.interval = interval
         self.count = count
@@ -14,11 +22,13 @@ class RecurrenceRule:
         self.by_month = by_month
         self.by_year_day = by_year_day
         self.by_hour = by_hour
+        # WKST; weeks start on Monday unless the rule says otherwise
+        self.week_start = week_start
 
     @classmethod
     def from_rrule(cls, rrule):
         components = rrule.split(";")
-        freq = interval = count = until = by_day = by_month = by_year_day = by_hour = None
+        freq = interval = count = until = by_day = by_month = by_year_day = by_hour = week_start = None
         for component in components:
             key, value = component.split("=")
             if key == "FREQ":
@@ -28,7 +38,12 @@ class RecurrenceRule:
             elif key == "COUNT":
                 count = int(value)
             elif key == "UNTIL":
-                until = datetime.strptime(value, "%Y%m%dT%H%M%SZ")
+                if value.endswith("Z"):
+                    until = datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+                elif "T" in value:
+                    until = datetime.strptime(value, "%Y%m%dT%H%M%S")
+                else:
+                    until = datetime.strptime(value, "%Y%m%d")
             elif key == "BYDAY":
                 by_day = value.split(",")
             elif key == "BYMONTH":
@@ -37,7 +52,166 @@ class RecurrenceRule:
                 by_year_day = [int(day) for day in value.split(",")]
             elif key == "BYHOUR":
                 by_hour = [int(hour) for hour in value.split(",")]
-        return cls(freq, interval, count, until, by_day, by_month, by_year_day, by_hour)
+            elif key == "WKST":
+                week_start = value.upper()
+        return cls(freq, interval, count, until, by_day, by_month, by_year_day, by_hour, week_start)
+
+    @staticmethod
+    def is_supported(rrule):
+        """Return True if the RRULE string can be expanded locally: a supported FREQ, and only supported parts."""
+        parts = dict(component.split("=", 1) for component in rrule.split(";") if "=" in component)
+        return parts.get("FREQ", "").upper() in SUPPORTED_FREQUENCIES and set(parts) <= SUPPORTED_RRULE_PARTS and \
+            parts.get("WKST", "MO").upper() in WEEKDAYS
+
+    def iter_occurrences(self, dtstart):
+        """Lazily yield every occurrence start of the rule, beginning at `dtstart`."""
+        return self._expand(dtstart, 0)
+
+    def between(self, dtstart, start, end):
+        """
+        Lazily yield the occurrence starts in [start, end).
+
+        Without COUNT the expansion jumps straight to the period containing `start`
+        instead of iterating from `dtstart`; with COUNT the occurrences before the
+        window still have to be counted.
+        """
+        start, end = self._align(start, dtstart), self._align(end, dtstart)
+        first_period = 0 if self.count else self._period_index(dtstart, start)
+        for occurrence in self._expand(dtstart, first_period, end):
+            if occurrence >= end:
+                return
+            if occurrence >= start:
+                yield occurrence
+
+    @staticmethod
+    def _align(value, dtstart):
+        """Make `value` comparable to `dtstart`: naive values are taken as UTC next to aware ones."""
+        if dtstart.tzinfo is not None:
+            return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(dtstart.tzinfo)
+        return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo is not None else value
+
+    def _week_of(self, day):
+        """First day of the week containing `day`, weeks starting on WKST."""
+        week_start = WEEKDAYS.index(self.week_start) if self.week_start else 0
+        return day - timedelta(days=(day.weekday() - week_start) % 7)
+
+    def _period_index(self, dtstart, moment):
+        interval = self.interval or 1
+        freq = self.freq.upper()
+        if moment <= dtstart:
+            return 0
+        if freq == "YEARLY":
+            periods = moment.year - dtstart.year
+        elif freq == "MONTHLY":
+            periods = (moment.year - dtstart.year) * 12 + moment.month - dtstart.month
+        elif freq == "WEEKLY":
+            periods = (self._week_of(moment.date()) - self._week_of(dtstart.date())).days // 7
+        else:
+            periods = (moment.date() - dtstart.date()).days
+        return periods // interval
+
+    def _period_days(self, dtstart, index):
+        """Dates of the index-th period of the rule, or None once past the last representable year."""
+        interval = self.interval or 1
+        freq = self.freq.upper()
+        if freq == "YEARLY":
+            year = dtstart.year + index * interval
+            if year > MAX_YEAR:
+                return None
+            first = datetime(year, 1, 1).date()
+            length = 366 if calendar.isleap(year) else 365
+        elif freq == "MONTHLY":
+            month = dtstart.month - 1 + index * interval
+            year = dtstart.year + month // 12
+            if year > MAX_YEAR:
+                return None
+            first = datetime(year, month % 12 + 1, 1).date()
+            length = calendar.monthrange(first.year, first.month)[1]
+        elif freq == "WEEKLY":
+            first = self._week_of(dtstart.date()) + timedelta(weeks=index * interval)
+            length = 7
+            if first.year + 1 > MAX_YEAR:
+                return None
+        else:
+            first = dtstart.date() + timedelta(days=index * interval)
+            length = 1
+            if first.year + 1 > MAX_YEAR:
+                return None
+        return [first + timedelta(days=offset) for offset in range(length)]
+
+    def _expand(self, dtstart, first_period, stop=None):
+        freq = self.freq.upper()
+        by_month = set(self.by_month) if self.by_month else None
+        by_year_day = set(self.by_year_day) if self.by_year_day else None
+        by_month_day = None
+        weekdays, nth_weekdays = set(), set()
+        for value in self.by_day or []:
+            value = value.upper()
+            weekday = WEEKDAYS.index(value[-2:])
+            if value[:-2] and freq in ("YEARLY", "MONTHLY"):
+                nth_weekdays.add((int(value[:-2]), weekday))
+            else:
+                weekdays.add(weekday)
+        if not by_year_day and not self.by_day:
+            # Same defaults as RFC 5545 / dateutil: repeat on the start's day, weekday or month
+            if freq == "YEARLY":
+                by_month = by_month or {dtstart.month}
+                by_month_day = {dtstart.day}
+            elif freq == "MONTHLY":
+                by_month_day = {dtstart.day}
+            elif freq == "WEEKLY":
+                weekdays = {dtstart.weekday()}
+        hours = sorted(set(self.by_hour)) if self.by_hour else [dtstart.hour]
+        nth_in_month = freq == "MONTHLY" or by_month is not None
+        until = self._align(self.until, dtstart) if self.until else None
+
+        yielded = 0
+        index = first_period
+        while True:
+            days = self._period_days(dtstart, index)
+            # Rules whose parts never match would otherwise run on to the last representable year
+            if days is None or (stop is not None and days[0] > stop.date()):
+                return
+            index += 1
+            for day in days:
+                if by_month and day.month not in by_month:
+                    continue
+                if by_month_day and day.day not in by_month_day:
+                    continue
+                if by_year_day:
+                    year_day = day.timetuple().tm_yday
+                    year_length = 366 if calendar.isleap(day.year) else 365
+                    if year_day not in by_year_day and year_day - year_length - 1 not in by_year_day:
+                        continue
+                if (weekdays or nth_weekdays) and not (
+                        day.weekday() in weekdays or
+                        self._is_nth_weekday(day, nth_weekdays, nth_in_month)):
+                    continue
+                for hour in hours:
+                    occurrence = datetime(day.year, day.month, day.day, hour, dtstart.minute, dtstart.second,
+                                          tzinfo=dtstart.tzinfo)
+                    if occurrence < dtstart:
+                        continue
+                    if until is not None and occurrence > until:
+                        return
+                    yield occurrence
+                    yielded += 1
+                    if self.count and yielded >= self.count:
+                        return
+
+    @staticmethod
+    def _is_nth_weekday(day, nth_weekdays, in_month):
+        """Whether `day` is e.g. the 2nd Monday or last Friday of its month (or year)."""
+        if not nth_weekdays:
+            return False
+        if in_month:
+            position, length = day.day, calendar.monthrange(day.year, day.month)[1]
+        else:
+            position, length = day.timetuple().tm_yday, 366 if calendar.isleap(day.year) else 365
+        from_start = (position - 1) // 7 + 1
+        from_end = -((length - position) // 7 + 1)
+        weekday = day.weekday()
+        return (from_start, weekday) in nth_weekdays or (from_end, weekday) in nth_weekdays
 
     def to_rrule(self):
         rrule = f"FREQ={self.freq.upper()}"
@@ -55,6 +229,8 @@ class RecurrenceRule:
             rrule += f";BYYEARDAY={','.join(map(str, self.by_year_day))}"
         if self.by_hour:
             rrule += f";BYHOUR={','.join(map(str, self.by_hour))}"
+        if self.week_start:
+            rrule += f";WKST={self.week_start}"
         return rrule
 
     def __str__(self):
@@ -79,24 +255,39 @@ class RecurrenceRule:
 
 
 class RecurringEvent(Event):
+    __slots__ = ('recurrence',)
+
+    JSON_FIELDS = Event.JSON_FIELDS + ('recurrence',)
+    TRACKED_FIELDS = Event.TRACKED_FIELDS + ('recurrence',)
+
     def __init__(self, title, start_time, end_time, recurrence=None, description=None, location=None,
-                 daylong=False, attendees: Optional[List[str]] = None, event_id=None):
-        super().__init__(title, start_time, end_time, description, location, daylong, attendees, event_id)
+                 daylong=False, attendees: Optional[List[str]] = None, event_id=None, etag=None, time_zone=None,
+                 ical_uid=None):
+        super().__init__(title, start_time, end_time, description, location, daylong, attendees, event_id, etag,
+                         time_zone, ical_uid)
         self.recurrence = recurrence
 
     @classmethod
     def from_json(cls, json_data):
         recurrence = None
-        event = Event.from_json(json_data)  # Why super.from_json doesn't work?????
-        recurrence_data = json_data.get("recurrence", "")
-        if recurrence_data:
-            recurrence = RecurrenceRule.from_rrule(recurrence_data)
-        return cls(event.title, event.start_time, event.end_time, recurrence, event.description, event.location,
-                   event.daylong, event.attendees, event.event_id)
+        for line in json_data.get("recurrence", ()):
+            if line.startswith("RRULE:"):
+                recurrence = RecurrenceRule.from_rrule(line[len("RRULE:"):])
+        title, start_time, end_time, description, location, daylong, attendees, event_id, etag, time_zone, ical_uid = \
+            Event._fields_from_json(json_data)
+        return cls(title, start_time, end_time, recurrence, description, location, daylong, attendees, event_id,
+                   etag, time_zone, ical_uid)
 
     def to_json(self):
         event = super().to_json()
-        event['recurrence'] = [f"RRULE:{self.recurrence.to_rrule()}"]
+        if self.recurrence:
+            event['recurrence'] = [f"RRULE:{self.recurrence.to_rrule()}"]
+        return event
+
+    def to_patch_json(self):
+        event = super().to_patch_json()
+        if "recurrence" in self.changed_fields() and self.recurrence:
+            event['recurrence'] = [f"RRULE:{self.recurrence.to_rrule()}"]
         return event
 
     def __str__(self):
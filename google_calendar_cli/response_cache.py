@@ -0,0 +1,89 @@
+import json
+import sqlite3
+import threading
+import time
+
+from config import RESPONSE_CACHE_FILE, RESPONSE_CACHE_MAX_BYTES
+
+
+class ResponseCache:
+    """
+    On-disk cache of API responses, revalidated with their ETag.
+
+    Entries are keyed by resource (e.g. 'primary/<event id>') and the partial
+    response mask they were fetched with. Callers send the stored ETag as
+    If-None-Match and, on a 304, take the body from here. Bodies decoded once by
+    this process are kept decoded, so a long-lived process (the daemon) does not
+    parse them again. Once the stored bodies exceed `max_bytes`, the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_FILE, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.decoded = {}
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                resource TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                body TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                used_at REAL NOT NULL,
+                PRIMARY KEY (resource, fields)
+            );
+            CREATE INDEX IF NOT EXISTS responses_used ON responses (used_at);
+        """)
+
+    def etag(self, resource, fields):
+        """ETag of the cached response, or None; counts as a use for the LRU order."""
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT etag FROM responses WHERE resource = ? AND fields = ?",
+                                          (resource, fields)).fetchone()
+            if row:
+                self.connection.execute("UPDATE responses SET used_at = ? WHERE resource = ? AND fields = ?",
+                                        (time.time(), resource, fields))
+        return row[0] if row else None
+
+    def body(self, resource, fields):
+        """Decoded body of the cached response, or None."""
+        with self.lock:
+            row = self.connection.execute("SELECT etag, body FROM responses WHERE resource = ? AND fields = ?",
+                                          (resource, fields)).fetchone()
+        if row is None:
+            return None
+        etag, body = row
+        decoded = self.decoded.get((resource, fields))
+        if decoded is None or decoded[0] != etag:
+            decoded = self.decoded[(resource, fields)] = (etag, json.loads(body))
+        return decoded[1]
+
+    def put(self, resource, fields, etag, body):
+        if not etag:
+            return
+        text = json.dumps(body)
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                                    (resource, fields, etag, text, len(text), time.time()))
+            self.decoded[(resource, fields)] = (etag, body)
+            self._evict()
+
+    def _evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute("SELECT resource, fields, size FROM responses ORDER BY used_at").fetchall()
+        for resource, fields, size in rows:
+            self.connection.execute("DELETE FROM responses WHERE resource = ? AND fields = ?", (resource, fields))
+            self.decoded.pop((resource, fields), None)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def invalidate(self, resource):
+        """Drop every cached response of a resource, e.g. after writing to it."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM responses WHERE resource = ?", (resource,))
+            for key in [key for key in self.decoded if key[0] == resource]:
+                del self.decoded[key]
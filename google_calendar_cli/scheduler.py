@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from config import USER_QUOTA_PER_SECOND, PROJECT_QUOTA_PER_SECOND, MAX_RETRIES, BACKOFF_BASE, BACKOFF_MAX, \
+    BULK_RESERVE
+from instrumentation import Instrumentation, RETRY_BUCKETS
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def delay(self, tokens=1, reserve=0):
+        """Seconds until `tokens` can be taken leaving at least `reserve` in the bucket; 0 if they can now."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            needed = min(tokens + reserve, self.capacity)
+            return 0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+    def take(self, tokens=1):
+        """Remove `tokens`, which must be at most what delay() found available; the bucket never goes negative."""
+        with self.lock:
+            self.tokens = max(0, self.tokens - tokens)
+
+
+def _error_types():
+    """
+    Transport and HTTP status error classes of the clients in use.
+
+    httpx is slow to import and only used by AsyncCalendar, so its errors are only
+    recognised once something else has imported it; before that none can occur.
+    """
+    transport_errors = (httplib2.HttpLib2Error, ConnectionError, TimeoutError)
+    status_errors = (HttpError,)
+    httpx = sys.modules.get('httpx')
+    if httpx is not None:
+        transport_errors += (httpx.TransportError,)
+        status_errors += (httpx.HTTPStatusError,)
+    return transport_errors, status_errors
+
+
+def _status_and_reasons(error):
+    """HTTP status, error reasons and Retry-After seconds of an HttpError or httpx.HTTPStatusError."""
+    if isinstance(error, HttpError):
+        status, headers = error.resp.status, error.resp
+        details = error.error_details if isinstance(error.error_details, list) else []
+    else:
+        status, headers = error.response.status_code, error.response.headers
+        try:
+            details = error.response.json().get('error', {}).get('errors', [])
+        except ValueError:
+            details = []
+    reasons = {detail.get('reason') for detail in details if isinstance(detail, dict)}
+    try:
+        retry_after = float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        retry_after = None
+    return status, reasons, retry_after
+
+
+def is_retryable(error):
+    """Whether a failed request should be retried: rate limits, server errors and connection failures."""
+    transport_errors, status_errors = _error_types()
+    if isinstance(error, transport_errors):
+        return True
+    if not isinstance(error, status_errors):
+        return False
+    status, reasons, _ = _status_and_reasons(error)
+    return status in RETRYABLE_STATUSES or (status == 403 and bool(reasons & RATE_LIMIT_REASONS))
+
+
+class RequestScheduler:
+    """
+    Central gate for Calendar API requests.
+
+    Every request first takes a token from both the per-user and the per-project
+    bucket. Bulk requests must leave `bulk_reserve` of each bucket's capacity
+    untouched, so interactive reads still get through while a bulk job saturates
+    the quota. Rate-limited, failing-server and connection errors are retried
+    with exponential backoff and full jitter, honouring Retry-After. Counts of
+    throttled, retried and dropped requests are kept in `metrics`; the duration
+    and retries of every call go to `instrumentation`.
+    """
+
+    def __init__(self, user_rate=USER_QUOTA_PER_SECOND, project_rate=PROJECT_QUOTA_PER_SECOND,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 bulk_reserve=BULK_RESERVE, instrumentation=None):
+        self.buckets = [TokenBucket(user_rate), TokenBucket(project_rate)]
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bulk_reserve = bulk_reserve
+        self.metrics = {'requests': 0, 'throttled': 0, 'retried': 0, 'dropped': 0}
+        self.instrumentation = instrumentation if instrumentation else Instrumentation()
+        self.lock = threading.Lock()
+        self.acquire_lock = threading.Lock()
+
+    def record(self, metric, amount=1):
+        with self.lock:
+            self.metrics[metric] += amount
+
+    def _acquire_delay(self, priority, cost):
+        """Take `cost` tokens from every bucket, or from none and return the seconds to wait."""
+        with self.acquire_lock:
+            delay = max(bucket.delay(cost, bucket.capacity * self.bulk_reserve if priority == BULK else 0)
+                        for bucket in self.buckets)
+            if not delay:
+                for bucket in self.buckets:
+                    bucket.take(cost)
+            return delay
+
+    def _waits(self, priority, cost):
+        """
+        Yield the delays to sleep until `cost` tokens were taken from the buckets.
+
+        Costs larger than a bucket holds, such as a batch of 50 requests against a
+        user quota of 10 per second, are taken in chunks as the buckets refill, and a
+        bulk chunk always leaves the reserve in place. Debiting the whole cost at once
+        would drive the bucket below zero and make interactive requests wait for it.
+        """
+        capacity = min(bucket.capacity for bucket in self.buckets)
+        chunk_size = max(1, int(capacity * (1 - self.bulk_reserve))) if priority == BULK else max(1, int(capacity))
+        while cost > 0:
+            chunk = min(cost, chunk_size)
+            delay = self._acquire_delay(priority, chunk)
+            if delay:
+                yield delay
+            else:
+                cost -= chunk
+
+    def backoff_delay(self, attempt, error=None):
+        """Seconds to wait before retry number `attempt` (from 0); Retry-After wins when the server sent one."""
+        if isinstance(error, _error_types()[1]):
+            retry_after = _status_and_reasons(error)[2]
+            if retry_after is not None:
+                return retry_after
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def execute(self, request, priority=INTERACTIVE, cost=1, max_retries=None, **kwargs):
+        """
+        Run `request.execute(**kwargs)` under the rate limits, retrying transient failures.
+
+        `max_retries` overrides the scheduler's retry limit for this request.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        self.record('requests')
+        method = getattr(request, 'methodId', None) or 'batch'
+        attempt = 0
+        throttled = False
+        with self.instrumentation.timed('call', method=method):
+            try:
+                while True:
+                    for delay in self._waits(priority, cost):
+                        if not throttled:
+                            self.record('throttled')
+                            throttled = True
+                        time.sleep(delay)
+                    try:
+                        return request.execute(**kwargs)
+                    except Exception as e:
+                        if not is_retryable(e):
+                            raise
+                        if attempt >= max_retries:
+                            self.record('dropped')
+                            logging.error(f"Giving up after {attempt + 1} attempts: {e}")
+                            raise
+                        self.record('retried')
+                        time.sleep(self.backoff_delay(attempt, e))
+                        attempt += 1
+            finally:
+                self.instrumentation.observe('request_retries', attempt, RETRY_BUCKETS, method=method)
+
+    async def execute_async(self, send, priority=INTERACTIVE, cost=1, method='async'):
+        """Await `send()` under the rate limits, retrying transient failures; for AsyncCalendar."""
+        self.record('requests')
+        attempt = 0
+        throttled = False
+        with self.instrumentation.timed('call', method=method):
+            try:
+                while True:
+                    for delay in self._waits(priority, cost):
+                        if not throttled:
+                            self.record('throttled')
+                            throttled = True
+                        await asyncio.sleep(delay)
+                    try:
+                        return await send()
+                    except Exception as e:
+                        if not is_retryable(e):
+                            raise
+                        if attempt >= self.max_retries:
+                            self.record('dropped')
+                            logging.error(f"Giving up after {attempt + 1} attempts: {e}")
+                            raise
+                        self.record('retried')
+                        await asyncio.sleep(self.backoff_delay(attempt, e))
+                        attempt += 1
+            finally:
+                self.instrumentation.observe('request_retries', attempt, RETRY_BUCKETS, method=method)
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+from typer.testing import CliRunner
+
+# The CLI's modules import each other by their flat names (from config import ...), as when run from their directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_server import FakeCalendarServer  # noqa: E402
+from model.calendar import Calendar  # noqa: E402
+from scheduler import RequestScheduler  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    with FakeCalendarServer() as server:
+        yield server
+
+
+@pytest.fixture
+def calendar(server, tmp_path, monkeypatch):
+    # The response cache and the event cache are created in the working directory
+    monkeypatch.chdir(tmp_path)
+    calendar = Calendar(api_root=server.api_root)
+    # The quotas of the real API would only slow the tests down
+    calendar.scheduler = RequestScheduler(user_rate=1e6, project_rate=1e6, instrumentation=calendar.instrumentation)
+    return calendar
+
+
+@pytest.fixture
+def invoke(calendar, monkeypatch):
+    """Run a cli.py command against the fake server; returns the click Result."""
+    import cli
+    # Commands use the process-wide Calendar, here the one talking to the fake server
+    monkeypatch.setattr(cli, '_calendar', calendar)
+    monkeypatch.setattr(cli, '_event_store', None)
+    monkeypatch.setattr(cli, '_write_queue', None)
+    runner = CliRunner()
+    return lambda *args: runner.invoke(cli.app, list(args))
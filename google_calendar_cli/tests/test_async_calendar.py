@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+from model.async_calendar import AsyncCalendar
+from model.event import Event
+
+START = datetime(2026, 10, 20, 10, tzinfo=pytz.UTC)
+WINDOW = (START - timedelta(days=1), START + timedelta(days=30))
+
+
+def meeting(summary, day=0, **resource):
+    start = START + timedelta(days=day)
+    return dict({'summary': summary, 'start': {'dateTime': start.isoformat()},
+                 'end': {'dateTime': (start + timedelta(hours=1)).isoformat()}}, **resource)
+
+
+def run(calendar, server, work):
+    """Run `work(async_calendar)` on a fresh event loop and return its result."""
+    async def main():
+        async with AsyncCalendar(calendar=calendar, api_root=server.api_root) as async_calendar:
+            return await work(async_calendar)
+    return asyncio.run(main())
+
+
+async def titles(async_calendar, option=WINDOW):
+    return [event.title async for event in async_calendar.get_event_list(option, page_size=2)]
+
+
+def test_lists_every_page_in_start_order(server, calendar):
+    server.add_events([meeting(f"Meeting {day}", day) for day in (3, 1, 4, 2, 0)])
+    assert run(calendar, server, titles) == [f"Meeting {day}" for day in range(5)]
+
+
+def test_writes_round_trip(server, calendar):
+    async def work(async_calendar):
+        created = await async_calendar.add_event(Event.from_json(meeting("Draft")))
+        event = await async_calendar.fetch_event_by_id(created['id'])
+        event.title = "Review"
+        await async_calendar.update_event(event)
+        renamed = await async_calendar.fetch_event_by_id(created['id'])
+        await async_calendar.delete_event(created['id'])
+        return renamed.title, await titles(async_calendar)
+
+    assert run(calendar, server, work) == ("Review", [])
+
+
+def test_concurrent_requests_share_one_client(server, calendar, monkeypatch):
+    loads = []
+    credentials = type(calendar).credentials
+    monkeypatch.setattr(type(calendar), 'credentials', property(lambda self: loads.append(1) or credentials.fget(self)))
+    event_ids = server.add_events([meeting(f"Meeting {index}") for index in range(50)])
+
+    async def work(async_calendar):
+        events = await asyncio.gather(*(async_calendar.fetch_event_by_id(event_id) for event_id in event_ids))
+        return [event.title for event in events]
+
+    assert run(calendar, server, work) == [f"Meeting {index}" for index in range(50)]
+    # The credentials are looked up once, not by every request
+    assert len(loads) == 1
+
+
+def test_recurring_instances_match_the_synchronous_client(server, calendar):
+    master_id = server.add_events([meeting("Standup", recurrence=['RRULE:FREQ=DAILY;COUNT=5'])])[0]
+    expected = calendar.get_recurring_instances(master_id, *WINDOW)
+
+    async def work(async_calendar):
+        return await async_calendar.get_recurring_instances(master_id, *WINDOW)
+
+    instances = run(calendar, server, work)
+    assert [(event.event_id, event.start_time) for event in instances] == \
+        [(event.event_id, event.start_time) for event in expected]
+    assert len(instances) == 5
+
+
+@pytest.mark.parametrize('status', [404, 400])
+def test_errors_are_logged_and_return_none(server, calendar, status, caplog):
+    server.fail(status)
+
+    async def work(async_calendar):
+        return await async_calendar.fetch_event_by_id('missing')
+
+    with caplog.at_level('INFO'):
+        assert run(calendar, server, work) is None
+    assert "An error occurred" in caplog.text
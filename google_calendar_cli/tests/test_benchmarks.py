@@ -0,0 +1,163 @@
+# Latency of the hot paths against a FakeCalendarServer holding 1k events, measured with
+# pytest-benchmark. Save a baseline, then fail any run whose medians got slower:
+#
+#   python3 -m pytest tests/test_benchmarks.py --benchmark-autosave
+#   python3 -m pytest tests/test_benchmarks.py --benchmark-compare --benchmark-compare-fail=median:25%
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from dateutil.parser import isoparse
+
+from benchmark import allocated
+from fake_server import generate_events
+from model.event import Event
+from model.event_batch import EventBatch
+from model.recurring_event import RecurrenceRule, RecurringEvent
+from utility import IntervalSet
+from write_queue import WriteQueue, new_event_id
+
+SCALE = 1000
+# Synthetic corpus of the before/after decode micro-benchmark; every tenth event is all-day
+DECODE_SCALE = 100000
+# Event resources as the Calendar API returns them, with conference data, reminders and attachments
+RECORDED_EVENTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'events.json')
+
+
+@pytest.fixture
+def events(server):
+    resources = generate_events(SCALE)
+    server.add_events(resources)
+    return resources
+
+
+@pytest.fixture
+def window(events):
+    start = datetime.fromisoformat(events[0]['start']['dateTime'])
+    return start, start + timedelta(days=28)
+
+
+@pytest.fixture
+def run(invoke):
+    def run(*args):
+        result = invoke(*args)
+        assert result.exit_code == 0, result.output or result.exception
+    return run
+
+
+def test_decode_events(benchmark, events):
+    decoded = benchmark(lambda: [Event.from_json(resource) for resource in events])
+    assert len(decoded) == SCALE
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    resources = generate_events(DECODE_SCALE)
+    for resource in resources[::10]:
+        resource['start'] = {'date': resource['start']['dateTime'][:10]}
+        resource['end'] = {'date': resource['end']['dateTime'][:10]}
+    return resources
+
+
+def decode_with_isoparse(json_data):
+    """Event.from_json as it was before the cached fromisoformat parser, as the baseline of the micro-benchmark."""
+    start, end = json_data.get("start", {}), json_data.get("end", {})
+    start_time = end_time = None
+    daylong = False
+    if start.get("dateTime"):
+        start_time = isoparse(start["dateTime"])
+    elif start.get("date"):
+        start_time, daylong = isoparse(start["date"]), True
+    if end.get("dateTime"):
+        end_time = isoparse(end["dateTime"])
+    elif end.get("date"):
+        end_time, daylong = isoparse(end["date"]), True
+    return Event(json_data.get("summary"), start_time, end_time, json_data.get("description"),
+                 json_data.get("location"), daylong, [attendee["email"] for attendee in json_data.get("attendees", [])],
+                 json_data.get('id'))
+
+
+@pytest.mark.benchmark(group='decode 100k events')
+@pytest.mark.parametrize('decode', [decode_with_isoparse, Event.from_json], ids=['before', 'after'])
+def test_decode_corpus(benchmark, corpus, decode):
+    decoded = benchmark.pedantic(lambda: [decode(resource) for resource in corpus], rounds=3)
+    benchmark.extra_info['microseconds_per_event'] = benchmark.stats.stats.median / DECODE_SCALE * 1e6
+    assert [(event.start_time, event.end_time, event.daylong) for event in decoded[:20]] == \
+        [(event.start_time, event.end_time, event.daylong) for event in map(decode_with_isoparse, corpus[:20])]
+
+
+def test_get_event_list(benchmark, calendar, window):
+    assert benchmark(lambda: sum(1 for _ in calendar.get_event_list(window, 2500))) == SCALE
+
+
+def test_fetch_event_by_id(benchmark, calendar, events):
+    event_id = events[SCALE // 2]['id']
+    assert benchmark(calendar.fetch_event_by_id, event_id).event_id == event_id
+
+
+def test_recurring_instances_expanded_locally(benchmark, server, calendar):
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    master_id = server.add_events([RecurringEvent(
+        "Standup", now, now + timedelta(minutes=15), RecurrenceRule.from_rrule("FREQ=DAILY;COUNT=200")
+    ).to_json()])[0]
+    assert len(benchmark(calendar.get_recurring_instances, master_id)) == 200
+
+
+def test_free_slots(benchmark, events, window):
+    # Every other event, so that 20 minutes stay free between them
+    busy = [(datetime.fromisoformat(resource['start']['dateTime']), datetime.fromisoformat(resource['end']['dateTime']))
+            for resource in events[::2]]
+    slots = benchmark(lambda: list(IntervalSet(busy).free_slots(*window, timedelta(minutes=15))))
+    assert len(slots) >= SCALE // 2 - 1
+
+
+def test_flush_write_queue(benchmark, calendar):
+    queue = WriteQueue('writes.db')
+    start = datetime.now(timezone.utc).replace(microsecond=0)
+    body = {'summary': "Queued", 'start': {'dateTime': start.isoformat()},
+            'end': {'dateTime': (start + timedelta(hours=1)).isoformat()}}
+
+    def enqueue():
+        event_ids = [new_event_id() for _ in range(100)]
+        queue.enqueue_many([('insert', event_id, body, None, 'primary') for event_id in event_ids] +
+                           [('patch', event_id, {'location': "Room 1"}, None, 'primary') for event_id in event_ids])
+        return (queue, calendar), {}
+
+    results = benchmark.pedantic(WriteQueue.flush, setup=enqueue, rounds=10)
+    assert len(results) == 200 and queue.pending() == 0
+
+
+def test_cli_list_events_from_the_cache(benchmark, events, run):
+    run('list-events', 'm')
+    benchmark(run, 'list-events', 'm')
+
+
+def test_cli_search(benchmark, events, run):
+    run('search', "Event 500")
+    benchmark(run, 'search', "Event 500")
+
+
+def test_event_batch_memory(benchmark, events):
+    event_bytes = allocated(lambda: [Event.from_json(resource) for resource in events]) / SCALE
+    batch_bytes = allocated(lambda: EventBatch.from_json(events)) / SCALE
+    benchmark.extra_info.update(event_bytes_per_event=event_bytes, batch_bytes_per_event=batch_bytes)
+    assert batch_bytes < event_bytes * 0.75
+    assert len(benchmark(EventBatch.from_json, events)) == SCALE
+
+
+def test_payload_bytes_per_event(benchmark, server, calendar):
+    with open(RECORDED_EVENTS) as fixture:
+        recorded = json.load(fixture)
+    server.add_events([dict(resource, id=f"{resource['id']}{copy}") for copy in range(SCALE // len(recorded))
+                       for resource in recorded])
+
+    def bytes_per_event(fields):
+        before = server.bytes_sent
+        count = sum(1 for _ in calendar.get_event_list(None, 2500, fields=fields))
+        return (server.bytes_sent - before) / count
+
+    full, masked = bytes_per_event('*'), bytes_per_event(Event.JSON_FIELDS)
+    benchmark.extra_info.update(full_bytes_per_event=full, masked_bytes_per_event=masked)
+    assert masked < full * 0.4
+    benchmark(bytes_per_event, Event.JSON_FIELDS)
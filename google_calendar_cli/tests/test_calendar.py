@@ -0,0 +1,30 @@
+ATTENDEES = [{'email': 'a@example.com', 'responseStatus': 'accepted', 'optional': True, 'displayName': 'A'},
+             {'email': 'b@example.com', 'responseStatus': 'declined'}]
+
+
+def add_meeting(server, attendees=ATTENDEES):
+    return server.add_events([{'summary': "Meeting", 'attendees': attendees,
+                               'start': {'dateTime': '2026-10-20T10:00:00+00:00'},
+                               'end': {'dateTime': '2026-10-20T11:00:00+00:00'}}])[0]
+
+
+def attendees_of(calendar, event_id):
+    return calendar.batch_get_events([event_id], '*')[event_id][0]['attendees']
+
+
+def test_attendee_changes_keep_the_other_attendees_fields(server, calendar):
+    event_id = add_meeting(server)
+    calendar.add_attendees_to_event(calendar.fetch_event_by_id(event_id), ['c@example.com', 'A@example.com'])
+    assert attendees_of(calendar, event_id) == ATTENDEES + [{'email': 'c@example.com'}]
+
+    calendar.remove_attendees_from_event(calendar.fetch_event_by_id(event_id), ['B@example.com'])
+    assert attendees_of(calendar, event_id) == [ATTENDEES[0], {'email': 'c@example.com'}]
+
+
+def test_attendee_change_of_a_stale_event_is_refused(server, calendar):
+    event_id = add_meeting(server)
+    stale = calendar.fetch_event_by_id(event_id)
+    calendar.add_attendees_to_event(calendar.fetch_event_by_id(event_id), ['c@example.com'])
+    assert calendar.remove_attendees_from_event(stale, ['a@example.com']) is None
+    assert [attendee['email'] for attendee in attendees_of(calendar, event_id)] == \
+        ['a@example.com', 'b@example.com', 'c@example.com']
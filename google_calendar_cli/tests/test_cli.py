@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+START = {'dateTime': '2026-10-20T10:00:00+00:00'}
+END = {'dateTime': '2026-10-20T11:00:00+00:00'}
+
+
+def test_delete_event(server, invoke, caplog):
+    event_id = server.add_events([{'summary': "Planning", 'start': START, 'end': END}])[0]
+    assert invoke('delete-event', event_id).exit_code == 0
+    assert server.calendars['primary'][event_id]['status'] == 'cancelled'
+    assert caplog.messages[-1] == "Event deleted."
+
+    # The API answers 410 Gone to a second delete: the event is deleted either way
+    assert invoke('delete-event', event_id).exit_code == 0
+    assert caplog.messages[-1] == "Event deleted."
+
+
+def test_delete_of_an_unknown_event(server, invoke, caplog):
+    assert invoke('delete-event', 'missing').exit_code == 0
+    assert caplog.messages[-1] == "Event not found."
+    assert "Event deleted." not in caplog.messages
+
+
+def test_add_event_refuses_to_double_book(server, invoke, caplog):
+    server.add_events([{'summary': "Planning", 'start': START, 'end': END}])
+    overlapping = invoke('add-event', "Review", '2026-10-20 10:30:00', '2026-10-20 11:30:00', '--check-conflicts')
+    assert overlapping.exit_code == 0
+    assert caplog.messages[-1] == "Not adding the event, these calendars are busy at that time: primary"
+    assert len(server.calendars['primary']) == 1
+
+    following = invoke('add-event', "Review", '2026-10-20 11:00:00', '2026-10-20 12:00:00', '--check-conflicts')
+    assert following.exit_code == 0
+    assert caplog.messages[-1].startswith("Event created:")
+    assert len(server.calendars['primary']) == 2
+
+
+def test_profile_and_metrics_count_builds_and_requests(server, invoke, caplog, tmp_path):
+    server.add_events([{'summary': "Planning", 'start': START, 'end': END}])
+    metrics_file = tmp_path / 'metrics.prom'
+    assert invoke('--profile', '--metrics-file', str(metrics_file), 'list-events', 'y', '--no-cache').exit_code == 0
+    assert caplog.messages[-1].splitlines()[-1].endswith("builds 1, refreshes 0")
+    metrics = metrics_file.read_text().splitlines()
+    assert "gcal_builds_total 1" in metrics and "gcal_refreshes_total 0" in metrics
+
+
+def stored_times(server):
+    return sorted((event['summary'], event['start'].get('dateTime', event['start'].get('date')),
+                   event['end'].get('dateTime', event['end'].get('date')))
+                  for event in server.calendars['primary'].values())
+
+
+def test_add_event_keeps_times_and_makes_dates_all_day(server, invoke):
+    assert invoke('add-event', "Timed", '2026-10-20 10:00:00', '2026-10-20 11:00:00').exit_code == 0
+    assert invoke('add-event', "All day", '2026-10-20', '2026-10-21').exit_code == 0
+    assert stored_times(server) == [("All day", '2026-10-20', '2026-10-21'),
+                                    ("Timed", '2026-10-20T10:00:00', '2026-10-20T11:00:00')]
+
+
+def test_bulk_add_round_trips_timed_and_all_day_events(server, invoke, tmp_path, caplog):
+    path = tmp_path / 'events.jsonl'
+    path.write_text("\n".join([
+        json.dumps({'summary': "Timed", 'start': START, 'end': END}),
+        '{"summary": ',
+        json.dumps({'summary': "All day", 'start': {'date': '2026-10-20'}, 'end': {'date': '2026-10-21'}}),
+    ]) + "\n")
+    assert invoke('bulk-add', str(path)).exit_code == 0
+    assert "Skipping line 2: " in caplog.text
+    assert stored_times(server) == [("All day", '2026-10-20', '2026-10-21'),
+                                    ("Timed", START['dateTime'], END['dateTime'])]
+
+
+def test_bulk_add_reports_an_id_taken_by_another_event(server, invoke, tmp_path, caplog):
+    server.add_events([{'id': 'taken', 'summary': "Planning", 'start': START, 'end': END}])
+    path = tmp_path / 'events.jsonl'
+    path.write_text(json.dumps({'id': 'taken', 'summary': "Review", 'start': START, 'end': END}) + "\n")
+    assert invoke('bulk-add', str(path)).exit_code == 0
+    assert caplog.messages[-1] == "0 succeeded, 1 failed."
+    assert stored_times(server) == [("Planning", START['dateTime'], END['dateTime'])]
+
+
+def test_bulk_add_rejects_a_malformed_file(server, invoke, tmp_path, caplog):
+    path = tmp_path / 'events.json'
+    path.write_text(json.dumps([{'summary': "Timed", 'start': START, 'end': END}])[:-2] + "\n")
+    assert invoke('bulk-add', str(path)).exit_code == 0
+    assert f"{path}, line 2: " in caplog.text
+    assert server.calendars['primary'] == {}
+
+
+def test_bulk_update_needs_ids(server, invoke, tmp_path, caplog):
+    event_id = server.add_events([{'summary': "Planning", 'start': START, 'end': END}])[0]
+    path = tmp_path / 'events.json'
+    path.write_text(json.dumps([{'id': event_id, 'summary': "Review", 'start': START, 'end': END},
+                                {'summary': "New", 'start': START, 'end': END}]))
+    assert invoke('bulk-update', str(path)).exit_code == 0
+    assert caplog.messages[-1] == "Every event needs an id; these have none: New"
+
+    path.write_text(json.dumps([{'id': event_id, 'summary': "Review", 'start': START, 'end': END}]))
+    assert invoke('bulk-update', str(path)).exit_code == 0
+    assert stored_times(server) == [("Review", START['dateTime'], END['dateTime'])]
+
+
+def test_unknown_period_fails_before_any_request(server, invoke):
+    result = invoke('list-events', 'nxt week', '--no-cache')
+    assert result.exit_code == 2
+    assert "nxt week" in result.output
+    assert server.request_count == 0
+
+
+@pytest.mark.parametrize('cache', ['--cache', '--no-cache'])
+def test_all_day_events_are_listed_on_their_day_in_the_calendar_time_zone(server, invoke, caplog, cache):
+    server.time_zone = 'America/Los_Angeles'
+    server.add_events([{'summary': "Offsite", 'start': {'date': '2026-10-20'}, 'end': {'date': '2026-10-21'}}])
+    assert invoke('list-events', '2026-10-19', cache).exit_code == 0
+    assert caplog.messages[-1] == "No events found."
+    assert invoke('list-events', '2026-10-20', cache).exit_code == 0
+    assert any("Offsite" in message for message in caplog.messages[-2:])
+
+
+def test_add_attendees_to_one_event_and_to_a_selection(server, invoke):
+    event_ids = server.add_events([{'summary': summary, 'start': START, 'end': END,
+                                    'attendees': [{'email': 'lead@example.com'}] if summary == "Team" else []}
+                                   for summary in ("Team", "Other")])
+    assert invoke('add-attendees', event_ids[1], 'a@example.com').exit_code == 0
+    assert invoke('add-attendees', 'b@example.com', '--with', 'lead@example.com').exit_code == 0
+    assert [[attendee['email'] for attendee in server.calendars['primary'][event_id].get('attendees', [])]
+            for event_id in event_ids] == [['lead@example.com', 'b@example.com'], ['a@example.com']]
@@ -0,0 +1,38 @@
+import json
+import os
+import socket
+
+import typer
+
+import daemon
+
+START = {'dateTime': '2026-10-20T10:00:00+00:00'}
+END = {'dateTime': '2026-10-20T11:00:00+00:00'}
+
+
+def handle(command, argv, cwd):
+    """Serve one command line sent from a client in `cwd`; returns the messages the client receives."""
+    client, connection = socket.socketpair()
+    with client, connection:
+        client.sendall(json.dumps({'argv': argv, 'cwd': str(cwd)}).encode() + b'\n')
+        daemon._handle(command, connection, 'cli.py', None, None)
+        connection.shutdown(socket.SHUT_WR)
+        return [json.loads(line) for line in client.makefile('rb')]
+
+
+def test_client_paths_resolve_without_changing_directory(server, invoke, tmp_path):
+    import cli
+
+    client_directory = tmp_path / 'client'
+    client_directory.mkdir()
+    (client_directory / 'events.jsonl').write_text(json.dumps({'summary': "Planning", 'start': START, 'end': END}))
+    daemon_directory = os.getcwd()
+
+    messages = handle(typer.main.get_command(cli.app), ['bulk-add', 'events.jsonl'], client_directory)
+    assert messages[-1] == {'exit': 0}
+    assert [event['summary'] for event in server.calendars['primary'].values()] == ["Planning"]
+    assert os.getcwd() == daemon_directory
+    assert daemon.client_path('events.jsonl') == 'events.jsonl'
+    # The token and caches stay in the daemon's directory
+    assert os.path.dirname(cli.get_calendar().token_file) == daemon_directory
+    assert not any(name.endswith('.db') for name in os.listdir(client_directory))
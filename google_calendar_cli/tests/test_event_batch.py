@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+
+from fake_server import generate_events
+from model.event import Event
+from model.event_batch import EventBatch
+from model.recurring_event import RecurringEvent
+
+RESOURCES = [
+    {'id': 'timed', 'etag': '"1"', 'iCalUID': 'timed@google.com', 'summary': "Timed", 'location': "Room 1",
+     'start': {'dateTime': '2026-10-20T10:00:00+02:00', 'timeZone': 'Europe/Berlin'},
+     'end': {'dateTime': '2026-10-20T11:00:00+02:00', 'timeZone': 'Europe/Berlin'},
+     'attendees': [{'email': 'a@example.com'}, {'email': 'b@example.com'}]},
+    {'id': 'allday', 'etag': '"2"', 'iCalUID': 'allday@google.com', 'summary': "All day",
+     'start': {'date': '2026-10-19'}, 'end': {'date': '2026-10-20'}},
+    {'id': 'master', 'etag': '"3"', 'iCalUID': 'master@google.com', 'summary': "Standup",
+     'start': {'dateTime': '2026-10-18T09:00:00Z'}, 'end': {'dateTime': '2026-10-18T09:15:00Z'},
+     'recurrence': ['RRULE:FREQ=DAILY;COUNT=5']},
+    {'id': 'master_20261019', 'recurringEventId': 'master', 'summary': "Standup",
+     'start': {'dateTime': '2026-10-19T09:00:00Z'}, 'end': {'dateTime': '2026-10-19T09:15:00Z'}},
+]
+
+
+def fields(event):
+    recurrence = getattr(event, 'recurrence', None)
+    return (type(event), event.title, event.start_time, event.end_time, event.description, event.location,
+            event.daylong, event.attendees, event.event_id, event.etag, event.time_zone, event.ical_uid,
+            recurrence.to_rrule() if recurrence else None)
+
+
+def test_views_match_decoded_events():
+    decoded = [RecurringEvent.from_json(resource) if 'recurrence' in resource or 'recurringEventId' in resource
+               else Event.from_json(resource) for resource in RESOURCES]
+    assert [fields(event) for event in EventBatch.from_json(RESOURCES)] == [fields(event) for event in decoded]
+
+
+def test_filter_range_keeps_overlapping_events():
+    batch = EventBatch.from_json(RESOURCES)
+    found = batch.filter_range(datetime(2026, 10, 19, 9, 10, tzinfo=timezone.utc),
+                               datetime(2026, 10, 20, 8, 30, tzinfo=timezone.utc))
+    assert [event.event_id for event in found] == ['timed', 'allday', 'master_20261019']
+
+
+def test_sorted_by_start_is_stable():
+    batch = EventBatch.from_json(RESOURCES + [dict(RESOURCES[1], id='allday2')])
+    assert [event.event_id for event in batch.sorted_by_start()] == \
+        ['master', 'allday', 'allday2', 'master_20261019', 'timed']
+
+
+def test_merged_event_list_is_ordered_across_calendars(server, calendar):
+    start = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    primary = server.add_events(generate_events(50, start, seed=1))
+    team = server.add_events([dict(resource, id=f"team{index}") for index, resource in
+                              enumerate(generate_events(50, start + timedelta(minutes=30), seed=2))], 'team')
+    events = list(calendar.get_merged_event_list((start, start + timedelta(days=28)), ['primary', 'team']))
+    assert sorted(event.event_id for event in events) == sorted(primary + team)
+    assert [event.start_time for event in events] == sorted(event.start_time for event in events)
+    assert all(event.etag and event.ical_uid for event in events)
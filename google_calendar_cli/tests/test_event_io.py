@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from event_io import EventFileError, read_events
+
+START = '2026-10-20T10:00:00+00:00'
+END = '2026-10-20T11:00:00+00:00'
+RESOURCE = {'summary': "Planning", 'start': {'dateTime': START}, 'end': {'dateTime': END}}
+
+
+def write(tmp_path, name, text, encoding='utf-8'):
+    path = tmp_path / name
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+
+def test_unreadable_jsonl_lines_are_skipped_with_their_number(tmp_path, caplog):
+    path = write(tmp_path, 'events.jsonl', '\n'.join([json.dumps(RESOURCE), '{"summary": ', '', '[1, 2]',
+                                                      json.dumps({'summary': "No times"}),
+                                                      json.dumps(dict(RESOURCE, summary="Review"))]))
+    assert [event.title for event in read_events(path)] == ["Planning", "Review"]
+    assert [record.getMessage().split(':')[0] for record in caplog.records] == \
+        ["Skipping line 2", "Skipping line 4", "Skipping line 5"]
+
+
+def test_short_csv_rows_are_skipped_with_their_number(tmp_path, caplog):
+    path = write(tmp_path, 'events.csv', f"uid,title,start,end\nu1,Planning,{START},{END}\nu2,Short,{START}\n"
+                                         f"u3,Review,{START},{END}\n")
+    assert [event.title for event in read_events(path)] == ["Planning", "Review"]
+    assert [record.getMessage() for record in caplog.records] == ["Skipping line 3: no end"]
+
+
+def test_a_file_that_cannot_be_decoded_stops_at_its_line(tmp_path):
+    text = json.dumps(RESOURCE) + '\n' + json.dumps({'summary': "Café"}, ensure_ascii=False)
+    path = write(tmp_path, 'events.jsonl', text, encoding='latin-1')
+    events = read_events(path)
+    assert next(events).title == "Planning"
+    with pytest.raises(EventFileError) as error:
+        next(events)
+    assert error.value.line == 2
+
+
+def import_file(tmp_path, invoke, name, text):
+    result = invoke('import', write(tmp_path, name, text))
+    assert result.exit_code == 0, result.exception
+
+
+def test_import_reports_bad_lines_and_imports_the_rest(server, tmp_path, invoke, caplog):
+    import_file(tmp_path, invoke, 'events.jsonl', json.dumps(RESOURCE) + '\n{"summary": \n')
+    assert "Skipping line 2" in caplog.text
+    assert [event['summary'] for event in server.calendars['primary'].values()] == ["Planning"]
+
+
+def test_import_stops_when_the_file_cannot_be_read(server, tmp_path, invoke, caplog):
+    text = json.dumps(RESOURCE) + '\n' + json.dumps(dict(RESOURCE, summary="Café"), ensure_ascii=False) + '\n'
+    path = write(tmp_path, 'events.jsonl', text, encoding='latin-1')
+    assert invoke('import', path).exit_code == 0
+    assert f"Stopped reading {path}, line 2:" in caplog.text
+    assert [event['summary'] for event in server.calendars['primary'].values()] == ["Planning"]
+
+
+def test_import_reports_api_errors(server, tmp_path, invoke, caplog):
+    server.fail(403)
+    import_file(tmp_path, invoke, 'events.jsonl', json.dumps(RESOURCE) + '\n')
+    assert "nothing was imported" in caplog.text
+    assert server.calendars['primary'] == {}
@@ -0,0 +1,32 @@
+import os
+import re
+import subprocess
+import sys
+
+from config import CLI_IMPORT_TIME_LIMIT
+
+CLI_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_PACKAGES = ('googleapiclient', 'google_auth_oauthlib', 'httplib2', 'httpx')
+# import time: <self us> | <cumulative us> | <indented module name>
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+RUNS = 3
+
+
+def import_times():
+    """Cumulative import time in seconds of every module `import cli` loads, from `python -X importtime`."""
+    # A fresh interpreter, since this one has already imported everything the other tests use
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import cli'], cwd=CLI_DIRECTORY,
+                            capture_output=True, text=True, check=True)
+    return {match[4]: int(match[2]) / 1e6 for match in map(IMPORT_TIME_LINE.match, result.stderr.splitlines())
+            if match}
+
+
+def test_importing_the_cli_loads_no_api_client():
+    loaded = {name.split('.')[0] for name in import_times()}
+    assert loaded.isdisjoint(HEAVY_PACKAGES), sorted(loaded.intersection(HEAVY_PACKAGES))
+
+
+def test_importing_the_cli_stays_within_its_time_budget():
+    # The fastest of a few runs, so that a busy machine does not fail the check
+    seconds = min(import_times()['cli'] for _ in range(RUNS))
+    assert seconds <= CLI_IMPORT_TIME_LIMIT, f"import cli took {seconds:.3f}s, over {CLI_IMPORT_TIME_LIMIT}s"
@@ -0,0 +1,72 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from dateutil.rrule import rrulestr
+
+from model.recurring_event import RecurrenceRule, WEEKDAYS
+
+RANDOM_RULES = 500
+
+
+def random_rule(randomizer):
+    """A random RRULE using only the parts RecurrenceRule expands, in random order."""
+    freq = randomizer.choice(["DAILY", "WEEKLY", "MONTHLY", "YEARLY"])
+    interval = randomizer.randint(1, 3)
+    parts = [f"FREQ={freq}", f"INTERVAL={interval}"]
+    if randomizer.random() < 0.7:
+        parts.append(f"COUNT={randomizer.randint(1, 25)}")
+    elif randomizer.random() < 0.5:
+        parts.append(f"UNTIL={2025 + randomizer.randint(0, 2)}0{randomizer.randint(1, 9)}15T000000")
+    if randomizer.random() < 0.5:
+        days = randomizer.sample(WEEKDAYS, randomizer.randint(1, 3))
+        if freq in ("MONTHLY", "YEARLY") and randomizer.random() < 0.4:
+            days = [f"{randomizer.choice([1, 2, -1])}{day}" for day in days]
+        parts.append("BYDAY=" + ",".join(days))
+    if freq == "YEARLY" and randomizer.random() < 0.2:
+        parts.append("BYYEARDAY=" + ",".join(map(str, randomizer.sample([1, 50, 100, 200, 365, -1, -30], 2))))
+    # Months that an interval skips for good never match, which only makes both sides search for long
+    elif randomizer.random() < 0.3 and not (freq == "MONTHLY" and interval > 1):
+        parts.append("BYMONTH=" + ",".join(map(str, randomizer.sample(range(1, 13), randomizer.randint(1, 3)))))
+    if randomizer.random() < 0.2:
+        parts.append("BYHOUR=" + ",".join(map(str, randomizer.sample(range(24), 2))))
+    if randomizer.random() < 0.4:
+        parts.append("WKST=" + randomizer.choice(WEEKDAYS))
+    randomizer.shuffle(parts)
+    return ";".join(parts)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_expansion_matches_dateutil(seed):
+    randomizer = random.Random(seed)
+    for _ in range(RANDOM_RULES):
+        rrule = random_rule(randomizer)
+        dtstart = datetime(2024, 1, 1, 9, 30) + timedelta(days=randomizer.randint(0, 700),
+                                                          hours=randomizer.randint(0, 10))
+        end = dtstart + timedelta(days=3 * 366)
+        expected = rrulestr(rrule, dtstart=dtstart).between(dtstart - timedelta(seconds=1), end)
+        assert list(RecurrenceRule.from_rrule(rrule).between(dtstart, dtstart, end)) == expected, rrule
+
+
+def test_week_start_anchors_the_interval():
+    rrule = "FREQ=WEEKLY;INTERVAL=2;BYDAY=SU,MO;WKST=SU;COUNT=6"
+    dtstart = datetime(2024, 6, 5, 9)
+    assert list(RecurrenceRule.from_rrule(rrule).iter_occurrences(dtstart)) == list(rrulestr(rrule, dtstart=dtstart))
+    assert RecurrenceRule.from_rrule(rrule).to_rrule().endswith(";WKST=SU")
+
+
+@pytest.mark.parametrize('rrule, supported', [
+    ("FREQ=WEEKLY;BYDAY=MO,WE;WKST=SU", True),
+    ("FREQ=HOURLY;COUNT=5", False),
+    ("FREQ=MINUTELY;INTERVAL=15", False),
+    ("FREQ=MONTHLY;BYMONTHDAY=15", False),
+    ("FREQ=WEEKLY;WKST=XX", False),
+    ("COUNT=3", False),
+])
+def test_is_supported(rrule, supported):
+    assert RecurrenceRule.is_supported(rrule) is supported
+
+
+def test_impossible_rule_stops_at_the_window():
+    rule = RecurrenceRule.from_rrule("FREQ=YEARLY;BYYEARDAY=1;BYMONTH=6")
+    assert list(rule.between(datetime(2024, 1, 1), datetime(2024, 1, 1), datetime(2030, 1, 1))) == []
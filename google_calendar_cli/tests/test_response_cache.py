@@ -0,0 +1,56 @@
+from model.event import Event, fields_mask
+from response_cache import ResponseCache
+
+START = {'dateTime': '2026-10-20T10:00:00+00:00'}
+END = {'dateTime': '2026-10-20T11:00:00+00:00'}
+
+
+def test_entries_are_kept_per_fields_mask_and_survive_a_restart(tmp_path):
+    path = tmp_path / 'responses.db'
+    cache = ResponseCache(path)
+    cache.put('primary/a', '*', '"1"', {'id': 'a', 'summary': "Full"})
+    cache.put('primary/a', 'id', '"1"', {'id': 'a'})
+    cache.put('primary/b', '*', None, {'id': 'b'})
+
+    reopened = ResponseCache(path)
+    assert reopened.etag('primary/a', '*') == '"1"'
+    assert reopened.body('primary/a', '*') == {'id': 'a', 'summary': "Full"}
+    assert reopened.body('primary/a', 'id') == {'id': 'a'}
+    # A response without an ETag cannot be revalidated, so it is not stored
+    assert reopened.etag('primary/b', '*') is None
+
+    reopened.invalidate('primary/a')
+    assert reopened.body('primary/a', '*') is None and reopened.body('primary/a', 'id') is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(tmp_path / 'responses.db', max_bytes=300)
+    for name in 'abc':
+        cache.put(f'primary/{name}', '*', '"1"', {'id': name, 'description': name * 60})
+    cache.etag('primary/a', '*')
+    cache.put('primary/d', '*', '"1"', {'id': 'd', 'description': 'd' * 60})
+    assert [name for name in 'abcd' if cache.etag(f'primary/{name}', '*')] == ['a', 'c', 'd']
+
+
+def test_unchanged_events_are_served_from_the_cache(server, calendar):
+    event_id = server.add_events([{'summary': "Planning", 'start': START, 'end': END}])[0]
+    assert calendar.fetch_event_by_id(event_id).title == "Planning"
+
+    # Changed behind the ETag's back: only a 304 can explain getting the cached summary
+    server.calendars['primary'][event_id]['summary'] = "Not sent"
+    before = server.request_count
+    assert calendar.fetch_event_by_id(event_id).title == "Planning"
+    assert server.request_count == before + 1
+
+    server.add_events([dict(server.calendars['primary'][event_id], summary="Moved")])
+    assert calendar.fetch_event_by_id(event_id).title == "Moved"
+
+
+def test_writes_invalidate_the_cached_event(server, calendar):
+    event_id = server.add_events([{'summary': "Planning", 'start': START, 'end': END}])[0]
+    calendar.fetch_event_by_id(event_id)
+    mask = fields_mask(Event.JSON_FIELDS)
+    assert calendar.response_cache.etag(f'primary/{event_id}', mask) is not None
+    calendar.apply_writes([(0, 'patch', 'primary', event_id, {'summary': "Review"}, None)])
+    assert calendar.response_cache.etag(f'primary/{event_id}', mask) is None
+    assert calendar.fetch_event_by_id(event_id).title == "Review"
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from scheduler import RequestScheduler, TokenBucket, BULK, is_retryable
+
+
+class FakeRequest:
+    """Stands in for an HttpRequest: fails with the queued errors, then returns `result`."""
+
+    def __init__(self, errors=(), result='ok'):
+        self.errors = list(errors)
+        self.result = result
+        self.calls = 0
+
+    def execute(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+def http_error(status, reason='backendError'):
+    content = f'{{"error": {{"errors": [{{"reason": "{reason}"}}], "code": {status}, "message": "{reason}"}}}}'.encode()
+    return HttpError(httplib2.Response({'status': status}), content)
+
+
+def test_bucket_never_goes_negative():
+    bucket = TokenBucket(rate=10)
+    assert bucket.delay(10) == 0
+    bucket.take(10)
+    assert bucket.delay(1) > 0
+    bucket.take(50)
+    assert bucket.tokens >= 0
+
+
+def test_bulk_cost_above_capacity_leaves_room_for_interactive_calls():
+    scheduler = RequestScheduler(user_rate=20, project_rate=1000, bulk_reserve=0.2)
+    bulk = threading.Thread(target=scheduler.execute, args=(FakeRequest(),), kwargs={'priority': BULK, 'cost': 50})
+    bulk.start()
+    time.sleep(0.2)
+    waits = []
+    for _ in range(3):
+        start = time.perf_counter()
+        scheduler.execute(FakeRequest())
+        waits.append(time.perf_counter() - start)
+    bulk.join()
+    # The bulk batch needs about 2.5 s of quota; interactive calls only wait for a token or so
+    assert max(waits) < 0.5
+    assert all(bucket.tokens >= 0 for bucket in scheduler.buckets)
+
+
+def test_throttling_is_counted_once_per_request():
+    scheduler = RequestScheduler(user_rate=50, project_rate=1000)
+
+    def send():
+        for _ in range(20):
+            scheduler.execute(FakeRequest())
+
+    # Threads competing for the refills wake up to an empty bucket again and again
+    threads = [threading.Thread(target=send) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert scheduler.metrics['requests'] == 120
+    assert 0 < scheduler.metrics['throttled'] <= 120
+
+
+def test_both_buckets_or_neither():
+    scheduler = RequestScheduler(user_rate=100, project_rate=5)
+    for _ in range(5):
+        scheduler.execute(FakeRequest())
+    user_tokens = scheduler.buckets[0].tokens
+    assert scheduler._acquire_delay('interactive', 1) > 0
+    assert scheduler.buckets[0].tokens == pytest.approx(user_tokens, abs=1)
+
+
+def test_retries_transient_errors_then_gives_up():
+    scheduler = RequestScheduler(user_rate=1000, project_rate=1000, backoff_base=0.001, max_retries=2)
+    request = FakeRequest([http_error(503), http_error(429)])
+    assert scheduler.execute(request) == 'ok'
+    assert request.calls == 3 and scheduler.metrics['retried'] == 2
+
+    request = FakeRequest([http_error(503)] * 5)
+    with pytest.raises(HttpError):
+        scheduler.execute(request)
+    assert request.calls == 3 and scheduler.metrics['dropped'] == 1
+
+
+def test_client_errors_are_not_retried():
+    scheduler = RequestScheduler(user_rate=1000, project_rate=1000, backoff_base=0.001)
+    request = FakeRequest([http_error(404, 'notFound')])
+    with pytest.raises(HttpError):
+        scheduler.execute(request)
+    assert request.calls == 1
+    assert is_retryable(http_error(403, 'userRateLimitExceeded'))
+    assert not is_retryable(http_error(403, 'forbidden'))
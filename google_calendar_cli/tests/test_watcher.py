@@ -0,0 +1,80 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+import pytest
+
+from event_store import EventStore
+from watcher import Watcher
+
+START = {'dateTime': '2026-10-20T10:00:00+00:00'}
+END = {'dateTime': '2026-10-20T11:00:00+00:00'}
+
+
+@pytest.fixture
+def lines():
+    return queue.Queue()
+
+
+@pytest.fixture
+def watcher(calendar, lines):
+    # Retry failed channels within milliseconds rather than seconds
+    calendar.scheduler.backoff_base = 0.001
+    watcher = Watcher(calendar, EventStore(calendar, 'events.db'), ['primary'], port=0,
+                      output=lambda line: lines.put(json.loads(line)))
+    yield watcher
+    watcher.receiver.server_close()
+
+
+def test_changes_are_streamed_as_notifications_arrive(server, watcher, lines):
+    server.add_events([{'summary': "Before", 'start': START, 'end': END}])
+    streamed = []
+
+    def change_and_stop():
+        try:
+            while not server.channels:
+                time.sleep(0.01)
+            event_id = server.add_events([{'summary': "Planning", 'start': START, 'end': END}])[0]
+            line = lines.get(timeout=10)
+            streamed.append((line['change'], line['event']['id'] == event_id, line['event']['summary']))
+        finally:
+            watcher.stop()
+
+    # Sync first, so that the event is streamed whether it lands before or after the catch-up sync
+    watcher.store.sync('primary')
+    # The event cache is used from the thread that created it, so the watcher runs on this one
+    thread = threading.Thread(target=change_and_stop)
+    thread.start()
+    watcher.run()
+    thread.join()
+    assert streamed == [('updated', True, "Planning")]
+    assert lines.empty()
+    assert not server.channels
+
+
+def test_a_channel_that_fails_to_start_is_retried(server, calendar, watcher):
+    calendar.service
+    server.fail(400)
+    assert watcher.open_channel('primary') is None
+    assert watcher.failures['primary'][0] == 0
+    assert watcher._until_renewal() <= calendar.scheduler.backoff_base
+
+    time.sleep(calendar.scheduler.backoff_base)
+    watcher.renew_channels()
+    assert [calendar_id for calendar_id, _ in watcher.channels.values()] == ['primary']
+    assert not watcher.failures
+    assert len(server.channels) == 1
+
+
+def test_a_failed_first_sync_is_reported_as_an_error(server, calendar, watcher, lines, caplog):
+    calendar.service
+    server.fail(400)
+    with caplog.at_level(logging.ERROR):
+        watcher.emit('primary')
+    assert lines.empty()
+    assert caplog.messages[-1] == "Could not sync calendar primary"
+
+    watcher.emit('primary')
+    assert lines.get_nowait() == {'calendarId': 'primary', 'change': 'resync'}
@@ -0,0 +1,122 @@
+import pytest
+
+from write_queue import WriteQueue, _coalesce, new_event_id
+
+START = {'dateTime': '2026-10-20T10:00:00+00:00'}
+END = {'dateTime': '2026-10-20T11:00:00+00:00'}
+
+
+@pytest.mark.parametrize('first, second, combined', [
+    (('insert', {'summary': "A", 'start': START}, None, 0), ('patch', {'location': "Room"}, None, 0),
+     ('insert', {'summary': "A", 'start': START, 'location': "Room"}, None, 0)),
+    (('patch', {'start': {'dateTime': 'x', 'timeZone': 'UTC'}}, '"1"', 0),
+     ('patch', {'start': {'dateTime': 'y'}}, '"2"', 0),
+     ('patch', {'start': {'dateTime': 'y', 'timeZone': 'UTC'}}, '"1"', 0)),
+    (('patch', {'summary': "A"}, '"1"', 0), ('update', {'summary': "B"}, None, 0),
+     ('update', {'summary': "B"}, '"1"', 0)),
+    (('insert', {'summary': "A"}, None, 0), ('update', {'summary': "B"}, None, 0),
+     ('insert', {'summary': "B"}, None, 0)),
+    (('insert', {'summary': "A"}, None, 0), ('delete', None, None, 0), ('skip', None, None, 0)),
+    (('insert', {'summary': "A"}, None, 1), ('delete', None, None, 0), ('delete', None, None, 1)),
+    (('patch', {'summary': "A"}, None, 0), ('delete', None, None, 0), ('delete', None, None, 0)),
+    # A write that was sent may have been applied, and a delete ends the event's writes
+    (('patch', {'summary': "A"}, None, 1), ('patch', {'summary': "B"}, None, 0), None),
+    (('delete', None, None, 0), ('patch', {'summary': "B"}, None, 0), None),
+    (('patch', {'summary': "A"}, None, 0), ('insert', {'summary': "B"}, None, 0), None),
+])
+def test_coalesce(first, second, combined):
+    assert _coalesce(first, second) == combined
+
+
+@pytest.fixture
+def queue(calendar):
+    # The calendar fixture already runs in a temporary directory
+    return WriteQueue('writes.db', retry_after=60)
+
+
+def sent_requests(server, calendar, queue, **options):
+    """Flush the queue and return the flush result and the number of API requests it took."""
+    calendar.service
+    before = server.request_count
+    results = queue.flush(calendar, **options)
+    return results, server.request_count - before
+
+
+def test_writes_of_one_event_are_sent_as_one_request(server, calendar, queue):
+    event_id = new_event_id()
+    seqs = queue.enqueue_many([('insert', event_id, {'summary': "Draft", 'start': START, 'end': END}, None,
+                                 'primary'),
+                        ('patch', event_id, {'location': "Room 1"}, None, 'primary'),
+                        ('patch', event_id, {'summary': "Review"}, None, 'primary')])
+    results, requests = sent_requests(server, calendar, queue)
+    # One batch HTTP call carrying a single insert
+    assert requests == 2
+    assert sorted(results) == seqs and all(error is None for _, error in results.values())
+    assert queue.pending() == 0
+    stored = server.calendars['primary'][event_id]
+    assert (stored['summary'], stored['location']) == ("Review", "Room 1")
+
+
+def test_an_insert_deleted_before_it_was_sent_costs_no_request(server, calendar, queue):
+    event_id = new_event_id()
+    queue.enqueue('insert', event_id, {'summary': "Draft", 'start': START, 'end': END})
+    queue.enqueue('delete', event_id)
+    results, requests = sent_requests(server, calendar, queue)
+    assert (results, requests, queue.pending()) == ({}, 0, 0)
+    assert event_id not in server.calendars['primary']
+
+
+def test_failed_writes_stay_queued_until_the_api_answers(server, calendar, queue):
+    event_id = new_event_id()
+    queue.enqueue('insert', event_id, {'summary': "Draft", 'start': START, 'end': END})
+    server.fail(503)
+    results, _ = sent_requests(server, calendar, queue, retries=0)
+    assert results == {}
+    assert queue.pending() == 1 and queue.offline()
+
+    # A write queued meanwhile cannot fold into the insert, which may have been applied
+    queue.enqueue('patch', event_id, {'location': "Room 1"})
+    results, requests = sent_requests(server, calendar, queue, retries=0)
+    assert requests == 4 and queue.pending() == 0 and not queue.offline()
+    assert server.calendars['primary'][event_id]['location'] == "Room 1"
+
+
+def test_sending_an_insert_again_creates_no_duplicate(server, calendar, queue):
+    event_id = new_event_id()
+    server.add_events([{'id': event_id, 'summary': "Draft", 'start': START, 'end': END}])
+    seq = queue.enqueue('insert', event_id, {'summary': "Draft", 'start': START, 'end': END})
+    results, _ = sent_requests(server, calendar, queue)
+    assert results == {seq: (None, None)}
+    assert len(server.calendars['primary']) == 1
+
+
+def test_an_insert_colliding_with_another_event_is_reported(server, calendar, queue):
+    event_id = new_event_id()
+    server.add_events([{'id': event_id, 'summary': "Someone else's", 'start': START, 'end': END}])
+    seq = queue.enqueue('insert', event_id, {'summary': "Draft", 'start': START, 'end': END})
+    results, _ = sent_requests(server, calendar, queue)
+    assert results[seq][1].resp.status == 409
+    assert server.calendars['primary'][event_id]['summary'] == "Someone else's"
+
+
+def test_writes_to_the_same_id_keep_their_own_results(server, calendar, queue):
+    event_id = new_event_id()
+    first, second = queue.enqueue_many([('insert', event_id, {'summary': "A", 'start': START, 'end': END}, None,
+                                         'primary'),
+                                        ('insert', event_id, {'summary': "B", 'start': START, 'end': END}, None,
+                                         'primary')])
+    results, _ = sent_requests(server, calendar, queue)
+    assert results[first][1] is None and results[first][0]['summary'] == "A"
+    assert results[second][1].resp.status == 409
+    assert queue.pending() == 0
+
+
+def test_a_write_with_a_stale_etag_is_dropped(server, calendar, queue):
+    event_id = server.add_events([{'summary': "Draft", 'start': START, 'end': END}])[0]
+    stale = server.calendars['primary'][event_id]['etag']
+    server.add_events([dict(server.calendars['primary'][event_id], summary="Edited elsewhere")])
+    seq = queue.enqueue('patch', event_id, {'summary': "Mine"}, etag=stale)
+    results, _ = sent_requests(server, calendar, queue)
+    assert results[seq][1].resp.status == 412
+    assert queue.pending() == 0
+    assert server.calendars['primary'][event_id]['summary'] == "Edited elsewhere"
@@ -1,24 +1,191 @@
-from datetime import datetime, timedelta
+import re
+from bisect import bisect_right
+from calendar import monthrange
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
 import pytz
 
+EARLIEST = datetime.min.replace(tzinfo=pytz.UTC)
 
-def get_time_ranges(option):
-    now = datetime.utcnow()
-    if option == 'd':  # Today
-        start_time = datetime(now.year, now.month, now.day, 0, 0, 0, tzinfo=pytz.UTC)
-        end_time = start_time + timedelta(days=1) - timedelta(seconds=1)
-    elif option == 'w':  # This week
-        start_of_today = datetime(now.year, now.month, now.day, 0, 0, 0, tzinfo=pytz.UTC)
-        start_time = start_of_today - timedelta(days=start_of_today.weekday())
-        end_time = start_time + timedelta(days=7) - timedelta(seconds=1)
-    elif option == 'm':  # This month
-        start_time = datetime(now.year, now.month, 1, 0, 0, 0, tzinfo=pytz.UTC)
-        if now.month == 12:
-            start_of_next_month = datetime(now.year + 1, 1, 1, 0, 0, 0, tzinfo=pytz.UTC)
+
+PERIOD_ALIASES = {'d': 'today', 'w': 'this week', 'm': 'this month', 'y': 'this year'}
+PERIOD_OFFSETS = {'this': 0, 'next': 1, 'last': -1, 'today': 0, 'tomorrow': 1, 'yesterday': -1}
+CALENDAR_PERIOD = re.compile(r'(this|next|last) (week|month|year)')
+RELATIVE_PERIOD = re.compile(r'(next|last|past) (\d+) (day|week|month)s?')
+QUARTER = re.compile(r'q([1-4])(?: (\d{4}))?')
+
+
+def _shift_months(day, months):
+    """The same day `months` later, clamped to the length of that month."""
+    index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(index, 12)
+    return date(year, month + 1, min(day.day, monthrange(year, month + 1)[1]))
+
+
+def _shift(day, unit, count):
+    if unit == 'month':
+        return _shift_months(day, count)
+    return day + timedelta(days=count * (7 if unit == 'week' else 1))
+
+
+def _period_dates(expression, today):
+    """First day and the day after the last day of a period expression, relative to `today`."""
+    expression = " ".join(expression.lower().split())
+    expression = PERIOD_ALIASES.get(expression, expression)
+    if expression in ('today', 'tomorrow', 'yesterday'):
+        start = today + timedelta(days=PERIOD_OFFSETS[expression])
+        return start, start + timedelta(days=1)
+    match = CALENDAR_PERIOD.fullmatch(expression)
+    if match:
+        offset, unit = PERIOD_OFFSETS[match.group(1)], match.group(2)
+        if unit == 'week':
+            start = today - timedelta(days=today.weekday()) + timedelta(weeks=offset)
+        elif unit == 'month':
+            start = _shift_months(today.replace(day=1), offset)
         else:
-            start_of_next_month = datetime(now.year, now.month + 1, 1, 0, 0, 0, tzinfo=pytz.UTC)
-        end_time = start_of_next_month - timedelta(seconds=1)
+            start = date(today.year + offset, 1, 1)
+        return start, _shift(start, 'month', 12) if unit == 'year' else _shift(start, unit, 1)
+    match = RELATIVE_PERIOD.fullmatch(expression)
+    if match:
+        direction, count, unit = match.group(1), int(match.group(2)), match.group(3)
+        if direction == 'next':
+            return today, _shift(today, unit, count)
+        end = today + timedelta(days=1)
+        return _shift(end, unit, -count), end
+    match = QUARTER.fullmatch(expression)
+    if match:
+        start = date(int(match.group(2) or today.year), 3 * int(match.group(1)) - 2, 1)
+        return start, _shift_months(start, 3)
+    try:
+        if len(expression) == 4:
+            start = date(int(expression), 1, 1)
+            return start, date(start.year + 1, 1, 1)
+        if len(expression) == 7:
+            start = date.fromisoformat(expression + '-01')
+            return start, _shift_months(start, 1)
+        start = date.fromisoformat(expression)
+        return start, start + timedelta(days=1)
+    except ValueError:
+        raise ValueError(f"Unknown period '{expression}'. Use d, w, m, today, next week, last month, "
+                         f"next 3 days, past 2 weeks, Q3, Q3 2024, 2024, 2024-06 or 2024-06-10.")
+
+
+@lru_cache(maxsize=256)
+def _period_window(expression, time_zone, today):
+    zone = pytz.timezone(time_zone)
+    start, end = _period_dates(expression, today)
+    return zone.localize(datetime.combine(start, time())), zone.localize(datetime.combine(end, time()))
+
+
+def period_window(expression, time_zone='UTC'):
+    """
+    Start and (exclusive) end of a period expression, from midnight to midnight in `time_zone`.
+
+    Expressions are 'd', 'w', 'm' and 'y' for the current day, week, month and year,
+    'today', 'tomorrow', 'yesterday', 'this|next|last week|month|year',
+    'next|last|past N days|weeks|months', 'Q1'-'Q4' with an optional year, and
+    ISO years, months and dates such as '2024', '2024-06' and '2024-06-10'. Days of
+    other lengths across daylight saving changes are taken into account. Windows are
+    cached per expression, time zone and current day, so repeated calls cost nothing.
+    """
+    return _period_window(expression, time_zone, datetime.now(pytz.timezone(time_zone)).date())
+
+
+def get_time_ranges(option, time_zone=None):
+    """
+    timeMin and timeMax, as RFC 3339 strings, of a period expression (see period_window)
+    in `time_zone`, UTC by default, or of an explicit (start, end) pair of aware datetimes.
+    """
+    if isinstance(option, str):
+        start, end = period_window(option, time_zone or 'UTC')
     else:
-        raise ValueError("Invalid option. Please choose 'd' for today, 'w' for this week, or 'm' for this month.")
+        start, end = option
+    return [start.isoformat(), end.isoformat()]
+
+
+def as_utc(value):
+    """Make a date, naive datetime or aware datetime comparable; naive values are taken as UTC."""
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=pytz.UTC)
+    return value
+
+
+def event_sort_key(event):
+    """Start time usable for ordering; all-day and naive starts are taken as UTC."""
+    if event.start_time is None:
+        return EARLIEST
+    return as_utc(event.start_time)
+
+
+def change_attendees(attendees, add=(), remove=()):
+    """
+    Apply a membership change to a list of attendee resources.
+
+    Emails are compared case-insensitively through sets, so the cost is linear in the
+    number of attendees however many are added or removed. Attendees that stay keep
+    their response status and other fields; new ones are appended in the given order.
+
+    Returns:
+        list: The new attendee resources, or None when the change leaves them as they are.
+    """
+    removed = {email.lower() for email in remove}
+    kept = [attendee for attendee in attendees if attendee.get('email', '').lower() not in removed]
+    present = {attendee.get('email', '').lower() for attendee in kept}
+    added = []
+    for email in add:
+        if email.lower() not in present:
+            present.add(email.lower())
+            added.append({'email': email})
+    if not added and len(kept) == len(attendees):
+        return None
+    return kept + added
+
+
+class IntervalSet:
+    """
+    Sorted, non-overlapping set of (start, end) intervals.
+
+    Building it sorts and merges the input in O(n log n); an overlap test is a
+    binary search in O(log n), and free gaps are found in a single pass over
+    the merged intervals.
+    """
+
+    def __init__(self, intervals):
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, start, end):
+        """Return True if [start, end) intersects any interval of the set."""
+        index = bisect_right(self.starts, start) - 1
+        if index >= 0 and self.ends[index] > start:
+            return True
+        return index + 1 < len(self.starts) and self.starts[index + 1] < end
 
-    return [start_time.isoformat(), end_time.isoformat()]
+    def free_slots(self, window_start, window_end, duration, limit=None):
+        """Yield back-to-back (start, end) slots of `duration` that fit in the gaps of the window."""
+        found = 0
+        cursor = window_start
+        index = max(bisect_right(self.starts, window_start) - 1, 0)
+        while cursor + duration <= window_end:
+            if index < len(self.starts) and self.starts[index] < cursor + duration:
+                if self.ends[index] > cursor:
+                    cursor = self.ends[index]
+                index += 1
+                continue
+            yield cursor, cursor + duration
+            found += 1
+            if limit is not None and found >= limit:
+                return
+            cursor += duration
@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import queue
+import secrets
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import WATCH_CHANNEL_TTL, WATCH_RENEW_MARGIN, WATCH_HOST, WATCH_PORT
+
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.watcher.notify(self.headers.get('X-Goog-Channel-ID'), self.headers.get('X-Goog-Channel-Token'),
+                                   self.headers.get('X-Goog-Resource-State'))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_stdout(line):
+    sys.stdout.write(line + '\n')
+    sys.stdout.flush()
+
+
+class JsonlSocket:
+    """Unix socket that relays every line written to it to all connected clients."""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)  # only the owner may connect
+        try:
+            self.server.bind(path)
+        finally:
+            os.umask(umask)
+        self.server.listen()
+        self.clients = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.clients.append(connection)
+
+    def __call__(self, line):
+        data = line.encode() + b'\n'
+        with self.lock:
+            for connection in list(self.clients):
+                try:
+                    connection.sendall(data)
+                except OSError:
+                    connection.close()
+                    self.clients.remove(connection)
+
+    def close(self):
+        self.server.close()
+        with self.lock:
+            for connection in self.clients:
+                connection.close()
+            self.clients = []
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class Watcher:
+    """
+    Streams the changes of calendars as JSON Lines, driven by push notifications instead of polling.
+
+    A channel is opened with events().watch for every calendar, pointing at a small
+    webhook receiver listening on `host`:`port`. The API only delivers to HTTPS
+    addresses on a verified domain, so with Google `address` is the public URL of a
+    proxy or tunnel forwarding to the receiver; it defaults to the receiver itself,
+    which is enough for a local stand-in such as fake_server.py.
+
+    A notification only says that a calendar changed. The changes are fetched
+    incrementally through the event cache, one fetch per calendar for a burst of
+    notifications, and every changed event is passed to `output` as a line:
+
+        {"calendarId": "primary", "change": "updated", "event": {...}}
+
+    with "deleted" for cancelled events. When the sync token has expired the whole
+    calendar is fetched again, announced by a {"calendarId": ..., "change": "resync"}
+    line; a sync that fails is logged as an error. Channels are replaced by new ones
+    `renew_margin` seconds before they expire. A channel that cannot be opened or
+    replaced is tried again after the calendar's request scheduler's backoff delay.
+    """
+
+    def __init__(self, calendar, store, calendar_ids, address=None, host=WATCH_HOST, port=WATCH_PORT,
+                 ttl=WATCH_CHANNEL_TTL, renew_margin=WATCH_RENEW_MARGIN, output=write_stdout):
+        self.calendar = calendar
+        self.store = store
+        self.calendar_ids = list(calendar_ids)
+        self.ttl = ttl
+        self.renew_margin = renew_margin
+        self.output = output
+        self.receiver = ThreadingHTTPServer((host, port), _NotificationHandler)
+        self.receiver.daemon_threads = True
+        self.receiver.watcher = self
+        self.address = address or f"http://{host}:{self.receiver.server_address[1]}/"
+        # Sent back with every notification, so posts from anyone else are ignored
+        self.token = secrets.token_urlsafe(16)
+        self.channels = {}
+        # calendar id -> (failed attempts, when to try again) of the channels that could not be opened
+        self.failures = {}
+        self.pending = queue.Queue()
+
+    def notify(self, channel_id, token, state):
+        """Handle a notification posted to the receiver; called from its request threads."""
+        entry = self.channels.get(channel_id)
+        if entry is None or token != self.token:
+            logging.debug(f"Ignoring a notification for unknown channel {channel_id}")
+            return
+        # 'sync' only confirms that a new channel is open
+        if state != 'sync':
+            self.pending.put(entry[0])
+
+    def stop(self):
+        """Make run() return; safe to call from another thread."""
+        self.pending.put(None)
+
+    def open_channel(self, calendar_id):
+        channel = self.calendar.watch_events(self.address, calendar_id, self.ttl, self.token)
+        if channel:
+            self.channels[channel['id']] = (calendar_id, channel)
+            self.failures.pop(calendar_id, None)
+        else:
+            attempt = self.failures[calendar_id][0] + 1 if calendar_id in self.failures else 0
+            self.failures[calendar_id] = (attempt, time.time() + self.calendar.scheduler.backoff_delay(attempt))
+        return channel
+
+    def _due(self):
+        """When each calendar next needs a channel opened: at once, a backoff after a failure, or before expiry."""
+        due = {calendar_id: 0 for calendar_id in self.calendar_ids}
+        for calendar_id, channel in self.channels.values():
+            due[calendar_id] = _expires_at(channel) - self.renew_margin
+        for calendar_id, (_, retry_at) in self.failures.items():
+            due[calendar_id] = max(due[calendar_id], retry_at)
+        return due
+
+    def renew_channels(self):
+        """
+        Open the channels that are due: those that failed to start, and replacements for those
+        that expire within the renewal margin. An old channel is stopped once its replacement is open.
+        """
+        now = time.time()
+        replaced = {calendar_id: (channel_id, channel) for channel_id, (calendar_id, channel) in self.channels.items()}
+        for calendar_id, due in self._due().items():
+            if due > now or not self.open_channel(calendar_id):
+                continue
+            if calendar_id in replaced:
+                channel_id, channel = replaced[calendar_id]
+                del self.channels[channel_id]
+                self.calendar.stop_channel(channel)
+
+    def _until_renewal(self):
+        return min(list(self._due().values()) + [time.time() + self.ttl]) - time.time()
+
+    def emit(self, calendar_id, full_sync_baseline=False):
+        """Fetch the changes of a calendar and write them out; a full sync is only a baseline when asked."""
+        items, full_sync = self.store.pull_changes(calendar_id)
+        if items is None:
+            logging.error(f"Could not sync calendar {calendar_id}")
+            return
+        if full_sync:
+            if full_sync_baseline:
+                return
+            self.output(json.dumps({'calendarId': calendar_id, 'change': 'resync'}))
+        for item in items:
+            change = 'deleted' if item.get('status') == 'cancelled' else 'updated'
+            self.output(json.dumps({'calendarId': calendar_id, 'change': change, 'event': item}))
+
+    def run(self):
+        """Watch until stop() is called or the process is interrupted, then close the channels."""
+        threading.Thread(target=self.receiver.serve_forever, daemon=True).start()
+        try:
+            for calendar_id in self.calendar_ids:
+                if not self.open_channel(calendar_id):
+                    logging.error(f"Could not watch calendar {calendar_id}, trying again later")
+            logging.info(f"Watching {len(self.channels)} calendars, receiving notifications on {self.address}")
+            # Catch up on what changed since the event cache last synced; a first sync is only the baseline
+            for calendar_id in self.calendar_ids:
+                self.emit(calendar_id, full_sync_baseline=True)
+            while True:
+                try:
+                    calendar_id = self.pending.get(timeout=max(self._until_renewal(), 0))
+                except queue.Empty:
+                    self.renew_channels()
+                    continue
+                calendar_ids = {calendar_id}
+                while not self.pending.empty():
+                    calendar_ids.add(self.pending.get_nowait())
+                if None in calendar_ids:
+                    return
+                for calendar_id in calendar_ids:
+                    self.emit(calendar_id)
+                self.renew_channels()
+        finally:
+            self.close()
+
+    def close(self):
+        for _, channel in self.channels.values():
+            self.calendar.stop_channel(channel)
+        self.channels = {}
+        self.receiver.shutdown()
+        self.receiver.server_close()
+
+
+def _expires_at(channel):
+    """Expiry of a channel in epoch seconds; the API gives milliseconds, and nothing for channels that last."""
+    expiration = channel.get('expiration')
+    return int(expiration) / 1000 if expiration else float('inf')
@@ -0,0 +1,197 @@
+import json
+import logging
+import sqlite3
+import time
+import uuid
+
+from config import WRITE_QUEUE_FILE, WRITE_QUEUE_RETRY_AFTER, BATCH_RETRIES
+from scheduler import is_retryable
+
+
+def new_event_id():
+    """A client-chosen event id; the API accepts lowercase hex as part of its base32hex alphabet."""
+    return uuid.uuid4().hex
+
+
+def _merge(body, patch):
+    merged = dict(body)
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _coalesce(first, second):
+    """
+    Combine two successive writes of the same event into one, or return None if they cannot be.
+
+    Writes are (operation, body, etag, attempts) tuples. An update or patch folds into an
+    earlier insert, update or patch that was not sent yet, keeping the first write's ETag
+    guard; a write that was sent may have been applied already, with only the response
+    lost. A delete replaces whatever came before it, and an insert that was never sent is
+    dropped together with its delete, which is marked by the 'skip' operation.
+    """
+    operation, body, etag, attempts = first
+    next_operation, next_body, _, _ = second
+    if operation in ('delete', 'skip') or next_operation == 'insert' or (attempts and next_operation != 'delete'):
+        return None
+    if next_operation == 'delete':
+        if operation == 'insert' and not attempts:
+            return 'skip', None, None, 0
+        return 'delete', None, None, attempts
+    if next_operation == 'update':
+        # An update replaces the event; an insert stays an insert, of the new body
+        return operation if operation == 'insert' else 'update', next_body, etag, attempts
+    return operation, _merge(body, next_body), etag, attempts
+
+
+class WriteQueue:
+    """
+    On-disk write-ahead queue of event changes.
+
+    Mutating commands append their writes here in a single SQLite transaction, and
+    flush() sends them; a write only leaves the queue once the API confirmed it, so a
+    network error never loses one. Successive writes of the same event are coalesced
+    into one request, and events are created with client-chosen ids, so sending an
+    insert again after a lost response cannot create a duplicate. While the API is
+    unreachable, writes are only queued and cost a local disk write.
+    """
+
+    def __init__(self, path=WRITE_QUEUE_FILE, retry_after=WRITE_QUEUE_RETRY_AFTER):
+        self.retry_after = retry_after
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS writes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                calendar_id TEXT NOT NULL,
+                event_id TEXT NOT NULL,
+                operation TEXT NOT NULL,
+                body TEXT,
+                etag TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                queued_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS queue_state (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+        """)
+
+    def enqueue(self, operation, event_id, body=None, etag=None, calendar_id='primary'):
+        """Append a write; returns its row id, under which flush() reports it."""
+        return self.enqueue_many([(operation, event_id, body, etag, calendar_id)])[0]
+
+    def enqueue_many(self, writes):
+        """Append (operation, event_id, body, etag, calendar_id) writes in one transaction; returns their row ids."""
+        now = time.time()
+        with self.connection:
+            return [self.connection.execute(
+                "INSERT INTO writes (calendar_id, event_id, operation, body, etag, queued_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (calendar_id, event_id, operation, json.dumps(body) if body is not None else None, etag, now)
+            ).lastrowid for operation, event_id, body, etag, calendar_id in writes]
+
+    def pending(self):
+        return self.connection.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+
+    def offline(self):
+        """Whether an attempt to reach the API failed within the last `retry_after` seconds."""
+        row = self.connection.execute("SELECT value FROM queue_state WHERE name = 'offline_until'").fetchone()
+        return bool(row) and row[0] > time.time()
+
+    def _set_offline_until(self, value):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO queue_state VALUES ('offline_until', ?)", (value,))
+
+    def _next_round(self):
+        """
+        Coalesce the queued writes into at most one write per event.
+
+        Returns (calendar_id, event_id, write, seqs) tuples in queue order; writes that cannot
+        be combined with the ones before them wait for the next round.
+        """
+        groups = {}
+        blocked = set()
+        rows = self.connection.execute("SELECT seq, calendar_id, event_id, operation, body, etag, attempts "
+                                       "FROM writes ORDER BY seq")
+        for seq, calendar_id, event_id, operation, body, etag, attempts in rows:
+            key = (calendar_id, event_id)
+            if key in blocked:
+                continue
+            write = (operation, json.loads(body) if body else None, etag, attempts)
+            if key not in groups:
+                groups[key] = [write, [seq]]
+                continue
+            combined = _coalesce(groups[key][0], write)
+            if combined is None:
+                blocked.add(key)
+                continue
+            groups[key][0] = combined
+            groups[key][1].append(seq)
+        return [(calendar_id, event_id, write, seqs) for (calendar_id, event_id), (write, seqs) in groups.items()]
+
+    def _remove(self, seqs):
+        self.connection.executemany("DELETE FROM writes WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def flush(self, calendar, retries=BATCH_RETRIES, max_retries=None):
+        """
+        Send the queued writes through `calendar` in batches until the queue is empty or the API fails.
+
+        Writes failing with a rate-limit, server or connection error stay queued for the
+        next flush; writes the API rejects are dropped and reported. When the API cannot
+        be reached or fails every write, the queue goes offline for `retry_after` seconds
+        (see offline()).
+
+        Returns:
+            dict: row id -> (response, error) of every write that left the queue. Writes combined
+            into one request share its result.
+        """
+        results = {}
+        while True:
+            groups = self._next_round()
+            if not groups:
+                break
+            with self.connection:
+                self._remove(seq for _, _, (operation, _, _, _), seqs in groups if operation == 'skip'
+                             for seq in seqs)
+            groups = [group for group in groups if group[2][0] != 'skip']
+            writes = [(seqs[0], operation, calendar_id, event_id, body, etag)
+                      for calendar_id, event_id, (operation, body, etag, _), seqs in groups]
+            try:
+                sent = calendar.apply_writes(writes, retries, max_retries) if writes else {}
+            except Exception as e:
+                if not is_retryable(e):
+                    logging.error(f"An unexpected error occurred: {e}")
+                    return results
+                logging.info(f"Could not reach the Calendar API, the writes stay queued: {e}")
+                self._record_attempt([seq for _, _, _, seqs in groups for seq in seqs], e)
+                self._set_offline_until(time.time() + self.retry_after)
+                return results
+            self._set_offline_until(0)
+            failed = []
+            with self.connection:
+                for calendar_id, event_id, write, seqs in groups:
+                    response, error = sent.get(seqs[0], (None, None))
+                    if error is not None and is_retryable(error):
+                        failed.append((seqs, error))
+                        continue
+                    if error is not None:
+                        logging.error(f"{event_id}: the {write[0]} was rejected and dropped: {error}")
+                    self._remove(seqs)
+                    results.update((seq, (response, error)) for seq in seqs)
+            if failed:
+                for seqs, error in failed:
+                    self._record_attempt(seqs, error)
+                if len(failed) == len(groups):
+                    self._set_offline_until(time.time() + self.retry_after)
+                return results
+        return results
+
+    def _record_attempt(self, seqs, error):
+        with self.connection:
+            self.connection.executemany("UPDATE writes SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                                        [(str(error) if error else None, seq) for seq in seqs])